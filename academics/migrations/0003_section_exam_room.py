@@ -0,0 +1,25 @@
+# Generated by Django 5.1.6 on 2026-10-19 14:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('academics', '0002_initial'),
+        ('navigation', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='classsection',
+            name='room',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='class_sections', to='navigation.room'),
+        ),
+        migrations.AddField(
+            model_name='exam',
+            name='room',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='exams', to='navigation.room'),
+        ),
+    ]
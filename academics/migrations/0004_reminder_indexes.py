@@ -0,0 +1,23 @@
+# Generated by Django 5.1.6 on 2026-10-19 15:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('academics', '0003_section_exam_room'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='assignment',
+            name='due_date',
+            field=models.DateTimeField(db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='exam',
+            name='date',
+            field=models.DateTimeField(db_index=True),
+        ),
+    ]
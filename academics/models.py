@@ -75,15 +75,52 @@ class Course(models.Model):
         return f"{self.code}: {self.name}"
 
 
-class ClassSection(models.Model):
+class RoomLocation:
+    """Links a free-text ``location`` to a navigation Room, and notes whether room availability changed"""
+    availability_fields = ('room_id',)  # What navigation.availability builds its tables from
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_location()
+        return instance
+
+    def _remember_location(self):
+        self._loaded_location = self.__dict__.get('location')
+        self._loaded_room_id = self.__dict__.get('room_id')
+        self._loaded_availability = tuple(self.__dict__.get(name) for name in self.availability_fields)
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        location = self.__dict__.get('location')
+        # Resolve only a location that changed, unless a room was picked along with it
+        if (location is not None and location != getattr(self, '_loaded_location', None)
+                and self.room_id == getattr(self, '_loaded_room_id', None)
+                and (update_fields is None or 'location' in update_fields)):
+            from navigation.availability import resolve_room
+            self.room_id = resolve_room(location) if location else None
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'room'}
+        self.availability_changed = self._state.adding or (
+            tuple(self.__dict__.get(name) for name in self.availability_fields)
+            != getattr(self, '_loaded_availability', None))
+        super().save(*args, **kwargs)
+        self._remember_location()
+
+
+class ClassSection(RoomLocation, models.Model):
     course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='sections')
     section_number = models.CharField(max_length=10)
     semester = models.CharField(max_length=20)  # Fall 2023, Spring 2024, etc.
     instructor = models.ForeignKey(Faculty, on_delete=models.CASCADE, related_name='classes')
     location = models.CharField(max_length=100)
+    room = models.ForeignKey('navigation.Room', on_delete=models.SET_NULL, null=True, blank=True,
+                             related_name='class_sections')  # Resolved from location when that changes
     capacity = models.PositiveIntegerField()
     enrolled = models.PositiveIntegerField(default=0)
 
+    availability_fields = ('room_id', 'semester')
+
     def __str__(self):
         return f"{self.course.code} {self.section_number} ({self.semester})"
 
@@ -163,16 +200,22 @@ class Assignment(models.Model):
     class_section = models.ForeignKey(ClassSection, on_delete=models.CASCADE, related_name='assignments')
     title = models.CharField(max_length=200)
     description = models.TextField()
-    due_date = models.DateTimeField()
+    due_date = models.DateTimeField(db_index=True)
     points_possible = models.PositiveIntegerField()
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)  # Reminders pick up changes by this
 
 
-class Exam(models.Model):
+class Exam(RoomLocation, models.Model):
     class_section = models.ForeignKey(ClassSection, on_delete=models.CASCADE, related_name='exams')
     title = models.CharField(max_length=200)
-    date = models.DateTimeField()
+    date = models.DateTimeField(db_index=True)
     location = models.CharField(max_length=100)
+    room = models.ForeignKey('navigation.Room', on_delete=models.SET_NULL, null=True, blank=True,
+                             related_name='exams')  # Resolved from location when that changes
     duration_minutes = models.PositiveIntegerField()
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)  # Reminders pick up changes by this
+
+    availability_fields = ('room_id', 'date', 'duration_minutes')
 
 
 class StudentSchedule(models.Model):
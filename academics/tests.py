@@ -1,3 +1,76 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.gis.geos import Point
+from django.core.cache import cache
 from django.test import TestCase
+from django.utils import timezone
+
+from accounts.models import User
+from navigation import availability
+from navigation.models import Building, Room
+
+from .models import ClassSection, Course, Department, Exam, Faculty
+
+
+class RoomLocationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        department = Department.objects.create(name='Engineering', code='ENG')
+        cls.course = Course.objects.create(code='ENG101', name='Statics', department=department,
+                                           description='', credit_hours=3)
+        cls.faculty = Faculty.objects.create(user=User.objects.create(username='prof'), department=department,
+                                             title='Professor', office_location='ENG 2')
+        building = Building.objects.create(name='Engineering Hall', code='ENG', location=Point(90.4, 23.7), floors=3)
+        cls.room_101 = Room.objects.create(building=building, number='101', floor=1, room_type='Classroom')
+        cls.room_102 = Room.objects.create(building=building, number='102', floor=1, room_type='Classroom')
+
+    def setUp(self):
+        cache.clear()
+        availability._resolver['resolver'] = None
+
+    def section(self, location='ENG 101'):
+        return ClassSection.objects.create(course=self.course, section_number='1', semester='Fall 2026',
+                                           instructor=self.faculty, location=location, capacity=30)
+
+    def test_rooms_follow_location_changes(self):
+        section = self.section()
+        self.assertEqual(section.room_id, self.room_101.id)
+
+        section.location = 'Engineering Hall Room 102'
+        section.save()
+        self.assertEqual(ClassSection.objects.get(pk=section.pk).room_id, self.room_102.id)
+
+        section = ClassSection.objects.get(pk=section.pk)
+        section.location = 'Lecture theatre'
+        section.room = self.room_101  # Picked by hand
+        section.save()
+        self.assertEqual(section.room_id, self.room_101.id)
+
+    def test_unchanged_locations_are_not_resolved_again(self):
+        section = self.section('Somewhere else')
+        self.assertIsNone(section.room_id)
+        with mock.patch.object(availability.RoomResolver, 'resolve') as resolve:
+            section = ClassSection.objects.get(pk=section.pk)
+            section.capacity = 40
+            section.save()
+        resolve.assert_not_called()
+
+    def test_resolver_is_reused_until_rooms_change(self):
+        self.section()
+        with self.assertNumQueries(1):  # The INSERT
+            self.section('ENG 102')
+        Room.objects.create(building=self.room_101.building, number='103', floor=1, room_type='Lab')
+        self.assertIsNotNone(self.section('ENG 103').room_id)
 
-# Create your tests here.
+    def test_only_schedule_changes_invalidate_availability(self):
+        exam = Exam.objects.create(class_section=self.section(), title='Midterm', date=timezone.now(),
+                                   location='ENG 101', duration_minutes=60)
+        exam = Exam.objects.get(pk=exam.pk)
+        with mock.patch.object(availability, 'invalidate_tables') as invalidate:
+            exam.title = 'Midterm exam'
+            exam.save()
+            invalidate.assert_not_called()
+            exam.date += timedelta(days=1)
+            exam.save()
+            invalidate.assert_called_once()
@@ -1,5 +1,12 @@
-from django.contrib import admin
-from .models import Cafeteria, MenuItem, DailyMenu, Order, OrderItem, OrderStatusUpdate
+from django import forms
+from django.contrib import admin, messages
+from django.db import transaction
+from django.http import HttpResponseRedirect
+from .models import (
+    Cafeteria, MenuItem, DailyMenu, Order, OrderItem, OrderStatusUpdate,
+    HourlySalesRollup, DailySalesRollup, StaleOrderError,
+)
+from .transitions import bulk_transition
 
 @admin.register(Cafeteria)
 class CafeteriaAdmin(admin.ModelAdmin):
@@ -46,19 +53,90 @@ class OrderStatusUpdateInline(admin.TabularInline):
     can_delete = False
 
 
+class OrderAdminForm(forms.ModelForm):
+    """Carries the version the editor loaded, so saving over someone else's change is refused"""
+    loaded_version = forms.IntegerField(widget=forms.HiddenInput, required=False)
+
+    class Meta:
+        model = Order
+        fields = '__all__'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk:
+            self.fields['loaded_version'].initial = self.instance.version
+
+    def clean(self):
+        cleaned_data = super().clean()
+        loaded = cleaned_data.get('loaded_version')
+        if self.instance.pk and loaded is not None:
+            if loaded != self.instance.version:
+                raise forms.ValidationError(
+                    "This order was changed by someone else since you opened it. Reload the page and try again."
+                )
+        return cleaned_data
+
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
+    form = OrderAdminForm
     list_display = ('id', 'user', 'cafeteria', 'status', 'total_price', 'created_at', 'pickup_time')
     list_filter = ('status', 'cafeteria', 'delivery_option')
     search_fields = ('user__username', 'user__email', 'cafeteria__name')
-    readonly_fields = ('created_at', 'updated_at')
+    readonly_fields = ('created_at', 'updated_at', 'version')
     raw_id_fields = ('user', 'cafeteria', 'completed_by')
     date_hierarchy = 'created_at'
     inlines = [OrderItemInline, OrderStatusUpdateInline]
+    actions = ['mark_preparing', 'mark_ready', 'mark_completed', 'mark_cancelled']
+
+    def _bulk_status(self, request, queryset, new_status):
+        ids = queryset.values_list('id', flat=True)
+        results = bulk_transition([(order_id, new_status) for order_id in ids], user=request.user,
+                                  notes="Updated from admin")
+        updated = sum(1 for result in results.values() if result['ok'])
+        self.message_user(request, f"{updated} order(s) marked as {new_status}.", messages.SUCCESS)
+        skipped = len(results) - updated
+        if skipped:
+            self.message_user(request, f"{skipped} order(s) could not be changed to {new_status}.", messages.WARNING)
+
+    def save_model(self, request, obj, form, change):
+        try:
+            super().save_model(request, obj, form, change)
+        except StaleOrderError:
+            # Changed between validation and saving; undo the inlines and the log entry too
+            transaction.set_rollback(True)
+            obj._stale = True
+
+    def save_related(self, request, form, formsets, change):
+        if not getattr(form.instance, '_stale', False):
+            super().save_related(request, form, formsets, change)
+
+    def response_change(self, request, obj):
+        if getattr(obj, '_stale', False):
+            self.message_user(request, "This order was changed by someone else while you were saving it. "
+                                       "Review the current values and try again.", messages.ERROR)
+            return HttpResponseRedirect(request.path)
+        return super().response_change(request, obj)
+
+    @admin.action(description="Mark selected orders as preparing")
+    def mark_preparing(self, request, queryset):
+        self._bulk_status(request, queryset, 'preparing')
+
+    @admin.action(description="Mark selected orders as ready for pickup")
+    def mark_ready(self, request, queryset):
+        self._bulk_status(request, queryset, 'ready')
+
+    @admin.action(description="Mark selected orders as completed")
+    def mark_completed(self, request, queryset):
+        self._bulk_status(request, queryset, 'completed')
+
+    @admin.action(description="Cancel selected orders")
+    def mark_cancelled(self, request, queryset):
+        self._bulk_status(request, queryset, 'cancelled')
 
     fieldsets = (
         ('Basic Information', {
-            'fields': ('user', 'cafeteria', 'status', 'pickup_time', 'delivery_option')
+            'fields': ('user', 'cafeteria', 'status', 'pickup_time', 'delivery_option', 'loaded_version')
         }),
         ('Order Details', {
             'fields': ('total_price', 'notes')
@@ -67,7 +145,7 @@ class OrderAdmin(admin.ModelAdmin):
             'fields': ('completed_by', 'completed_at')
         }),
         ('Timestamps', {
-            'fields': ('created_at', 'updated_at'),
+            'fields': ('created_at', 'updated_at', 'version'),
             'classes': ('collapse',)
         }),
     )
@@ -87,4 +165,21 @@ class OrderStatusUpdateAdmin(admin.ModelAdmin):
     list_filter = ('status',)
     search_fields = ('order__id', 'notes')
     raw_id_fields = ('order', 'updated_by')
-    readonly_fields = ('timestamp',)
\ No newline at end of file
+    readonly_fields = ('timestamp',)
+
+
+class SalesRollupAdmin(admin.ModelAdmin):
+    list_display = ('cafeteria', 'menu_item', 'bucket_start', 'order_count', 'item_count', 'revenue')
+    list_filter = ('cafeteria',)
+    raw_id_fields = ('cafeteria', 'menu_item')
+    date_hierarchy = 'bucket_start'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+admin.site.register(HourlySalesRollup, SalesRollupAdmin)
+admin.site.register(DailySalesRollup, SalesRollupAdmin)
@@ -0,0 +1,213 @@
+# cafeteria/analytics.py
+"""
+Sales rollups for the cafeteria dashboards.
+
+Completed orders are folded into hourly and daily rollup rows as they
+complete, so dashboard queries read a handful of pre-aggregated rows per
+bucket instead of scanning Order/OrderItem. All range filters work on raw
+timestamps so the (cafeteria, bucket_start) indexes are usable.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import Order, OrderStatusUpdate, HourlySalesRollup, DailySalesRollup
+
+
+def start_of_day(day):
+    """Aware datetime for local midnight at the start of ``day``"""
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def hour_bucket(dt):
+    return timezone.localtime(dt).replace(minute=0, second=0, microsecond=0)
+
+
+def day_bucket(dt):
+    return timezone.localtime(dt).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def prep_seconds(order, history):
+    """
+    Kitchen time for an order from its status history.
+
+    Starts at the first 'preparing' update (or order placement) and ends at
+    the first 'ready' update (or completion). ``history`` is a list of
+    (status, timestamp) pairs in any order.
+    """
+    first = {}
+    for status, timestamp in history:
+        if status not in first or timestamp < first[status]:
+            first[status] = timestamp
+
+    started = first.get('preparing', order.created_at)
+    finished = first.get('ready') or first.get('completed') or order.completed_at
+    if not started or not finished or finished < started:
+        return None
+    return (finished - started).total_seconds()
+
+
+def _order_history(order_ids):
+    history = defaultdict(list)
+    rows = OrderStatusUpdate.objects.filter(order_id__in=order_ids).values_list('order_id', 'status', 'timestamp')
+    for order_id, status, timestamp in rows:
+        history[order_id].append((status, timestamp))
+    return history
+
+
+def _collect_deltas(orders):
+    """Aggregate per-bucket increments for a batch of orders in memory"""
+    deltas = defaultdict(lambda: {'order_count': 0, 'item_count': 0, 'revenue': Decimal('0'),
+                                  'prep_seconds_total': 0.0, 'prep_samples': 0})
+    history = _order_history([order.id for order in orders])
+
+    for order in orders:
+        prep = prep_seconds(order, history.get(order.id, []))
+        buckets = ((HourlySalesRollup, hour_bucket(order.created_at)),
+                   (DailySalesRollup, day_bucket(order.created_at)))
+
+        items = list(order.items.all())
+        # An order listing the same menu item on several lines still counts once for that item
+        by_menu_item = defaultdict(lambda: [0, Decimal('0')])
+        for item in items:
+            by_menu_item[item.menu_item_id][0] += item.quantity
+            by_menu_item[item.menu_item_id][1] += item.price
+        for model, bucket in buckets:
+            total = deltas[(model, order.cafeteria_id, None, bucket)]
+            total['order_count'] += 1
+            total['item_count'] += sum(item.quantity for item in items)
+            total['revenue'] += order.total_price
+            if prep is not None:
+                total['prep_seconds_total'] += prep
+                total['prep_samples'] += 1
+
+            for menu_item_id, (quantity, revenue) in by_menu_item.items():
+                row = deltas[(model, order.cafeteria_id, menu_item_id, bucket)]
+                row['order_count'] += 1
+                row['item_count'] += quantity
+                row['revenue'] += revenue
+                if prep is not None:
+                    row['prep_seconds_total'] += prep
+                    row['prep_samples'] += 1
+    return deltas
+
+
+def _apply_deltas(deltas):
+    """Add the increments to their rollup rows, creating missing rows first"""
+    with transaction.atomic():
+        # Every row is made to exist with zeros (concurrent writers simply collide on the unique
+        # constraints), so the increments below are always plain UPDATEs under the row lock
+        missing = defaultdict(list)
+        for model, cafeteria_id, menu_item_id, bucket in deltas:
+            missing[model].append(model(cafeteria_id=cafeteria_id, menu_item_id=menu_item_id, bucket_start=bucket))
+        for model, rows in missing.items():
+            model.objects.bulk_create(rows, ignore_conflicts=True)
+
+        for (model, cafeteria_id, menu_item_id, bucket), values in deltas.items():
+            model.objects.filter(cafeteria_id=cafeteria_id, menu_item_id=menu_item_id, bucket_start=bucket).update(
+                **{field: F(field) + value for field, value in values.items()}
+            )
+
+
+def record_completed_orders(orders):
+    """Fold newly completed orders into the hourly and daily rollups"""
+    orders = [order for order in orders if order.pk]
+    if orders:
+        _apply_deltas(_collect_deltas(orders))
+
+
+def rebuild_rollups(since=None, chunk_size=500):
+    """Recompute rollups from scratch (or from ``since``) for completed orders"""
+    orders = Order.objects.filter(status='completed').prefetch_related('items').order_by('id')
+    hourly, daily = HourlySalesRollup.objects.all(), DailySalesRollup.objects.all()
+    if since:
+        since = day_bucket(since)
+        orders = orders.filter(created_at__gte=since)
+        hourly, daily = hourly.filter(bucket_start__gte=since), daily.filter(bucket_start__gte=since)
+
+    count = 0
+    # Dashboards keep reading the old rows until the new ones are complete
+    with transaction.atomic():
+        hourly.delete()
+        daily.delete()
+        batch = []
+        for order in orders.iterator(chunk_size=chunk_size):
+            batch.append(order)
+            if len(batch) >= chunk_size:
+                record_completed_orders(batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            record_completed_orders(batch)
+            count += len(batch)
+    return count
+
+
+def _rollup_model(granularity):
+    return HourlySalesRollup if granularity == 'hour' else DailySalesRollup
+
+
+def sales_summary(cafeteria, start, end, granularity='day'):
+    """Cafeteria-wide totals per bucket in [start, end)"""
+    rows = _rollup_model(granularity).objects.filter(
+        cafeteria=cafeteria,
+        menu_item__isnull=True,
+        bucket_start__gte=start,
+        bucket_start__lt=end,
+    ).order_by('bucket_start')
+    return [{
+        'bucket': row.bucket_start.isoformat(),
+        'orders': row.order_count,
+        'items': row.item_count,
+        'revenue': str(row.revenue),
+        'avg_prep_seconds': row.avg_prep_seconds,
+    } for row in rows]
+
+
+def top_items(cafeteria, start, end, limit=10):
+    """Best selling menu items in [start, end), read from the daily rollups"""
+    rows = DailySalesRollup.objects.filter(
+        cafeteria=cafeteria,
+        menu_item__isnull=False,
+        bucket_start__gte=day_bucket(start),
+        bucket_start__lt=end,
+    ).values('menu_item_id', 'menu_item__name').annotate(
+        items=Sum('item_count'),
+        revenue=Sum('revenue'),
+        prep_total=Sum('prep_seconds_total'),
+        prep_samples=Sum('prep_samples'),
+    ).order_by('-items')[:limit]
+    return [{
+        'menu_item_id': row['menu_item_id'],
+        'name': row['menu_item__name'],
+        'items': row['items'],
+        'revenue': str(row['revenue']),
+        'avg_prep_seconds': row['prep_total'] / row['prep_samples'] if row['prep_samples'] else None,
+    } for row in rows]
+
+
+def hourly_profile(cafeteria, start, end):
+    """Revenue and item counts per hour of day across [start, end)"""
+    profile = {hour: {'orders': 0, 'items': 0, 'revenue': Decimal('0')} for hour in range(24)}
+    rows = HourlySalesRollup.objects.filter(
+        cafeteria=cafeteria,
+        menu_item__isnull=True,
+        bucket_start__gte=start,
+        bucket_start__lt=end,
+    ).values_list('bucket_start', 'order_count', 'item_count', 'revenue')
+    for bucket, orders, items, revenue in rows:
+        entry = profile[timezone.localtime(bucket).hour]
+        entry['orders'] += orders
+        entry['items'] += items
+        entry['revenue'] += revenue
+    return [{'hour': hour, 'orders': v['orders'], 'items': v['items'], 'revenue': str(v['revenue'])}
+            for hour, v in profile.items()]
+
+
+def default_range(days=30):
+    end = start_of_day(timezone.localdate()) + timedelta(days=1)
+    return end - timedelta(days=days), end
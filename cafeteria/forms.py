@@ -1,9 +1,14 @@
+from datetime import timedelta
+
 from django import forms
 from django.utils import timezone
 from django.core.exceptions import ValidationError
 from django.db.models import Sum, F, ExpressionWrapper, DecimalField
 
+from navigation import hours
+
 from .models import Cafeteria, MenuItem, DailyMenu, Order, OrderItem
+from .analytics import start_of_day
 
 
 class DateInput(forms.DateInput):
@@ -91,8 +96,7 @@ class OrderForm(forms.ModelForm):
 
         # Check if the cafeteria is open at the pickup time
         if pickup_time and cafeteria:
-            pickup_time_only = pickup_time.time()
-            if pickup_time_only < cafeteria.opening_time or pickup_time_only > cafeteria.closing_time:
+            if not hours.get_table('cafeteria').is_open(cafeteria.id, pickup_time):
                 raise ValidationError(
                     f'The cafeteria is only open from {cafeteria.opening_time} to {cafeteria.closing_time}.')
 
@@ -144,8 +148,8 @@ class CafeteriaFilterForm(forms.Form):
             queryset = queryset.filter(location__icontains=location)
 
         if open_now:
-            now = timezone.now().time()
-            queryset = queryset.filter(opening_time__lte=now, closing_time__gte=now)
+            # Compiled hours handle closing times past midnight and campus holidays
+            queryset = queryset.filter(id__in=hours.open_cafeterias())
 
         return queryset
 
@@ -225,10 +229,11 @@ class OrderFilterForm(forms.Form):
         if cafeteria:
             queryset = queryset.filter(cafeteria=cafeteria)
 
+        # Compare raw timestamps so the created_at index can be used
         if date_from:
-            queryset = queryset.filter(created_at__date__gte=date_from)
+            queryset = queryset.filter(created_at__gte=start_of_day(date_from))
 
         if date_to:
-            queryset = queryset.filter(created_at__date__lte=date_to)
+            queryset = queryset.filter(created_at__lt=start_of_day(date_to + timedelta(days=1)))
 
         return queryset
\ No newline at end of file
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from cafeteria.prep_time import HISTORY_DAYS, fit_model
+
+
+class Command(BaseCommand):
+    help = "Fit prep-time distributions from order status history and store them"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=HISTORY_DAYS)
+
+    def handle(self, *args, **options):
+        model = fit_model(days=options['days'])
+        median, p90, samples = model.overall
+        self.stdout.write(self.style.SUCCESS(
+            f"Fitted {len(model.by_item_hour)} item/hour and {len(model.by_cafeteria_hour)} cafeteria/hour groups "
+            f"from {samples} orders (median {median / 60:.1f} min, p90 {p90 / 60:.1f} min)"
+        ))
@@ -0,0 +1,25 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from cafeteria.analytics import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute the hourly and daily sales rollups from completed orders"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help="Only rebuild buckets from this date (YYYY-MM-DD)")
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = timezone.make_aware(datetime.strptime(options['since'], '%Y-%m-%d'))
+            except ValueError:
+                raise CommandError("--since must be a date in YYYY-MM-DD format")
+
+        count = rebuild_rollups(since=since, chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rolled up {count} completed orders"))
@@ -0,0 +1,84 @@
+# Generated by Django 5.1.6 on 2026-10-19 14:06
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cafeteria', '0002_auto_20250303_2044'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket_start', models.DateTimeField()),
+                ('order_count', models.PositiveIntegerField(default=0)),
+                ('item_count', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('prep_seconds_total', models.FloatField(default=0)),
+                ('prep_samples', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='HourlySalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket_start', models.DateTimeField()),
+                ('order_count', models.PositiveIntegerField(default=0)),
+                ('item_count', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('prep_seconds_total', models.FloatField(default=0)),
+                ('prep_samples', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['created_at'], name='cafeteria_order_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['cafeteria', 'created_at'], name='cafeteria_order_cafe_idx'),
+        ),
+        migrations.AddField(
+            model_name='dailysalesrollup',
+            name='cafeteria',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='cafeteria.cafeteria'),
+        ),
+        migrations.AddField(
+            model_name='dailysalesrollup',
+            name='menu_item',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='cafeteria.menuitem'),
+        ),
+        migrations.AddField(
+            model_name='hourlysalesrollup',
+            name='cafeteria',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='cafeteria.cafeteria'),
+        ),
+        migrations.AddField(
+            model_name='hourlysalesrollup',
+            name='menu_item',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='cafeteria.menuitem'),
+        ),
+        migrations.AddIndex(
+            model_name='dailysalesrollup',
+            index=models.Index(fields=['cafeteria', 'bucket_start'], name='cafeteria_daily_bucket_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='dailysalesrollup',
+            unique_together={('cafeteria', 'menu_item', 'bucket_start')},
+        ),
+        migrations.AddIndex(
+            model_name='hourlysalesrollup',
+            index=models.Index(fields=['cafeteria', 'bucket_start'], name='cafeteria_hourly_bucket_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='hourlysalesrollup',
+            unique_together={('cafeteria', 'menu_item', 'bucket_start')},
+        ),
+    ]
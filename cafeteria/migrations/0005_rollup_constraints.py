@@ -0,0 +1,57 @@
+# Generated by Django 5.1.6 on 2026-10-19 14:56
+
+from django.db import migrations, models
+
+SUMMED = ('order_count', 'item_count', 'revenue', 'prep_seconds_total', 'prep_samples')
+
+
+def merge_duplicate_totals(apps, schema_editor):
+    # Racing writers could create several NULL menu_item rows for one bucket; fold them into the first
+    for name in ('HourlySalesRollup', 'DailySalesRollup'):
+        model = apps.get_model('cafeteria', name)
+        duplicates = (model.objects.filter(menu_item__isnull=True).values('cafeteria_id', 'bucket_start')
+                      .annotate(rows=models.Count('id')).filter(rows__gt=1))
+        for group in duplicates:
+            rows = list(model.objects.filter(menu_item__isnull=True, **{
+                'cafeteria_id': group['cafeteria_id'], 'bucket_start': group['bucket_start']}).order_by('id'))
+            keep = rows[0]
+            for row in rows[1:]:
+                for field in SUMMED:
+                    setattr(keep, field, getattr(keep, field) + getattr(row, field))
+            keep.save(update_fields=SUMMED)
+            model.objects.filter(id__in=[row.id for row in rows[1:]]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cafeteria', '0004_order_version'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='dailysalesrollup',
+            unique_together=set(),
+        ),
+        migrations.AlterUniqueTogether(
+            name='hourlysalesrollup',
+            unique_together=set(),
+        ),
+        migrations.RunPython(merge_duplicate_totals, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='dailysalesrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('menu_item__isnull', False)), fields=('cafeteria', 'menu_item', 'bucket_start'), name='cafeteria_daily_item_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailysalesrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('menu_item__isnull', True)), fields=('cafeteria', 'bucket_start'), name='cafeteria_daily_total_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='hourlysalesrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('menu_item__isnull', False)), fields=('cafeteria', 'menu_item', 'bucket_start'), name='cafeteria_hourly_item_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='hourlysalesrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('menu_item__isnull', True)), fields=('cafeteria', 'bucket_start'), name='cafeteria_hourly_total_uniq'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.6 on 2026-10-19 14:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cafeteria', '0005_rollup_constraints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrepTimeFit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fitted_at', models.DateTimeField()),
+                ('history_days', models.PositiveIntegerField()),
+                ('params', models.JSONField()),
+            ],
+            options={
+                'get_latest_by': 'fitted_at',
+            },
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='estimated_ready_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
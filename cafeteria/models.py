@@ -1,6 +1,15 @@
-from django.db import models
+from django.db import models, router, transaction
 from django.utils import timezone
 
+
+class InvalidTransition(Exception):
+    """The order state machine doesn't allow the requested status change"""
+
+
+class StaleOrderError(Exception):
+    """The order was modified by someone else since it was loaded"""
+
+
 class Cafeteria(models.Model):
     name = models.CharField(max_length=100)
     location = models.CharField(max_length=200)
@@ -66,6 +75,14 @@ class Order(models.Model):
         ('completed', 'Completed'),
         ('cancelled', 'Cancelled'),
     )
+    # Which statuses an order may move to from each status
+    ALLOWED_TRANSITIONS = {
+        'pending': ('preparing', 'ready', 'cancelled'),
+        'preparing': ('ready', 'cancelled'),
+        'ready': ('completed', 'cancelled'),
+        'completed': (),
+        'cancelled': (),
+    }
     DELIVERY_CHOICES = (
         ('pickup', 'Pickup'),
         ('dine_in', 'Dine In'),
@@ -95,45 +112,118 @@ class Order(models.Model):
         related_name='completed_orders'
     )
     completed_at = models.DateTimeField(null=True, blank=True)
+    # Bumped on every write so concurrent devices can't overwrite each other
+    version = models.PositiveIntegerField(default=0)
+    # Kept current by prep_time.refresh_estimates whenever the cafeteria's open orders change
+    estimated_ready_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='cafeteria_order_created_idx'),
+            models.Index(fields=['cafeteria', 'created_at'], name='cafeteria_order_cafe_idx'),
+        ]
 
     def __str__(self):
         return f"Order #{self.id} - {self.status}"
 
+    def save(self, *args, **kwargs):
+        """Saves of an existing order only succeed if nobody else wrote it since it was loaded"""
+        if self._state.adding or kwargs.get('force_insert'):
+            return super().save(*args, **kwargs)
+
+        using = kwargs.get('using') or router.db_for_write(Order, instance=self)
+        with transaction.atomic(using=using):
+            # Claim the next version first: this locks the row, and fails if the version moved on
+            claimed = Order.objects.using(using).filter(pk=self.pk, version=self.version).update(
+                version=self.version + 1)
+            if not claimed and Order.objects.using(using).filter(pk=self.pk).exists():
+                raise StaleOrderError(f"Order #{self.pk} was changed by someone else")
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = set(kwargs['update_fields']) | {'version'}
+            self.version += 1
+            try:
+                super().save(*args, **kwargs)
+            except Exception:
+                self.version -= 1
+                raise
+
+    def can_transition_to(self, new_status):
+        return new_status in self.ALLOWED_TRANSITIONS.get(self.status, ())
+
+    def transition(self, new_status, user=None, notes="", expected_version=None):
+        """
+        Move the order to ``new_status`` with a compare-and-swap on (status, version).
+
+        Raises InvalidTransition if the state machine doesn't allow the move and
+        StaleOrderError if the row changed since ``expected_version`` (defaults to
+        the version this instance was loaded with). The swap, the history row
+        and the sales rollups commit together.
+        """
+        from .analytics import record_completed_orders
+        from .prep_time import refresh_later
+
+        if not self.can_transition_to(new_status):
+            raise InvalidTransition(f"Cannot change order #{self.pk} from {self.status} to {new_status}")
+
+        version = self.version if expected_version is None else expected_version
+        now = timezone.now()
+        fields = {'status': new_status, 'version': models.F('version') + 1, 'updated_at': now}
+        if new_status == 'completed':
+            fields.update(completed_by=user, completed_at=now)
+
+        previous = (self.status, self.version, self.updated_at, self.completed_by, self.completed_at)
+        try:
+            with transaction.atomic():
+                updated = Order.objects.filter(pk=self.pk, status=self.status, version=version).update(**fields)
+                if not updated:
+                    self.refresh_from_db(fields=['status', 'version', 'completed_by', 'completed_at', 'updated_at'])
+                    raise StaleOrderError(f"Order #{self.pk} was changed by someone else")
+
+                self.status = new_status
+                self.version = version + 1
+                self.updated_at = now
+                if new_status == 'completed':
+                    self.completed_by = user
+                    self.completed_at = now
+
+                # Create status update record
+                OrderStatusUpdate.objects.create(
+                    order=self,
+                    status=new_status,
+                    notes=notes,
+                    updated_by=user
+                )
+
+                # The state machine only lets an order complete once, so this never double counts
+                if new_status == 'completed':
+                    record_completed_orders([self])
+                refresh_later([self.cafeteria_id])
+        except StaleOrderError:
+            raise
+        except Exception:
+            # Rolled back, so the instance goes back to what is still in the database
+            self.status, self.version, self.updated_at, self.completed_by, self.completed_at = previous
+            raise
+
     def complete_order(self, completed_by):
         """Mark order as completed by cafeteria owner/staff"""
-        self.status = 'completed'
-        self.completed_by = completed_by
-        self.completed_at = timezone.now()
-        self.save()
-
-        # Create status update record
-        OrderStatusUpdate.objects.create(
-            order=self,
-            status='completed',
-            notes=f"Order completed by {completed_by.username}"
-        )
+        try:
+            self.transition(
+                'completed',
+                user=completed_by,
+                notes=f"Order completed by {completed_by.username}" if completed_by else "Order completed"
+            )
+        except (InvalidTransition, StaleOrderError):
+            return False
+        return True
 
     def update_status(self, new_status, notes="", user=None):
         """Update order status and create status history entry"""
-        if new_status in dict(self.STATUS_CHOICES).keys():
-            old_status = self.status
-            self.status = new_status
-
-            if new_status == 'completed' and user:
-                self.completed_by = user
-                self.completed_at = timezone.now()
-
-            self.save()
-
-            # Create status update record
-            OrderStatusUpdate.objects.create(
-                order=self,
-                status=new_status,
-                notes=notes,
-                updated_by=user
-            )
-            return True
-        return False
+        try:
+            self.transition(new_status, user=user, notes=notes)
+        except (InvalidTransition, StaleOrderError):
+            return False
+        return True
 
 
 class OrderItem(models.Model):
@@ -175,4 +265,73 @@ class OrderStatusUpdate(models.Model):
         return f"Order #{self.order.id}: {self.get_status_display()}"
 
     class Meta:
-        ordering = ['-timestamp']
\ No newline at end of file
+        ordering = ['-timestamp']
+
+
+class SalesRollup(models.Model):
+    """Pre-aggregated sales for a cafeteria (or one of its menu items) over a time bucket"""
+    cafeteria = models.ForeignKey(Cafeteria, on_delete=models.CASCADE, related_name='+')
+    # Null menu_item rows hold the cafeteria-wide totals for the bucket
+    menu_item = models.ForeignKey(MenuItem, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    bucket_start = models.DateTimeField()
+    order_count = models.PositiveIntegerField(default=0)
+    item_count = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    prep_seconds_total = models.FloatField(default=0)
+    prep_samples = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+    @property
+    def avg_prep_seconds(self):
+        if not self.prep_samples:
+            return None
+        return self.prep_seconds_total / self.prep_samples
+
+
+class HourlySalesRollup(SalesRollup):
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cafeteria', 'menu_item', 'bucket_start'],
+                                    condition=models.Q(menu_item__isnull=False), name='cafeteria_hourly_item_uniq'),
+            # A plain unique index treats NULLs as distinct, so the totals rows need their own
+            models.UniqueConstraint(fields=['cafeteria', 'bucket_start'],
+                                    condition=models.Q(menu_item__isnull=True), name='cafeteria_hourly_total_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['cafeteria', 'bucket_start'], name='cafeteria_hourly_bucket_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.cafeteria_id} @ {self.bucket_start:%Y-%m-%d %H:00}"
+
+
+class DailySalesRollup(SalesRollup):
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cafeteria', 'menu_item', 'bucket_start'],
+                                    condition=models.Q(menu_item__isnull=False), name='cafeteria_daily_item_uniq'),
+            # A plain unique index treats NULLs as distinct, so the totals rows need their own
+            models.UniqueConstraint(fields=['cafeteria', 'bucket_start'],
+                                    condition=models.Q(menu_item__isnull=True), name='cafeteria_daily_total_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['cafeteria', 'bucket_start'], name='cafeteria_daily_bucket_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.cafeteria_id} @ {self.bucket_start:%Y-%m-%d}"
+
+
+class PrepTimeFit(models.Model):
+    """A fitted prep-time model (see prep_time); estimates read the newest row"""
+    fitted_at = models.DateTimeField()
+    history_days = models.PositiveIntegerField()
+    params = models.JSONField()
+
+    class Meta:
+        get_latest_by = 'fitted_at'
+
+    def __str__(self):
+        return f"Prep times fitted {self.fitted_at:%Y-%m-%d %H:%M}"
@@ -0,0 +1,260 @@
+# cafeteria/prep_time.py
+"""
+Prep-time estimates built from OrderStatusUpdate history.
+
+``fit_model`` exports the recent status history with ``values_list`` and
+computes per-item/hour, per-cafeteria/hour and per-cafeteria prep-time
+distributions in one vectorized NumPy pass. It runs from the
+``fit_prep_times`` task and command, never from a request. Each fit is
+stored as a PrepTimeFit row, which every process reads (and keeps for
+LOCAL_TTL seconds). Lookups are plain dict hits with a fallback chain.
+
+Ready-time estimates for open orders are stored on the orders.
+``refresh_estimates`` replays a cafeteria's kitchen queue when an order is
+placed and whenever its open orders change status, so showing an order's
+estimate reads a column. An order without one shows no estimate.
+"""
+import heapq
+import time as time_module
+from datetime import timedelta
+
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Cafeteria, Order, OrderItem, OrderStatusUpdate, PrepTimeFit
+
+LOCAL_TTL = 60
+
+HISTORY_DAYS = 90
+MIN_SAMPLES = 5
+MAX_PREP_SECONDS = 3 * 60 * 60  # Ignore orders that sat around for hours
+DEFAULT_PREP_SECONDS = 15 * 60
+KITCHEN_PARALLELISM = 4  # Orders a kitchen works on at the same time
+
+OPEN_STATUSES = ('pending', 'preparing')
+_STATUS_CODES = {'preparing': 0, 'ready': 1, 'completed': 2}
+_TABLES = ('by_item_hour', 'by_item', 'by_cafeteria_hour', 'by_cafeteria')
+
+
+class PrepTimeModel:
+    """Fitted prep-time parameters; each table maps a key to (median, p90, samples)"""
+
+    def __init__(self, by_item_hour=None, by_item=None, by_cafeteria_hour=None, by_cafeteria=None,
+                 overall=None, fitted_at=None):
+        self.by_item_hour = by_item_hour or {}
+        self.by_item = by_item or {}
+        self.by_cafeteria_hour = by_cafeteria_hour or {}
+        self.by_cafeteria = by_cafeteria or {}
+        self.overall = overall or (DEFAULT_PREP_SECONDS, DEFAULT_PREP_SECONDS, 0)
+        self.fitted_at = fitted_at
+
+    def item_seconds(self, cafeteria_id, menu_item_id, hour):
+        """Median prep time for one item, falling back to coarser groups"""
+        for table, key in ((self.by_item_hour, (menu_item_id, hour)),
+                           (self.by_item, menu_item_id),
+                           (self.by_cafeteria_hour, (cafeteria_id, hour)),
+                           (self.by_cafeteria, cafeteria_id)):
+            stats = table.get(key)
+            if stats and stats[2] >= MIN_SAMPLES:
+                return stats[0]
+        return self.overall[0]
+
+    def order_seconds(self, cafeteria_id, menu_item_ids, hour):
+        """Items are cooked in parallel, so the slowest one sets the pace"""
+        if not menu_item_ids:
+            return self.item_seconds(cafeteria_id, None, hour)
+        return max(self.item_seconds(cafeteria_id, item_id, hour) for item_id in menu_item_ids)
+
+    def to_dict(self):
+        """JSON-safe parameters; tables become [key..., median, p90, samples] rows"""
+        data = {name: [[*(key if isinstance(key, tuple) else (key,)), *stats]
+                       for key, stats in getattr(self, name).items()] for name in _TABLES}
+        data['overall'] = list(self.overall)
+        return data
+
+    @classmethod
+    def from_dict(cls, data, fitted_at=None):
+        tables = {}
+        for name in _TABLES:
+            width = 2 if name.endswith('_hour') else 1
+            tables[name] = {(tuple(row[:width]) if width > 1 else row[0]): tuple(row[width:])
+                            for row in data.get(name, ())}
+        return cls(overall=tuple(data['overall']) if data.get('overall') else None, fitted_at=fitted_at, **tables)
+
+
+def _group_stats(keys, durations):
+    """Median/p90/count of ``durations`` per distinct key, computed with one sort"""
+    if not len(keys):
+        return [], []
+    order = np.lexsort((durations, keys))
+    keys, durations = keys[order], durations[order]
+    unique_keys, starts, counts = np.unique(keys, return_index=True, return_counts=True)
+    medians = durations[starts + (counts - 1) // 2]
+    p90s = durations[starts + ((counts - 1) * 9) // 10]
+    stats = [(float(m), float(p), int(n)) for m, p, n in zip(medians, p90s, counts)]
+    return unique_keys.tolist(), stats
+
+
+def fit_model(days=HISTORY_DAYS):
+    """Fit prep-time distributions from the last ``days`` of status history"""
+    since = timezone.now() - timedelta(days=days)
+
+    orders = np.array(
+        [(order_id, cafeteria_id, created_at.timestamp()) for order_id, cafeteria_id, created_at in
+         Order.objects.filter(created_at__gte=since, status__in=['ready', 'completed'])
+         .order_by('id').values_list('id', 'cafeteria_id', 'created_at')],
+        dtype=np.float64,
+    ).reshape(-1, 3)
+    if not len(orders):
+        return _store(PrepTimeModel(fitted_at=timezone.now()), days)
+
+    order_ids = orders[:, 0].astype(np.int64)
+    cafeteria_ids = orders[:, 1].astype(np.int64)
+    created = orders[:, 2]
+
+    updates = np.array(
+        [(order_id, _STATUS_CODES[status], timestamp.timestamp()) for order_id, status, timestamp in
+         OrderStatusUpdate.objects.filter(order__created_at__gte=since, status__in=list(_STATUS_CODES))
+         .values_list('order_id', 'status', 'timestamp')],
+        dtype=np.float64,
+    ).reshape(-1, 3)
+
+    # First timestamp of each status per order (inf where the order never hit it)
+    first = np.full((len(order_ids), len(_STATUS_CODES)), np.inf)
+    if len(updates):
+        positions = np.searchsorted(order_ids, updates[:, 0].astype(np.int64))
+        positions = np.clip(positions, 0, len(order_ids) - 1)
+        known = order_ids[positions] == updates[:, 0].astype(np.int64)
+        np.minimum.at(first, (positions[known], updates[known, 1].astype(np.int64)), updates[known, 2])
+
+    started = np.where(np.isfinite(first[:, 0]), first[:, 0], created)
+    finished = np.where(np.isfinite(first[:, 1]), first[:, 1], first[:, 2])
+    durations = finished - started
+    valid = np.isfinite(durations) & (durations > 0) & (durations <= MAX_PREP_SECONDS)
+
+    offset = timezone.localtime().utcoffset().total_seconds()
+    hours = (((created + offset) // 3600) % 24).astype(np.int64)
+
+    caf_hour_keys, caf_hour_stats = _group_stats(cafeteria_ids[valid] * 24 + hours[valid], durations[valid])
+    caf_keys, caf_stats = _group_stats(cafeteria_ids[valid], durations[valid])
+
+    items = np.array(
+        list(OrderItem.objects.filter(order__created_at__gte=since).values_list('order_id', 'menu_item_id')),
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    item_hour_keys, item_hour_stats, item_keys, item_stats = [], [], [], []
+    if len(items):
+        positions = np.clip(np.searchsorted(order_ids, items[:, 0]), 0, len(order_ids) - 1)
+        matched = (order_ids[positions] == items[:, 0]) & valid[positions]
+        positions, item_ids = positions[matched], items[matched, 1]
+        item_hour_keys, item_hour_stats = _group_stats(item_ids * 24 + hours[positions], durations[positions])
+        item_keys, item_stats = _group_stats(item_ids, durations[positions])
+
+    overall = (DEFAULT_PREP_SECONDS, DEFAULT_PREP_SECONDS, 0)
+    if valid.any():
+        overall = (float(np.median(durations[valid])), float(np.percentile(durations[valid], 90)),
+                   int(valid.sum()))
+
+    model = PrepTimeModel(
+        by_item_hour={divmod(key, 24): stats for key, stats in zip(item_hour_keys, item_hour_stats)},
+        by_item=dict(zip(item_keys, item_stats)),
+        by_cafeteria_hour={divmod(key, 24): stats for key, stats in zip(caf_hour_keys, caf_hour_stats)},
+        by_cafeteria=dict(zip(caf_keys, caf_stats)),
+        overall=overall,
+        fitted_at=timezone.now(),
+    )
+    return _store(model, days)
+
+
+def _store(model, days):
+    with transaction.atomic():
+        fit = PrepTimeFit.objects.create(fitted_at=model.fitted_at, history_days=days, params=model.to_dict())
+        PrepTimeFit.objects.filter(id__lt=fit.id).delete()
+    _local.update(model=model, expires=time_module.monotonic() + LOCAL_TTL)
+    return model
+
+
+_local = {'model': None, 'expires': 0}
+
+
+def get_model():
+    """The newest stored fit, kept in process memory for LOCAL_TTL; defaults until one has been fitted"""
+    if _local['model'] is not None and _local['expires'] > time_module.monotonic():
+        return _local['model']
+
+    fit = PrepTimeFit.objects.order_by('-fitted_at', '-id').first()
+    model = PrepTimeModel.from_dict(fit.params, fit.fitted_at) if fit else PrepTimeModel()
+    _local.update(model=model, expires=time_module.monotonic() + LOCAL_TTL)
+    return model
+
+
+def kitchen_queue(cafeteria, now=None):
+    """
+    Open orders for a cafeteria with estimated ready times.
+
+    Orders are replayed FIFO over KITCHEN_PARALLELISM lanes: orders already
+    preparing keep their start time, pending ones start when a lane frees up.
+    """
+    now = now or timezone.now()
+    model = get_model()
+    orders = list(
+        Order.objects.filter(cafeteria=cafeteria, status__in=OPEN_STATUSES)
+        .order_by('created_at', 'id')
+        .prefetch_related('items')
+    )
+    started_at = dict(
+        OrderStatusUpdate.objects.filter(order__in=orders, status='preparing')
+        .order_by('-timestamp')
+        .values_list('order_id', 'timestamp')
+    )
+
+    lanes = [now] * KITCHEN_PARALLELISM
+    queue = []
+    # Orders already on the stove occupy lanes first
+    for order in sorted(orders, key=lambda o: o.status != 'preparing'):
+        hour = timezone.localtime(order.created_at).hour
+        seconds = model.order_seconds(cafeteria.id, [item.menu_item_id for item in order.items.all()], hour)
+        if order.status == 'preparing':
+            start = started_at.get(order.id, order.created_at)
+            heapq.heapreplace(lanes, max(start + timedelta(seconds=seconds), now))
+            ready_at = max(start + timedelta(seconds=seconds), now)
+        else:
+            start = heapq.heappop(lanes)
+            ready_at = start + timedelta(seconds=seconds)
+            heapq.heappush(lanes, ready_at)
+        queue.append({'order': order, 'prep_seconds': seconds, 'ready_at': ready_at})
+    return queue
+
+
+def refresh_estimates(cafeteria, now=None):
+    """Store the replayed ready time on each of a cafeteria's open orders; returns the queue"""
+    queue = kitchen_queue(cafeteria, now=now)
+    changed = []
+    for entry in queue:
+        order = entry['order']
+        if order.estimated_ready_at != entry['ready_at']:
+            order.estimated_ready_at = entry['ready_at']
+            changed.append(order)
+    # A plain UPDATE, so estimates neither bump the order's version nor trip its CAS
+    Order.objects.bulk_update(changed, ['estimated_ready_at'], batch_size=500)
+    return queue
+
+
+def refresh_later(cafeteria_ids):
+    """Refresh the estimates of these cafeterias once the current transaction commits"""
+    ids = set(cafeteria_ids)
+
+    def refresh():
+        for cafeteria in Cafeteria.objects.filter(pk__in=ids):
+            refresh_estimates(cafeteria)
+
+    transaction.on_commit(refresh)
+
+
+def estimate_ready_time(order, now=None):
+    """Estimated ready time for an order, from the estimate stored when its kitchen queue last changed"""
+    if order.status not in OPEN_STATUSES or order.estimated_ready_at is None:
+        return None
+    # An order running late is still expected any moment now
+    return max(order.estimated_ready_at, now or timezone.now())
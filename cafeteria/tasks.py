@@ -0,0 +1,9 @@
+from celery import shared_task
+
+from . import prep_time
+
+
+@shared_task(ignore_result=True)
+def fit_prep_times():
+    """Refit the prep-time model from recent order history"""
+    prep_time.fit_model()
@@ -1,3 +1,217 @@
+from datetime import time
+from unittest import mock
+
+from django.forms.models import model_to_dict
 from django.test import TestCase
+from django.utils import timezone
+
+from accounts.models import User
+
+from notifications.models import Notification
+
+from . import analytics, prep_time, transitions
+from .admin import OrderAdminForm
+from .transitions import bulk_transition
+from .models import (
+    Cafeteria, DailySalesRollup, HourlySalesRollup, MenuItem, Order, OrderItem, OrderStatusUpdate, PrepTimeFit,
+    StaleOrderError,
+)
+
+
+class CafeteriaTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='staff')
+        cls.cafeteria = Cafeteria.objects.create(name='Main', location='Hall', opening_time=time(8),
+                                                 closing_time=time(20), owner=cls.user)
+        cls.tea = MenuItem.objects.create(cafeteria=cls.cafeteria, name='Tea', price=2, category='Beverage')
+
+    def place_order(self, quantity=2):
+        order = Order.objects.create(user=self.user, cafeteria=self.cafeteria, pickup_time=timezone.now(),
+                                     total_price=2 * quantity)
+        OrderItem.objects.create(order=order, menu_item=self.tea, quantity=quantity)
+        return order
+
+    def complete(self, order):
+        order.update_status('preparing', user=self.user)
+        order.update_status('ready', user=self.user)
+        order.complete_order(self.user)
+        return order
+
+
+class SalesRollupTests(CafeteriaTestCase):
+    def test_completed_orders_share_one_totals_row_per_bucket(self):
+        for _ in range(3):
+            self.complete(self.place_order())
+
+        self.assertEqual(DailySalesRollup.objects.filter(menu_item__isnull=True).count(), 1)
+        self.assertEqual(HourlySalesRollup.objects.filter(menu_item__isnull=True).count(), 1)
+        start, end = analytics.default_range(1)
+        [summary] = analytics.sales_summary(self.cafeteria, start, end)
+        self.assertEqual((summary['orders'], summary['items']), (3, 6))
+        [top] = analytics.top_items(self.cafeteria, start, end)
+        self.assertEqual((top['menu_item_id'], top['items']), (self.tea.id, 6))
+
+    def test_recording_is_additive(self):
+        order = self.complete(self.place_order())
+        analytics.record_completed_orders([order])
+
+        row = DailySalesRollup.objects.get(menu_item__isnull=True)
+        self.assertEqual((row.order_count, row.item_count), (2, 4))
+
+    def test_repeated_lines_count_the_order_once(self):
+        order = self.place_order(1)
+        OrderItem.objects.create(order=order, menu_item=self.tea, quantity=3)
+        self.complete(order)
+
+        row = DailySalesRollup.objects.get(menu_item=self.tea)
+        self.assertEqual((row.order_count, row.item_count, row.prep_samples), (1, 4, 1))
+
+    def test_rebuild_matches_incremental_rollups(self):
+        for quantity in (1, 2, 3):
+            self.complete(self.place_order(quantity))
+        self.place_order()  # Not completed, so never counted
+        before = sorted(DailySalesRollup.objects.values_list('menu_item_id', 'order_count', 'item_count', 'revenue'),
+                        key=str)
+
+        self.assertEqual(analytics.rebuild_rollups(), 3)
+        after = sorted(DailySalesRollup.objects.values_list('menu_item_id', 'order_count', 'item_count', 'revenue'),
+                       key=str)
+        self.assertEqual(before, after)
+
+
+class PrepTimeTests(CafeteriaTestCase):
+    def setUp(self):
+        prep_time._local.update(model=None, expires=0)
+
+    def test_stored_parameters_round_trip(self):
+        model = prep_time.PrepTimeModel(by_item_hour={(3, 12): (300.0, 420.0, 9)}, by_item={3: (310.0, 400.0, 12)},
+                                        by_cafeteria_hour={(1, 12): (600.0, 900.0, 40)},
+                                        by_cafeteria={1: (500.0, 800.0, 70)}, overall=(550.0, 850.0, 70))
+        restored = prep_time.PrepTimeModel.from_dict(model.to_dict())
+        for name in ('by_item_hour', 'by_item', 'by_cafeteria_hour', 'by_cafeteria', 'overall'):
+            self.assertEqual(getattr(restored, name), getattr(model, name))
+        self.assertEqual(restored.order_seconds(1, [3], 12), 300.0)
+
+    def test_get_model_never_fits(self):
+        with self.assertNumQueries(1):
+            model = prep_time.get_model()
+        self.assertEqual(model.overall[0], prep_time.DEFAULT_PREP_SECONDS)
+        self.assertFalse(PrepTimeFit.objects.exists())
+
+    def test_fits_are_stored_and_replace_older_ones(self):
+        prep_time.fit_model()
+        prep_time.fit_model()
+        self.assertEqual(PrepTimeFit.objects.count(), 1)
+        prep_time._local.update(model=None, expires=0)
+        self.assertIsNotNone(prep_time.get_model().fitted_at)
+
+    def test_estimates_are_stored_when_the_queue_changes(self):
+        first, second = self.place_order(), self.place_order()
+        # Placed without going through the order form, so nothing is stored yet; looking never computes one
+        with self.assertNumQueries(0):
+            self.assertIsNone(prep_time.estimate_ready_time(second))
+        prep_time.refresh_estimates(self.cafeteria)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertIsNotNone(first.estimated_ready_at)
+        self.assertIsNotNone(prep_time.estimate_ready_time(second))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.update_status('cancelled', user=self.user)
+        second.refresh_from_db()
+        now = timezone.now()
+        with self.assertNumQueries(0):
+            ready_at = prep_time.estimate_ready_time(second, now=now)
+        self.assertGreaterEqual(ready_at, now)
+        self.assertIsNone(prep_time.estimate_ready_time(first))
+
+
+class OrderVersionTests(CafeteriaTestCase):
+    def test_save_bumps_the_version(self):
+        order = self.place_order()
+        order.notes = "No sugar"
+        order.save()
+        order.refresh_from_db()
+        self.assertEqual((order.version, order.notes), (1, "No sugar"))
+
+    def test_stale_save_is_refused(self):
+        order = self.place_order()
+        other = Order.objects.get(pk=order.pk)
+        other.save()
+
+        order.notes = "Overwrites"
+        with self.assertRaises(StaleOrderError):
+            order.save()
+        self.assertEqual(order.version, 0)
+        self.assertEqual(Order.objects.get(pk=order.pk).notes, "")
+
+    def test_failed_transition_leaves_no_trace(self):
+        order = self.place_order()
+        order.update_status('preparing', user=self.user)
+        order.update_status('ready', user=self.user)
+        with mock.patch.object(analytics, 'record_completed_orders', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                order.transition('completed', user=self.user)
+
+        self.assertEqual((order.status, order.version), ('ready', 2))
+        stored = Order.objects.get(pk=order.pk)
+        self.assertEqual((stored.status, stored.version), ('ready', 2))
+        self.assertFalse(OrderStatusUpdate.objects.filter(order=order, status='completed').exists())
+
+    def test_admin_form_rejects_stale_edits(self):
+        order = self.place_order()
+        data = {**model_to_dict(order), 'loaded_version': order.version, 'notes': "Edited"}
+        Order.objects.get(pk=order.pk).save()
+
+        form = OrderAdminForm(data=data, instance=Order.objects.get(pk=order.pk))
+        self.assertFalse(form.is_valid())
+        self.assertIn("changed by someone else", str(form.non_field_errors()))
+
+
+class BulkTransitionTests(CafeteriaTestCase):
+    def test_each_order_succeeds_or_fails_on_its_own(self):
+        pending, preparing, stale = self.place_order(), self.place_order(), self.place_order()
+        preparing.update_status('preparing', user=self.user)
+        results = bulk_transition([(pending.id, 'preparing'), (preparing.id, 'completed'), (stale.id, 'ready'),
+                                   (999999, 'ready'), (pending.id, 'preparing')],
+                                  user=self.user, expected_versions={stale.id: stale.version + 1})
+
+        self.assertEqual(results[pending.id], {'ok': True, 'status': 'preparing', 'version': 1, 'error': None})
+        self.assertEqual(results[preparing.id]['error'], "Cannot change from preparing to completed")
+        self.assertEqual(results[stale.id]['error'], "Order was changed by someone else")
+        self.assertEqual(results[999999]['error'], "Order not found")
+        self.assertEqual(Order.objects.get(pk=stale.pk).status, 'pending')
+
+    def test_applied_changes_leave_history_and_notifications(self):
+        orders = [self.place_order() for _ in range(3)]
+        bulk_transition([(order.id, 'ready') for order in orders], user=self.user, notes="Batch")
+        results = bulk_transition([(order.id, 'completed') for order in orders], user=self.user)
+
+        self.assertTrue(all(result['ok'] for result in results.values()))
+        self.assertEqual(OrderStatusUpdate.objects.filter(notes="Batch", status='ready').count(), 3)
+        self.assertEqual(Notification.objects.filter(type='cafeteria').count(), 6)
+        self.assertEqual(DailySalesRollup.objects.get(menu_item__isnull=True).order_count, 3)
+        # Repeating a change is rejected rather than notifying twice
+        self.assertFalse(any(result['ok'] for result in
+                             bulk_transition([(order.id, 'completed') for order in orders]).values()))
+        self.assertEqual(Notification.objects.filter(type='cafeteria').count(), 6)
+
+    def test_concurrent_identical_changes_apply_once(self):
+        raced, other = self.place_order(), self.place_order()
+        swap = transitions._swap
+
+        def race(order_id, status, version, fields):
+            if order_id == raced.id:
+                # Someone else made the same change between our read and our write
+                Order.objects.get(pk=order_id).update_status('preparing', user=self.user)
+            return swap(order_id, status, version, fields)
+
+        with mock.patch.object(transitions, '_swap', side_effect=race):
+            results = bulk_transition([(raced.id, 'preparing'), (other.id, 'preparing')], user=self.user)
 
-# Create your tests here.
+        self.assertEqual(results[raced.id], {'ok': False, 'status': 'preparing', 'version': 1,
+                                             'error': "Order was changed by someone else"})
+        self.assertTrue(results[other.id]['ok'])
+        self.assertEqual(OrderStatusUpdate.objects.filter(order=raced, status='preparing').count(), 1)
+        self.assertEqual(Notification.objects.filter(related_object_id=raced.id).count(), 0)
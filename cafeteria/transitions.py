@@ -0,0 +1,134 @@
+# cafeteria/transitions.py
+"""
+Bulk order status changes for cafeteria staff.
+
+Requested changes are validated against Order.ALLOWED_TRANSITIONS and
+applied with a version-guarded UPDATE per order. Only orders whose UPDATE
+matched get history rows and customer notifications, written with
+bulk_create.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from notifications import fanout
+from notifications.dedup import key as dedup_key
+from notifications.models import Notification
+
+from .analytics import record_completed_orders
+from .models import Order, OrderStatusUpdate
+from .prep_time import refresh_later
+
+STATUS_MESSAGES = {
+    'preparing': "Your order #{id} is being prepared.",
+    'ready': "Your order #{id} is ready for pickup.",
+    'completed': "Your order #{id} has been completed. Enjoy your meal!",
+    'cancelled': "Your order #{id} has been cancelled.",
+}
+
+
+def managed_orders(user):
+    """Orders the user is allowed to change"""
+    if user.is_staff:
+        return Order.objects.all()
+    return Order.objects.filter(cafeteria__owner=user)
+
+
+def _notify(orders, user_ids):
+    fanout.write(
+        Notification(
+            user_id=user_ids[order_id],
+            type='cafeteria',
+            title=f"Order #{order_id}: {dict(Order.STATUS_CHOICES)[status]}",
+            message=STATUS_MESSAGES[status].format(id=order_id),
+            priority='high' if status == 'ready' else 'medium',
+            action_url=f"/cafeteria/orders/{order_id}/",
+            related_object_type='order',
+            related_object_id=order_id,
+            dedup_key=dedup_key(('order', order_id, status), user_ids[order_id]),
+        )
+        for order_id, status in orders if status in STATUS_MESSAGES
+    )
+
+
+def _swap(order_id, status, version, fields):
+    """Compare-and-swap one order on the (status, version) it was validated against; 1 if it changed"""
+    return Order.objects.filter(pk=order_id, status=status, version=version).update(**fields)
+
+
+def bulk_transition(changes, user=None, notes="", queryset=None, expected_versions=None):
+    """
+    Apply many status changes at once.
+
+    ``changes`` is an iterable of (order_id, new_status) pairs and
+    ``expected_versions`` optionally maps order ids to the version the caller
+    last saw. Each order only changes if its (status, version) still match,
+    so stale requests are rejected instead of overwriting newer changes.
+    Returns a dict mapping each order id to
+    ``{'ok': bool, 'status': str, 'version': int, 'error': str}``.
+    """
+    changes = dict(changes)
+    expected_versions = expected_versions or {}
+    queryset = Order.objects.all() if queryset is None else queryset
+    results = {}
+
+    current = {
+        order_id: (status, version, user_id, cafeteria_id)
+        for order_id, status, version, user_id, cafeteria_id in
+        queryset.filter(pk__in=changes.keys()).values_list('id', 'status', 'version', 'user_id', 'cafeteria_id')
+    }
+
+    by_target = defaultdict(list)
+    for order_id, new_status in changes.items():
+        if order_id not in current:
+            results[order_id] = {'ok': False, 'status': None, 'version': None, 'error': 'Order not found'}
+            continue
+
+        status, version, _, _ = current[order_id]
+        expected = expected_versions.get(order_id, version)
+        if new_status not in Order.ALLOWED_TRANSITIONS:
+            error = 'Unknown status'
+        elif expected != version:
+            error = 'Order was changed by someone else'
+        elif new_status not in Order.ALLOWED_TRANSITIONS[status]:
+            error = f"Cannot change from {status} to {new_status}"
+        else:
+            by_target[new_status].append((order_id, status, version))
+            continue
+        results[order_id] = {'ok': False, 'status': status, 'version': version, 'error': error}
+
+    now = timezone.now()
+    applied, lost = [], []
+    with transaction.atomic():
+        for new_status, rows in by_target.items():
+            fields = {'status': new_status, 'version': F('version') + 1, 'updated_at': now}
+            if new_status == 'completed':
+                fields.update(completed_by=user, completed_at=now)
+            for order_id, status, version in rows:
+                # Only an UPDATE that matched counts: someone making the same change meanwhile leaves the
+                # row looking as if ours had applied
+                if _swap(order_id, status, version, fields):
+                    applied.append((order_id, new_status))
+                    results[order_id] = {'ok': True, 'status': new_status, 'version': version + 1, 'error': None}
+                else:
+                    lost.append(order_id)
+        for order_id, status, version in Order.objects.filter(pk__in=lost).values_list('id', 'status', 'version'):
+            results[order_id] = {'ok': False, 'status': status, 'version': version,
+                                 'error': 'Order was changed by someone else'}
+
+        OrderStatusUpdate.objects.bulk_create([
+            OrderStatusUpdate(order_id=order_id, status=new_status, notes=notes, updated_by=user)
+            for order_id, new_status in applied
+        ])
+
+        completed = [order_id for order_id, new_status in applied if new_status == 'completed']
+        if completed:
+            record_completed_orders(list(Order.objects.filter(pk__in=completed).prefetch_related('items')))
+
+        _notify(applied, {order_id: current[order_id][2] for order_id, _ in applied})
+        if applied:
+            refresh_later(current[order_id][3] for order_id, _ in applied)
+
+    return results
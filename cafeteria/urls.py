@@ -8,6 +8,10 @@ from .views import (
     CreateOrderView,
     MyOrdersView,
     OrderDetailView,
+    CafeteriaSalesView,
+    KitchenQueueView,
+    BulkOrderStatusView,
+    OrderStatusView,
 )
 
 app_name = 'cafeteria'  # Namespace for the app
@@ -16,6 +20,8 @@ urlpatterns = [
     # Cafeteria URLs
     path('', CafeteriaListView.as_view(), name='cafeteria_list'),
     path('<int:pk>/', CafeteriaDetailView.as_view(), name='cafeteria_detail'),
+    path('<int:pk>/sales/', CafeteriaSalesView.as_view(), name='cafeteria_sales'),
+    path('<int:pk>/kitchen-queue/', KitchenQueueView.as_view(), name='kitchen_queue'),
 
     # Menu Item URLs
     path('menu-items/', MenuItemListView.as_view(), name='menu_item_list'),
@@ -27,4 +33,6 @@ urlpatterns = [
     path('create-order/', CreateOrderView.as_view(), name='create_order'),
     path('my-orders/', MyOrdersView.as_view(), name='my_orders'),
     path('orders/<int:pk>/', OrderDetailView.as_view(), name='order_detail'),
+    path('orders/<int:pk>/status/', OrderStatusView.as_view(), name='order_status'),
+    path('orders/bulk-status/', BulkOrderStatusView.as_view(), name='bulk_order_status'),
 ]
\ No newline at end of file
@@ -1,6 +1,8 @@
 from django.shortcuts import render
 
 # Create your views here.
+import json
+
 from django.shortcuts import render, get_object_or_404, redirect
 from django.views import View
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
@@ -12,8 +14,11 @@ from django.utils import timezone
 from django.db.models import Q
 
 
-from .models import Cafeteria, MenuItem, DailyMenu, Order, OrderItem
+from .models import Cafeteria, MenuItem, DailyMenu, Order, OrderItem, InvalidTransition, StaleOrderError
 from .forms import OrderForm, OrderItemForm
+from . import analytics
+from .prep_time import estimate_ready_time, kitchen_queue, refresh_estimates
+from .transitions import bulk_transition, managed_orders
 
 
 
@@ -102,7 +107,18 @@ class CreateOrderView(LoginRequiredMixin, CreateView):
                 item.order = self.object
                 item.save()
 
-        messages.success(self.request, 'Your order has been placed successfully!')
+        # The new order joins the kitchen queue, which moves every open order's estimate
+        refresh_estimates(self.object.cafeteria)
+        self.object.refresh_from_db(fields=['estimated_ready_at'])
+        ready_at = estimate_ready_time(self.object)
+        if ready_at:
+            messages.success(
+                self.request,
+                f'Your order has been placed successfully! Estimated ready time: '
+                f'{timezone.localtime(ready_at):%I:%M %p}.'
+            )
+        else:
+            messages.success(self.request, 'Your order has been placed successfully!')
         return response
 
 
@@ -123,4 +139,112 @@ class OrderDetailView(LoginRequiredMixin, DetailView):
     def get_queryset(self):
         return Order.objects.filter(user=self.request.user)
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['estimated_ready_at'] = estimate_ready_time(self.object)
+        return context
+
 
+class CafeteriaSalesView(LoginRequiredMixin, View):
+    """Sales dashboard data for a cafeteria, served from the rollup tables"""
+
+    def get(self, request, pk):
+        cafeteria = get_object_or_404(Cafeteria, pk=pk)
+        if not (request.user.is_staff or cafeteria.owner_id == request.user.id):
+            return JsonResponse({'error': 'Not allowed'}, status=403)
+
+        try:
+            days = min(int(request.GET.get('days', 30)), 366)
+        except ValueError:
+            days = 30
+        granularity = 'hour' if request.GET.get('granularity') == 'hour' else 'day'
+        start, end = analytics.default_range(days)
+
+        return JsonResponse({
+            'cafeteria': cafeteria.id,
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'granularity': granularity,
+            'summary': analytics.sales_summary(cafeteria, start, end, granularity),
+            'top_items': analytics.top_items(cafeteria, start, end),
+            'hourly_profile': analytics.hourly_profile(cafeteria, start, end),
+        })
+
+
+class KitchenQueueView(LoginRequiredMixin, View):
+    """Open orders for a cafeteria in kitchen order, with estimated ready times"""
+
+    def get(self, request, pk):
+        cafeteria = get_object_or_404(Cafeteria, pk=pk)
+        if not (request.user.is_staff or cafeteria.owner_id == request.user.id):
+            return JsonResponse({'error': 'Not allowed'}, status=403)
+
+        return JsonResponse({
+            'cafeteria': cafeteria.id,
+            'orders': [{
+                'id': entry['order'].id,
+                'status': entry['order'].status,
+                'pickup_time': entry['order'].pickup_time.isoformat(),
+                'prep_seconds': round(entry['prep_seconds']),
+                'ready_at': entry['ready_at'].isoformat(),
+            } for entry in kitchen_queue(cafeteria)],
+        })
+
+
+class BulkOrderStatusView(LoginRequiredMixin, View):
+    """
+    Change the status of many orders in one request.
+
+    Accepts JSON ``{"orders": [1, 2], "status": "ready"}`` or
+    ``{"changes": [{"id": 1, "status": "ready", "version": 3}, ...]}`` plus
+    optional ``notes``. Changes that carry a version are rejected if the
+    order has moved on since the client last saw it.
+    """
+
+    def post(self, request):
+        try:
+            payload = json.loads(request.body)
+            versions = {}
+            if 'changes' in payload:
+                changes = [(int(change['id']), change['status']) for change in payload['changes']]
+                versions = {int(change['id']): int(change['version'])
+                            for change in payload['changes'] if change.get('version') is not None}
+            else:
+                changes = [(int(order_id), payload['status']) for order_id in payload['orders']]
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return JsonResponse({'error': 'Invalid request body'}, status=400)
+
+        results = bulk_transition(changes, user=request.user, notes=payload.get('notes', ''),
+                                  queryset=managed_orders(request.user), expected_versions=versions)
+        return JsonResponse({
+            'updated': sum(1 for result in results.values() if result['ok']),
+            'results': {str(order_id): result for order_id, result in results.items()},
+        })
+
+
+class OrderStatusView(LoginRequiredMixin, View):
+    """
+    Change one order's status from a kitchen device.
+
+    Expects JSON ``{"status": "ready", "version": 3}``; answers 409 with the
+    current status and version when the order changed in the meantime.
+    """
+
+    def post(self, request, pk):
+        order = get_object_or_404(managed_orders(request.user), pk=pk)
+        try:
+            payload = json.loads(request.body)
+            new_status = payload['status']
+            version = int(payload['version']) if payload.get('version') is not None else None
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return JsonResponse({'error': 'Invalid request body'}, status=400)
+
+        try:
+            order.transition(new_status, user=request.user, notes=payload.get('notes', ''),
+                             expected_version=version)
+        except InvalidTransition as e:
+            return JsonResponse({'error': str(e), 'status': order.status, 'version': order.version}, status=400)
+        except StaleOrderError as e:
+            return JsonResponse({'error': str(e), 'status': order.status, 'version': order.version}, status=409)
+
+        return JsonResponse({'id': order.id, 'status': order.status, 'version': order.version})
@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 import os
 from pathlib import Path
 
+from celery.schedules import crontab
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -44,6 +46,8 @@ INSTALLED_APPS = [
     'accounts',
     'notifications',
     'navigation',
+    'events',
+    'imaging',
     'rest_framework',
 
 ]
@@ -75,6 +79,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'notifications.context_processors.unread_notifications',
             ],
         },
     },
@@ -93,6 +98,15 @@ DATABASES = {
     }
 }
 
+# Must be shared by every web and worker process when running more than one: routing, spatial indexes,
+# timetables and alerts invalidate their in-process tables through generation counters kept here.
+# Set CACHE_URL=redis://... in production; without it each process gets its own local memory cache.
+CACHE_URL = os.environ.get('CACHE_URL', '')
+if CACHE_URL and not CACHE_URL.startswith('locmem://'):
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': CACHE_URL}}
+else:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -135,4 +149,64 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 MEDIA_URL = '/media/'
-MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
\ No newline at end of file
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Thumbnails generated for uploaded images (see imaging.pipeline)
+IMAGE_VARIANT_WIDTHS = (160, 320, 640, 1280)
+IMAGE_VARIANT_WORKERS = 2
+
+# GPS telemetry ingestion (see transportation.telemetry)
+TRANSPORT_TELEMETRY_TOKEN = os.environ.get('TRANSPORT_TELEMETRY_TOKEN', '')
+TRANSPORT_TELEMETRY_FLUSH_MS = 500
+TRANSPORT_OCCUPANCY_FLUSH_MS = 1000
+# Buses whose last GPS fix is older than this many seconds get no arrival predictions (see transportation.eta)
+TRANSPORT_ETA_MAX_FIX_AGE = 5 * 60
+
+# Compacted bus position history; set BUS_HISTORY_ROOT to keep segments on disk instead of in the database
+BUS_HISTORY_ROOT = None
+BUS_HISTORY_RETENTION_DAYS = 90
+
+# Live bus tracker streams; use the redis broker when running more than one web process
+TRANSPORT_LIVE_BROKER = os.environ.get('TRANSPORT_LIVE_BROKER', 'memory')
+TRANSPORT_LIVE_REDIS_URL = os.environ.get('TRANSPORT_LIVE_REDIS_URL', 'redis://localhost:6379/0')
+TRANSPORT_LIVE_INTERVAL = 1.0
+
+# (first month, name) of each term; ClassSection.semester is "<name> <year>" (see navigation.availability)
+ACADEMIC_TERMS = ((1, 'Spring'), (6, 'Summer'), (8, 'Fall'))
+
+# Campus-wide holidays for building and cafeteria hours (see navigation.hours): {"YYYY-MM-DD": "closed" or spans}
+CAMPUS_HOLIDAYS = {}
+
+# Celery; notification delivery runs on its own queue: celery -A config worker -Q notifications
+CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/1')
+CELERY_TASK_ALWAYS_EAGER = os.environ.get('CELERY_TASK_ALWAYS_EAGER') == '1'
+CELERY_TASK_ROUTES = {'notifications.tasks.*': {'queue': 'notifications'}}
+CELERY_BEAT_SCHEDULE = {
+    # Releases deliveries held for quiet hours, retries failures and catches anything not queued
+    'deliver-notifications': {'task': 'notifications.tasks.deliver_notifications', 'schedule': 60.0},
+    'notification-retention': {'task': 'notifications.tasks.apply_retention', 'schedule': crontab(hour=3, minute=30)},
+    'notification-reminders': {'task': 'notifications.tasks.send_reminders', 'schedule': 60.0},
+    'transport-bus-alerts': {'task': 'transportation.tasks.notify_bus_alerts', 'schedule': 60.0},
+    'cafeteria-prep-times': {'task': 'cafeteria.tasks.fit_prep_times', 'schedule': crontab(hour='*/6', minute=15)},
+}
+
+# Backend per delivery channel (see notifications.backends); the file backend stands in for real gateways
+NOTIFICATION_BACKENDS = {
+    'email': 'notifications.backends.FileBackend',
+    'push': 'notifications.backends.FileBackend',
+    'sms': 'notifications.backends.FileBackend',
+}
+NOTIFICATION_FILE_DIR = os.path.join(BASE_DIR, 'notification_outbox')
+# Pending notifications about the same object within this many seconds collapse into one (see notifications.dedup)
+NOTIFICATION_COALESCE_SECONDS = 15 * 60
+
+# Notification retention (see notifications.retention); policies match on 'type' and/or 'priority'
+NOTIFICATION_ARCHIVE_AFTER_DAYS = 30
+NOTIFICATION_ARCHIVE_KEEP_DAYS = 365
+NOTIFICATION_DELETE_POLICIES = (
+    {'type': 'transport', 'days': 14},
+    {'priority': 'low', 'days': 90},
+)
+
+# Minutes before assignment due dates, exams and events at which reminders go out (see notifications.reminders)
+NOTIFICATION_REMINDER_OFFSETS = (24 * 60, 60)
@@ -17,13 +17,21 @@ Including another URLconf
 from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
+
+from imaging.views import serve_variant
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('accounts/', include('accounts.urls')),
     path('academics/', include('academics.urls')),
     path('cafeteria/', include('cafeteria.urls')),
+    path('transportation/', include('transportation.urls')),
+    path('navigation/', include('navigation.urls')),
+    path('notifications/', include('notifications.urls')),
 ]
 if settings.DEBUG:
+    urlpatterns += [
+        re_path(r'^media/(?P<path>variants/.*)$', serve_variant, {'document_root': settings.MEDIA_ROOT}),
+    ]
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-19 14:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='event',
+            name='start_datetime',
+            field=models.DateTimeField(db_index=True),
+        ),
+    ]
@@ -29,7 +29,7 @@ class ClubMembership(models.Model):
 class Event(models.Model):
     title = models.CharField(max_length=200)
     description = models.TextField()
-    start_datetime = models.DateTimeField()
+    start_datetime = models.DateTimeField(db_index=True)
     end_datetime = models.DateTimeField()
     location = models.CharField(max_length=200)
     image = models.ImageField(upload_to='event_images/', blank=True, null=True)
@@ -37,6 +37,7 @@ class Event(models.Model):
     is_university_wide = models.BooleanField(default=False)
     max_participants = models.PositiveIntegerField(null=True, blank=True)
     tags = models.JSONField(default=list, blank=True)  # For event categorization and AI recommendations
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)  # Reminders pick up changes by this
 
 
 class EventRSVP(models.Model):
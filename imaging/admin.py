@@ -0,0 +1,10 @@
+from django.contrib import admin
+from .models import ImageVariant
+
+
+@admin.register(ImageVariant)
+class ImageVariantAdmin(admin.ModelAdmin):
+    list_display = ('source_name', 'width', 'height', 'format', 'name', 'created_at')
+    list_filter = ('format', 'width')
+    search_fields = ('source_name', 'content_hash')
+    readonly_fields = ('created_at',)
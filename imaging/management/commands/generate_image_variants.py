@@ -0,0 +1,42 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from imaging.pipeline import IMAGE_FIELDS, generate_variants, remove_variants
+
+
+class Command(BaseCommand):
+    help = "Generate thumbnails for every existing upload in the image fields that use variants"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Regenerate uploads that already have variants")
+        parser.add_argument('--prune', action='store_true',
+                            help="Delete variants of uploads that no image field refers to any more")
+
+    def handle(self, *args, **options):
+        from imaging.models import ImageVariant
+
+        done = set() if options['force'] else set(ImageVariant.objects.values_list('source_name', flat=True))
+        referenced = set()
+        count = 0
+        for label, field_names in IMAGE_FIELDS.items():
+            model = apps.get_model(label)
+            for field_name in field_names:
+                names = (model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+                         .values_list(field_name, flat=True).distinct())
+                for name in names.iterator():
+                    referenced.add(name)
+                    if name in done:
+                        continue
+                    try:
+                        generate_variants(name)
+                    except (OSError, ValueError) as e:
+                        self.stderr.write(f"Skipping {name}: {e}")
+                        continue
+                    done.add(name)
+                    count += 1
+        self.stdout.write(self.style.SUCCESS(f"Generated variants for {count} images"))
+
+        if options['prune']:
+            stale = set(ImageVariant.objects.values_list('source_name', flat=True).distinct()) - referenced
+            removed = sum(remove_variants(name) for name in stale)
+            self.stdout.write(self.style.SUCCESS(f"Removed {removed} variants of {len(stale)} replaced uploads"))
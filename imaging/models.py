@@ -0,0 +1,23 @@
+from django.db import models
+
+
+class ImageVariant(models.Model):
+    """A resized copy of an uploaded image, stored under a content-hashed path"""
+    FORMATS = (
+        ('webp', 'WebP'),
+        ('jpeg', 'JPEG'),
+    )
+    source_name = models.CharField(max_length=255, db_index=True)  # Storage name of the original upload
+    content_hash = models.CharField(max_length=64, db_index=True)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    format = models.CharField(max_length=10, choices=FORMATS)
+    name = models.CharField(max_length=255)  # Storage name of the variant
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('source_name', 'width', 'format')
+        ordering = ['source_name', 'width']
+
+    def __str__(self):
+        return f"{self.source_name} @ {self.width}w ({self.format})"
@@ -0,0 +1,213 @@
+# imaging/pipeline.py
+"""
+Thumbnail pipeline for uploaded images.
+
+When a model in IMAGE_FIELDS is saved with a new upload, the file is
+handed to a small worker pool that writes WebP and JPEG copies at fixed
+widths. Variant paths embed the SHA-256 of the original's bytes, so a
+variant URL never changes content and can be cached forever. Variants of
+the upload it replaced (or cleared) are deleted, files included, unless
+another upload with the same bytes still uses them.
+
+Only saves that change an image field queue work, so an image that fails
+to convert is not retried on every unrelated save; re-upload it or run the
+generate_image_variants command.
+"""
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from io import BytesIO
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.db.models.signals import post_init, post_save, pre_save
+from PIL import Image, ImageOps
+
+from .models import ImageVariant
+
+logger = logging.getLogger(__name__)
+
+# Models and image fields that get variants
+IMAGE_FIELDS = {
+    'cafeteria.MenuItem': ('image',),
+    'academics.Faculty': ('profile_picture',),
+    'accounts.User': ('profile_picture',),
+    'events.Event': ('image',),
+    'events.Club': ('logo',),
+    'navigation.Building': ('image',),
+}
+
+VARIANT_WIDTHS = getattr(settings, 'IMAGE_VARIANT_WIDTHS', (160, 320, 640, 1280))
+VARIANT_ROOT = 'variants'
+SAVE_OPTIONS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+    'jpeg': {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True},
+}
+CACHE_TIMEOUT = 60 * 60 * 24
+PENDING_TIMEOUT = 60  # Uploads without variants yet are looked up again soon
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'IMAGE_VARIANT_WORKERS', 2),
+            thread_name_prefix='imaging',
+        )
+    return _executor
+
+
+def _cache_key(source_name):
+    return 'imaging:variants:' + hashlib.md5(source_name.encode()).hexdigest()
+
+
+def variants_for(source_name):
+    """(width, format, name) tuples for an upload, smallest first; cached"""
+    key = _cache_key(source_name)
+    variants = cache.get(key)
+    if variants is None:
+        variants = list(
+            ImageVariant.objects.filter(source_name=source_name)
+            .order_by('width').values_list('width', 'format', 'name')
+        )
+        cache.set(key, variants, CACHE_TIMEOUT if variants else PENDING_TIMEOUT)
+    return variants
+
+
+def variant_name(digest, width, fmt):
+    return f"{VARIANT_ROOT}/{digest[:2]}/{digest[:24]}-{width}.{fmt}"
+
+
+def generate_variants(source_name):
+    """Write every missing variant for an upload and record them"""
+    with default_storage.open(source_name, 'rb') as fh:
+        data = fh.read()
+    digest = hashlib.sha256(data).hexdigest()
+
+    image = ImageOps.exif_transpose(Image.open(BytesIO(data)))
+    widths = [width for width in VARIANT_WIDTHS if width < image.width] or [image.width]
+
+    variants = []
+    for width in widths:
+        resized = image.copy()
+        resized.thumbnail((width, image.height), Image.LANCZOS)
+        for fmt, options in SAVE_OPTIONS.items():
+            name = variant_name(digest, width, fmt)
+            if not default_storage.exists(name):
+                converted = resized
+                if fmt == 'jpeg' and resized.mode != 'RGB':
+                    converted = resized.convert('RGB')
+                elif fmt == 'webp' and resized.mode not in ('RGB', 'RGBA'):
+                    converted = resized.convert('RGBA')
+                buffer = BytesIO()
+                converted.save(buffer, **options)
+                default_storage.save(name, ContentFile(buffer.getvalue()))
+            variants.append(ImageVariant(
+                source_name=source_name,
+                content_hash=digest,
+                width=resized.width,
+                height=resized.height,
+                format=fmt,
+                name=name,
+            ))
+
+    with transaction.atomic():
+        previous = set(ImageVariant.objects.filter(source_name=source_name).values_list('name', flat=True))
+        ImageVariant.objects.filter(source_name=source_name).delete()
+        ImageVariant.objects.bulk_create(variants)
+    cache.delete(_cache_key(source_name))
+    _delete_files(previous)
+    return variants
+
+
+def remove_variants(source_name):
+    """Forget an upload's variants and delete their files; returns rows removed"""
+    with transaction.atomic():
+        names = set(ImageVariant.objects.filter(source_name=source_name).values_list('name', flat=True))
+        removed, _ = ImageVariant.objects.filter(source_name=source_name).delete()
+    cache.delete(_cache_key(source_name))
+    _delete_files(names)
+    return removed
+
+
+def _delete_files(names):
+    # Identical uploads share content-hashed variant files
+    unused = set(names) - set(ImageVariant.objects.filter(name__in=names).values_list('name', flat=True))
+    for name in unused:
+        default_storage.delete(name)
+
+
+def _run_in_worker(func, source_name):
+    try:
+        func(source_name)
+    except Exception:
+        logger.exception("Image variant task %s failed for %s", func.__name__, source_name)
+    finally:
+        close_old_connections()
+
+
+def schedule_variants(source_name):
+    """Queue variant generation on the worker pool"""
+    return _get_executor().submit(_run_in_worker, generate_variants, source_name)
+
+
+def schedule_removal(source_name):
+    """Queue removal of a replaced upload's variants on the worker pool"""
+    return _get_executor().submit(_run_in_worker, remove_variants, source_name)
+
+
+def _name(value):
+    return (getattr(value, 'name', value) or '') if value else ''
+
+
+def remember_uploads(sender, instance, **kwargs):
+    """Note the image names an instance was loaded with, to spot changed uploads on save"""
+    instance._imaging_names = {field_name: _name(instance.__dict__[field_name])
+                               for field_name in IMAGE_FIELDS[sender._meta.label] if field_name in instance.__dict__}
+
+
+def note_uploads(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Remember which image fields are changing, and the name each one replaces"""
+    if raw:
+        return
+    loaded = {} if instance._state.adding else instance.__dict__.get('_imaging_names', {})
+    changes = {}
+    for field_name in IMAGE_FIELDS[sender._meta.label]:
+        # Most saves (e.g. last_login updates) don't touch the image; deferred fields weren't touched either
+        if (update_fields is not None and field_name not in update_fields) or field_name not in instance.__dict__:
+            continue
+        upload = getattr(instance, field_name)
+        previous = loaded.get(field_name, '')
+        if (upload and not upload._committed) or _name(upload) != previous:
+            changes[field_name] = previous
+    instance._imaging_changes = changes
+
+
+def queue_variants(sender, instance, raw=False, **kwargs):
+    changes = instance.__dict__.pop('_imaging_changes', None)
+    if raw or not changes:
+        return
+    names = instance.__dict__.setdefault('_imaging_names', {})
+    for field_name, previous in changes.items():
+        name = names[field_name] = _name(getattr(instance, field_name))
+        if name:
+            transaction.on_commit(partial(schedule_variants, name))
+        if previous and previous != name:
+            transaction.on_commit(partial(schedule_removal, previous))
+
+
+def connect_signals():
+    for label in IMAGE_FIELDS:
+        if not apps.is_installed(label.split('.')[0]):
+            continue
+        model = apps.get_model(label)
+        post_init.connect(remember_uploads, sender=model, dispatch_uid=f'imaging.remember_uploads.{label}')
+        pre_save.connect(note_uploads, sender=model, dispatch_uid=f'imaging.note_uploads.{label}')
+        post_save.connect(queue_variants, sender=model, dispatch_uid=f'imaging.queue_variants.{label}')
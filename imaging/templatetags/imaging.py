@@ -0,0 +1,44 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html, format_html_join
+
+from imaging.pipeline import variants_for
+
+register = template.Library()
+
+
+@register.simple_tag
+def responsive_image(image, alt='', css_class='', sizes='100vw'):
+    """
+    <picture> with WebP and JPEG srcsets for an uploaded image.
+
+    Falls back to the original file while variants are still being generated.
+    """
+    if not image:
+        return ''
+
+    variants = variants_for(image.name)
+    if not variants:
+        return format_html('<img src="{}" alt="{}" class="{}" loading="lazy" decoding="async">',
+                           image.url, alt, css_class)
+
+    srcsets = {}
+    for width, fmt, name in variants:
+        srcsets.setdefault(fmt, []).append((default_storage.url(name), width))
+
+    jpeg = srcsets.get('jpeg', [])
+    fallback = jpeg[-1][0] if jpeg else image.url
+    sources = format_html_join(
+        '', '<source type="image/{}" srcset="{}" sizes="{}">',
+        ((fmt, ', '.join(f'{url} {width}w' for url, width in entries), sizes)
+         for fmt, entries in srcsets.items() if fmt != 'jpeg'),
+    )
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" alt="{}" class="{}" loading="lazy" decoding="async"></picture>',
+        sources,
+        fallback,
+        ', '.join(f'{url} {width}w' for url, width in jpeg),
+        sizes,
+        alt,
+        css_class,
+    )
@@ -0,0 +1,87 @@
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from accounts.models import User
+
+from . import pipeline
+
+
+def png(width=400, height=300, color='red'):
+    buffer = BytesIO()
+    Image.new('RGB', (width, height), color).save(buffer, format='PNG')
+    return ContentFile(buffer.getvalue())
+
+
+class PipelineTests(TestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        settings = override_settings(MEDIA_ROOT=media)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        cache.clear()
+
+    def test_variants_are_written_and_old_ones_deleted(self):
+        name = default_storage.save('uploads/a.png', png())
+        first = pipeline.generate_variants(name)
+        self.assertTrue(all(default_storage.exists(variant.name) for variant in first))
+        self.assertEqual([width for width, _, _ in pipeline.variants_for(name)][:2], [160, 160])
+
+        default_storage.delete(name)
+        default_storage.save(name, png(color='blue'))
+        second = pipeline.generate_variants(name)
+        self.assertFalse(any(default_storage.exists(variant.name) for variant in first))
+        self.assertTrue(all(default_storage.exists(variant.name) for variant in second))
+
+    def test_removal_keeps_files_shared_with_identical_uploads(self):
+        first = default_storage.save('uploads/a.png', png())
+        second = default_storage.save('uploads/b.png', png())
+        variants = pipeline.generate_variants(first)
+        pipeline.generate_variants(second)
+
+        self.assertEqual(pipeline.remove_variants(first), len(variants))
+        self.assertTrue(all(default_storage.exists(variant.name) for variant in variants))
+        pipeline.remove_variants(second)
+        self.assertFalse(any(default_storage.exists(variant.name) for variant in variants))
+
+    def test_missing_variants_are_not_cached_for_long(self):
+        with mock.patch.object(pipeline.cache, 'set') as cache_set:
+            self.assertEqual(pipeline.variants_for('uploads/none.png'), [])
+        self.assertEqual(cache_set.call_args.args[2], pipeline.PENDING_TIMEOUT)
+
+    @mock.patch.object(pipeline, 'schedule_removal')
+    @mock.patch.object(pipeline, 'schedule_variants')
+    def test_only_new_uploads_are_queued(self, schedule_variants, schedule_removal):
+        user = User.objects.create(username='pic')
+        with self.captureOnCommitCallbacks(execute=True):
+            user.profile_picture.save('me.png', png())
+        first = user.profile_picture.name
+        schedule_variants.assert_called_once_with(first)
+
+        # Unrelated saves never retry an image, e.g. one that failed to convert
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save(update_fields=['last_login'])
+            user.save()
+        self.assertEqual(schedule_variants.call_count, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            user.profile_picture.save('me.png', png(color='green'))
+        schedule_variants.assert_called_with(user.profile_picture.name)
+        schedule_removal.assert_called_once_with(first)
+
+        second = user.profile_picture.name
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.get(pk=user.pk).save()
+            cleared = User.objects.get(pk=user.pk)
+            cleared.profile_picture = None
+            cleared.save()
+        self.assertEqual(schedule_variants.call_count, 2)
+        schedule_removal.assert_called_with(second)
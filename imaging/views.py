@@ -0,0 +1,8 @@
+from django.views.static import serve
+
+
+def serve_variant(request, path, document_root=None):
+    """Serve a content-hashed variant with a far-future immutable cache header"""
+    response = serve(request, path, document_root=document_root)
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
@@ -2,7 +2,7 @@
 from django.contrib import admin
 from django.contrib.gis.admin import GISModelAdmin
 from django.contrib.gis.forms import OSMWidget  # For custom map widget
-from .models import Building, Room, ARMarker
+from .models import Building, Room, ARMarker, Entrance, MapBundle
 
 # Register your models here.
 
@@ -34,4 +34,18 @@ class ARMarkerAdmin(GISModelAdmin):
     def formfield_for_dbfield(self, db_field, **kwargs):
         if db_field.name == 'location':
             kwargs['widget'] = OSMWidget  # Use OpenStreetMap widget
-        return super().formfield_for_dbfield(db_field, **kwargs)
\ No newline at end of file
+        return super().formfield_for_dbfield(db_field, **kwargs)
+
+
+@admin.register(Entrance)
+class EntranceAdmin(GISModelAdmin):
+    list_display = ('building', 'name', 'floor', 'accessible')
+    search_fields = ('building__name', 'name')
+    list_filter = ('building', 'accessible')
+
+
+@admin.register(MapBundle)
+class MapBundleAdmin(admin.ModelAdmin):
+    list_display = ('version', 'created_at', 'size')
+    exclude = ('data',)
+    readonly_fields = ('version', 'created_at', 'size')
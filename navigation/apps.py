@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class NavigationConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'navigation'
+
+    def ready(self):
+        from . import availability, bundle, hours, routing, spatial
+        availability.connect_signals()
+        bundle.connect_signals()
+        hours.connect_signals()
+        routing.connect_signals()
+        spatial.connect_signals()
@@ -0,0 +1,318 @@
+# navigation/availability.py
+"""
+Room availability from class schedules and exams.
+
+Class sections and exams name their room in free text. RoomResolver links
+those strings to Room records ("ENG 101", "ENG-101", "Engineering Hall
+Room 101"). It matches building codes or names, then the room number
+within that building.
+
+Each semester gets an AvailabilityTable: one row per room, with the week
+split into 5-minute slots and packed into 32 uint64 words. A bit is set
+when a class occupies that room and slot. Exams are dated, so a week's
+exams are OR-ed into a copy of the weekly table the first time that week
+is asked about.
+
+"Which rooms are free from T for N minutes" builds one slot mask and ANDs
+it with every row at once. Capacity, building and room type filters are
+vectorised the same way, so a query over every room is a few array
+operations.
+
+Saving a room or schedule, deleting a section or exam, or saving one with
+a different room or time bumps a generation counter in the shared cache.
+Every process drops its tables at its next check. The resolver is kept
+per process too, and rebuilt when a building or room changes.
+"""
+import re
+import threading
+import time as time_module
+from collections import OrderedDict
+from datetime import datetime, time, timedelta
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import Building, Room
+
+SLOT_MINUTES = 5
+WEEK_MINUTES = 7 * 24 * 60
+WEEK_SLOTS = WEEK_MINUTES // SLOT_MINUTES
+WORDS = -(-WEEK_SLOTS // 64)
+DAYS = {'MON': 0, 'TUE': 1, 'WED': 2, 'THU': 3, 'FRI': 4, 'SAT': 5, 'SUN': 6}
+EXAM_WEEKS_CACHED = 8
+GENERATION_KEY = 'navigation:availability:generation'
+RESOLVER_KEY = 'navigation:availability:resolver'
+RECHECK_SECONDS = 5
+ACADEMIC_TERMS = ((1, 'Spring'), (6, 'Summer'), (8, 'Fall'))
+TOKEN = re.compile(r'[A-Z0-9]+(?:[.\-/][A-Z0-9]+)*')
+CODE_AND_NUMBER = re.compile(r'^([A-Z]+)[\-]?(\d[A-Z0-9.\-]*)$')
+
+
+class RoomResolver:
+    """Matches free-text locations against every building and room, loaded once"""
+
+    def __init__(self):
+        buildings = list(Building.objects.values_list('id', 'code', 'name'))
+        self.by_code = {code.upper(): building_id for building_id, code, _ in buildings if code}
+        self.by_name = sorted(((name.upper(), building_id) for building_id, _, name in buildings if name),
+                              key=lambda item: -len(item[0]))
+        self.rooms = {}
+        by_number = {}
+        for room_id, building_id, number in Room.objects.values_list('id', 'building_id', 'number'):
+            self.rooms[(building_id, number.upper())] = room_id
+            by_number.setdefault(number.upper(), []).append(room_id)
+        self.unique_numbers = {number: ids[0] for number, ids in by_number.items() if len(ids) == 1}
+
+    def resolve(self, location):
+        """The id of the Room that ``location`` names, or None"""
+        text = (location or '').upper()
+        tokens = TOKEN.findall(text)
+        for token in list(tokens):
+            match = CODE_AND_NUMBER.match(token)
+            if match:
+                tokens.extend(match.groups())
+
+        buildings = [self.by_code[token] for token in tokens if token in self.by_code]
+        buildings += [building_id for name, building_id in self.by_name if name in text]
+        for building_id in buildings:
+            for token in tokens:
+                room_id = self.rooms.get((building_id, token))
+                if room_id is not None:
+                    return room_id
+        if not buildings:
+            # A room number that exists in only one building is unambiguous
+            for token in tokens:
+                if token in self.unique_numbers:
+                    return self.unique_numbers[token]
+        return None
+
+
+_resolver = {'resolver': None, 'generation': None}
+
+
+def resolve_room(location):
+    """The id of the Room ``location`` names, using a resolver shared until buildings or rooms change"""
+    generation = cache.get(RESOLVER_KEY)
+    resolver = _resolver['resolver']
+    if resolver is None or generation != _resolver['generation']:
+        resolver = RoomResolver()
+        _resolver.update(resolver=resolver, generation=generation)
+    return resolver.resolve(location)
+
+
+def link_locations(relink=False):
+    """Resolve the room of every section and exam without one; returns (sections, exams) linked"""
+    from academics.models import ClassSection, Exam
+
+    resolver = RoomResolver()
+    linked = []
+    for model in (ClassSection, Exam):
+        rows = model.objects.only('id', 'location', 'room')
+        if not relink:
+            rows = rows.filter(room__isnull=True)
+        changed = []
+        for row in rows.iterator(chunk_size=2000):
+            room_id = resolver.resolve(row.location)
+            if room_id is not None and room_id != row.room_id:
+                row.room_id = room_id
+                changed.append(row)
+        model.objects.bulk_update(changed, ['room'], batch_size=1000)
+        linked.append(len(changed))
+    invalidate_tables()
+    return tuple(linked)
+
+
+def semester_of(day):
+    """The ClassSection semester name for a date, such as Fall 2025, from settings.ACADEMIC_TERMS"""
+    terms = sorted(getattr(settings, 'ACADEMIC_TERMS', ACADEMIC_TERMS))
+    started = [name for first_month, name in terms if first_month <= day.month]
+    if started:
+        return f"{started[-1]} {day.year}"
+    # Before the first term of the year, the previous year's last term is still running
+    return f"{terms[-1][1]} {day.year - 1}"
+
+
+def _minute_of_week(moment):
+    local = timezone.localtime(moment)
+    return local.weekday() * 24 * 60 + local.hour * 60 + local.minute + local.second / 60
+
+
+def _week_start(moment):
+    local = timezone.localtime(moment)
+    monday = local.date() - timedelta(days=local.weekday())
+    return timezone.make_aware(datetime.combine(monday, time.min))
+
+
+def _set_slots(bits, start_minute, end_minute):
+    """Mark the slots overlapping [start_minute, end_minute) of the week"""
+    first = max(int(start_minute // SLOT_MINUTES), 0)
+    last = min(int(-(-end_minute // SLOT_MINUTES)), WEEK_SLOTS)
+    if last > first:
+        bits[..., first:last] = True
+
+
+def _pack(bits):
+    # Table rows and masks are packed the same way, so AND-ing them lines up slot for slot
+    return np.packbits(bits, axis=-1, bitorder='little').view(np.uint64)
+
+
+class AvailabilityTable:
+    """Weekly occupancy bitmaps for every room in one semester"""
+
+    def __init__(self, rooms, schedules):
+        # rooms: [(id, building_id, building_name, number, floor, room_type, capacity)],
+        # schedules: [(room_id, day, start_time, end_time)]
+        self.rooms = [
+            {'id': room_id, 'building_id': building_id, 'building': building_name, 'number': number,
+             'floor': floor, 'room_type': room_type, 'capacity': capacity}
+            for room_id, building_id, building_name, number, floor, room_type, capacity in rooms
+        ]
+        self.room_ids = np.array([room['id'] for room in self.rooms], dtype=np.int64)
+        self.building_ids = np.array([room['building_id'] for room in self.rooms], dtype=np.int64)
+        self.capacities = np.array([room['capacity'] or 0 for room in self.rooms], dtype=np.int64)
+        self.room_types = np.array([room['room_type'].lower() for room in self.rooms], dtype=object)
+        self.index = {room_id: i for i, room_id in enumerate(self.room_ids.tolist())}
+
+        bits = np.zeros((len(self.rooms), WORDS * 64), dtype=bool)
+        for room_id, day, start_time, end_time in schedules:
+            i, weekday = self.index.get(room_id), DAYS.get(day)
+            if i is None or weekday is None:
+                continue
+            offset = weekday * 24 * 60
+            _set_slots(bits[i], offset + start_time.hour * 60 + start_time.minute,
+                       offset + end_time.hour * 60 + end_time.minute)
+        self.weekly = _pack(bits)
+        self._weeks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def week(self, week_start):
+        """The weekly table with that week's exams added"""
+        table = self._weeks.get(week_start)
+        if table is not None:
+            return table
+
+        from academics.models import Exam
+
+        table = self.weekly.copy()
+        exams = Exam.objects.filter(
+            room__isnull=False, date__lt=week_start + timedelta(days=7), date__gte=week_start - timedelta(days=1),
+        ).values_list('room_id', 'date', 'duration_minutes')
+        for room_id, start, minutes in exams:
+            i = self.index.get(room_id)
+            if i is None:
+                continue
+            bits = np.zeros(WORDS * 64, dtype=bool)
+            offset = (start - week_start).total_seconds() / 60
+            _set_slots(bits, offset, offset + minutes)
+            table[i] |= _pack(bits)
+        with self._lock:
+            self._weeks[week_start] = table
+            while len(self._weeks) > EXAM_WEEKS_CACHED:
+                self._weeks.popitem(last=False)
+        return table
+
+    def busy(self, start, end):
+        """Per-room booleans: occupied at any point in [start, end)"""
+        busy = np.zeros(len(self.rooms), dtype=bool)
+        cursor = start
+        while cursor < end:
+            week_start = _week_start(cursor)
+            week_end = week_start + timedelta(days=7)
+            chunk_end = min(end, week_end)
+            bits = np.zeros(WORDS * 64, dtype=bool)
+            _set_slots(bits, _minute_of_week(cursor),
+                       WEEK_MINUTES if chunk_end == week_end else _minute_of_week(chunk_end))
+            mask = _pack(bits)
+            words = np.flatnonzero(mask)
+            if len(words):
+                busy |= (self.week(week_start)[:, words] & mask[words]).any(axis=1)
+            cursor = chunk_end
+        return busy
+
+    def free(self, start, end, min_capacity=None, building_id=None, room_type=None):
+        """Rooms unoccupied for all of [start, end) that match the filters"""
+        free = ~self.busy(start, end)
+        if min_capacity:
+            free &= self.capacities >= min_capacity
+        if building_id:
+            free &= self.building_ids == building_id
+        if room_type:
+            free &= self.room_types == room_type.lower()
+        return [self.rooms[i] for i in np.flatnonzero(free)]
+
+
+def build_table(semester):
+    from academics.models import ClassSchedule
+
+    rooms = Room.objects.order_by('building__name', 'number').values_list(
+        'id', 'building_id', 'building__name', 'number', 'floor', 'room_type', 'capacity')
+    schedules = ClassSchedule.objects.filter(
+        class_section__semester=semester, class_section__room__isnull=False,
+    ).values_list('class_section__room_id', 'day', 'start_time', 'end_time')
+    return AvailabilityTable(list(rooms), list(schedules))
+
+
+_state = {'tables': {}, 'generation': None, 'checked_at': 0}
+_lock = threading.Lock()
+
+
+def get_table(semester):
+    """A semester's availability table, rebuilt when any process has changed its inputs"""
+    if time_module.monotonic() - _state['checked_at'] > RECHECK_SECONDS:
+        generation = cache.get(GENERATION_KEY)
+        _state['checked_at'] = time_module.monotonic()
+        if generation != _state['generation']:
+            _state.update(tables={}, generation=generation)
+    table = _state['tables'].get(semester)
+    if table is None:
+        with _lock:
+            table = _state['tables'].get(semester)
+            if table is None:
+                table = _state['tables'][semester] = build_table(semester)
+    return table
+
+
+def invalidate_tables(*args, **kwargs):
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 1, None)
+    _state['tables'] = {}
+
+
+def invalidate_resolver(*args, **kwargs):
+    try:
+        cache.incr(RESOLVER_KEY)
+    except ValueError:
+        cache.set(RESOLVER_KEY, 1, None)
+    _resolver['resolver'] = None
+
+
+def _schedule_saved(sender, instance, raw=False, **kwargs):
+    # Sections and exams note in save() whether anything the tables use changed
+    if getattr(instance, 'availability_changed', True):
+        invalidate_tables()
+
+
+def free_rooms(at=None, minutes=30, min_capacity=None, building_id=None, room_type=None, semester=None):
+    """Rooms free from ``at`` (default now) for ``minutes``, smallest adequate capacity first"""
+    at = at or timezone.now()
+    table = get_table(semester or semester_of(timezone.localtime(at).date()))
+    rooms = table.free(at, at + timedelta(minutes=minutes), min_capacity, building_id, room_type)
+    return sorted(rooms, key=lambda room: (room['capacity'] or 0, room['building'], room['number']))
+
+
+def connect_signals():
+    from django.db.models.signals import post_delete, post_save
+
+    from academics.models import ClassSchedule, ClassSection, Exam
+
+    for model in (Room, ClassSection, ClassSchedule, Exam):
+        post_save.connect(_schedule_saved, sender=model, dispatch_uid=f'availability.save.{model.__name__}')
+        post_delete.connect(invalidate_tables, sender=model, dispatch_uid=f'availability.delete.{model.__name__}')
+    for model in (Building, Room):
+        post_save.connect(invalidate_resolver, sender=model, dispatch_uid=f'availability.resolver.save.{model.__name__}')
+        post_delete.connect(invalidate_resolver, sender=model,
+                            dispatch_uid=f'availability.resolver.delete.{model.__name__}')
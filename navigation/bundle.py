@@ -0,0 +1,282 @@
+# navigation/bundle.py
+"""
+Offline map bundles for the mobile client.
+
+A bundle holds every building, room, AR marker, bus stop and active route
+in one file:
+
+    magic b'CMB1' | uint32 header length | JSON header | int32 coordinates
+
+The header has a ``strings`` table and, per table, parallel ``columns``
+ordered by id. Text columns hold indexes into ``strings``, so repeated
+values (room types, marker types, addresses) are stored once. Point
+columns hold an index into the coordinate array. Line columns hold
+``[first point, point count]``. The coordinate array is little-endian
+int32 ``lat, lon`` pairs in ``1 / header["scale"]`` degrees.
+
+A bundle's version is a hash of its uncompressed bytes, so republishing
+unchanged data is a no-op. A delta bundle has the same layout, with
+``base`` naming the version it applies to. Its tables hold only added or
+changed rows, plus a ``removed`` list of ids per table. The last
+KEEP_VERSIONS bundles are stored, so clients that far behind still get a
+delta; older clients get the full bundle. Publishing data that matches an
+older stored bundle, e.g. after an edit is reverted, makes that bundle the
+latest again.
+
+Saving or deleting anything that goes into a bundle sets a dirty flag in
+the shared cache once the transaction commits, so the next request in
+any process republishes before answering.
+
+Responses are gzip-compressed, or brotli-compressed when the ``brotli``
+package is installed and the client accepts it.
+"""
+import gzip
+import hashlib
+import json
+import struct
+
+import numpy as np
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from transportation.models import BusRoute, BusStop, RouteStop
+
+from .models import ARMarker, Building, MapBundle, Room
+
+try:
+    import brotli
+except ImportError:  # Optional; gzip only without it
+    brotli = None
+
+MAGIC = b'CMB1'
+HEADER = struct.Struct('<4sI')
+FORMAT = 1
+COORD_SCALE = 10 ** 6  # About 0.1 m
+KEEP_VERSIONS = 20
+DIRTY_KEY = 'navigation:bundle:dirty'
+PAYLOAD_KEY = 'navigation:bundle:{}:{}:{}'
+PAYLOAD_TIMEOUT = 24 * 60 * 60
+
+TABLES = (
+    ('buildings', (('id', 'int'), ('name', 'str'), ('code', 'str'), ('floors', 'int'),
+                   ('description', 'str'), ('image', 'str'), ('location', 'point'))),
+    ('rooms', (('id', 'int'), ('building', 'int'), ('number', 'str'), ('floor', 'int'),
+               ('room_type', 'str'), ('capacity', 'int'))),
+    ('markers', (('id', 'int'), ('name', 'str'), ('building', 'int'), ('marker_type', 'str'),
+                 ('content', 'str'), ('image', 'str'), ('location', 'point'))),
+    ('stops', (('id', 'int'), ('name', 'str'), ('address', 'str'), ('location', 'point'))),
+    ('routes', (('id', 'int'), ('name', 'str'), ('color', 'str'), ('stops', 'ints'), ('path', 'line'))),
+)
+
+
+def _point(point):
+    return round(point.y * COORD_SCALE), round(point.x * COORD_SCALE)
+
+
+def _image(image):
+    return image.url if image else ''
+
+
+def collect():
+    """{table: {id: row tuple}} for everything that goes into a bundle"""
+    route_stops = {}
+    stop_points = {}
+    for route_id, stop_id, location in (RouteStop.objects.filter(route__active=True)
+                                        .order_by('route_id', 'order')
+                                        .values_list('route_id', 'stop_id', 'stop__location')):
+        route_stops.setdefault(route_id, []).append(stop_id)
+        stop_points.setdefault(route_id, []).append(_point(location))
+
+    routes = {}
+    for route in BusRoute.objects.filter(active=True).only('id', 'name', 'color_code', 'path'):
+        if route.path is not None:
+            path = tuple((round(lat * COORD_SCALE), round(lon * COORD_SCALE)) for lon, lat in route.path.coords)
+        else:
+            path = tuple(stop_points.get(route.id, ()))
+        routes[route.id] = (route.id, route.name, route.color_code, tuple(route_stops.get(route.id, ())), path)
+
+    return {
+        'buildings': {b.id: (b.id, b.name, b.code, b.floors, b.description, _image(b.image), _point(b.location))
+                      for b in Building.objects.all()},
+        'rooms': {r.id: (r.id, r.building_id, r.number, r.floor, r.room_type, r.capacity)
+                  for r in Room.objects.all()},
+        'markers': {m.id: (m.id, m.name, m.building_id, m.marker_type, m.content, _image(m.image),
+                           _point(m.location))
+                    for m in ARMarker.objects.all()},
+        'stops': {s.id: (s.id, s.name, s.address, _point(s.location)) for s in BusStop.objects.all()},
+        'routes': routes,
+    }
+
+
+def encode(tables, base=None, removed=None):
+    """Pack ``{table: {id: row}}`` into bundle bytes; ``base``/``removed`` make it a delta"""
+    strings, string_index = [], {}
+    coords = []
+
+    def text(value):
+        index = string_index.get(value)
+        if index is None:
+            index = string_index[value] = len(strings)
+            strings.append(value)
+        return index
+
+    def points(values):
+        first = len(coords) // 2
+        for lat, lon in values:
+            coords.append(lat)
+            coords.append(lon)
+        return first
+
+    header_tables = {}
+    for name, fields in TABLES:
+        rows = [tables[name][key] for key in sorted(tables.get(name, ()))]
+        columns = {}
+        for position, (field, kind) in enumerate(fields):
+            values = [row[position] for row in rows]
+            if kind == 'str':
+                columns[field] = [text(value) for value in values]
+            elif kind == 'point':
+                columns[field] = [points((value,)) for value in values]
+            elif kind == 'line':
+                columns[field] = [[points(value), len(value)] for value in values]
+            else:
+                columns[field] = [list(value) if kind == 'ints' else value for value in values]
+        header_tables[name] = {'count': len(rows), 'columns': columns}
+        if removed is not None:
+            header_tables[name]['removed'] = sorted(removed.get(name, ()))
+
+    header = json.dumps(
+        {'format': FORMAT, 'base': base, 'scale': COORD_SCALE, 'strings': strings, 'tables': header_tables},
+        separators=(',', ':'), ensure_ascii=False,
+    ).encode()
+    return HEADER.pack(MAGIC, len(header)) + header + np.asarray(coords, dtype='<i4').tobytes()
+
+
+def decode(data):
+    """(header, {table: {id: row}}) from bundle bytes; the inverse of ``encode``"""
+    magic, length = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a map bundle")
+    header = json.loads(bytes(data[HEADER.size:HEADER.size + length]))
+    coords = np.frombuffer(data, dtype='<i4', offset=HEADER.size + length).reshape(-1, 2).tolist()
+    strings = header['strings']
+
+    tables = {}
+    for name, fields in TABLES:
+        table = header['tables'][name]
+        columns = []
+        for field, kind in fields:
+            values = table['columns'][field]
+            if kind == 'str':
+                values = [strings[index] for index in values]
+            elif kind == 'point':
+                values = [tuple(coords[index]) for index in values]
+            elif kind == 'line':
+                values = [tuple(tuple(point) for point in coords[first:first + count])
+                          for first, count in values]
+            elif kind == 'ints':
+                values = [tuple(value) for value in values]
+            columns.append(values)
+        tables[name] = {row[0]: row for row in zip(*columns)}
+    return header, tables
+
+
+def version_of(data):
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def diff(old, new):
+    """(changed rows, removed ids) turning ``old`` tables into ``new``"""
+    changed, removed = {}, {}
+    for name, _ in TABLES:
+        before, after = old.get(name, {}), new.get(name, {})
+        changed[name] = {key: row for key, row in after.items() if before.get(key) != row}
+        removed[name] = before.keys() - after.keys()
+    return changed, removed
+
+
+def publish(keep=KEEP_VERSIONS):
+    """Store a bundle of the current data unless it is unchanged; returns the latest MapBundle"""
+    cache.delete(DIRTY_KEY)
+    data = encode(collect())
+    version = version_of(data)
+    bundle = MapBundle.objects.filter(version=version).only('id', 'version', 'size', 'created_at').first()
+    if bundle is not None:
+        newest = MapBundle.objects.order_by('-created_at', '-id').values_list('id', flat=True).first()
+        if newest != bundle.id:
+            # The data went back to an older bundle; it is the latest again
+            bundle.created_at = timezone.now()
+            MapBundle.objects.filter(pk=bundle.pk).update(created_at=bundle.created_at)
+        return bundle
+
+    try:
+        with transaction.atomic():
+            bundle = MapBundle.objects.create(version=version, data=data, size=len(data))
+    except IntegrityError:  # Another process published the same data
+        return MapBundle.objects.only('id', 'version', 'size', 'created_at').get(version=version)
+    stale = MapBundle.objects.order_by('-created_at', '-id').values_list('id', flat=True)[keep:]
+    MapBundle.objects.filter(id__in=list(stale)).delete()
+    return bundle
+
+
+def latest():
+    """The newest MapBundle (without its data), publishing first if the inputs changed"""
+    if cache.get(DIRTY_KEY):
+        return publish()
+    bundle = MapBundle.objects.only('id', 'version', 'size', 'created_at').order_by('-created_at', '-id').first()
+    return bundle if bundle is not None else publish()
+
+
+def best_encoding(accept_encoding):
+    """The best encoding we can produce for an Accept-Encoding header"""
+    accepted = {part.split(';')[0].strip() for part in (accept_encoding or '').split(',')}
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return 'identity'
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=11)
+    if encoding == 'gzip':
+        return gzip.compress(data, 9, mtime=0)
+    return data
+
+
+def payload(version, base=None, encoding='identity'):
+    """Compressed full bundle, or delta from ``base``; None when a version isn't stored"""
+    key = PAYLOAD_KEY.format(version, base or 'full', encoding)
+    body = cache.get(key)
+    if body is not None:
+        return body
+
+    bundles = {b.version: bytes(b.data) for b in MapBundle.objects.filter(version__in=[version, base])}
+    if version not in bundles or (base and base not in bundles):
+        return None
+    data = bundles[version]
+    if base:
+        changed, removed = diff(decode(bundles[base])[1], decode(data)[1])
+        data = encode(changed, base=base, removed=removed)
+    body = compress(data, encoding)
+    cache.set(key, body, PAYLOAD_TIMEOUT)
+    return body
+
+
+def _mark_dirty():
+    cache.set(DIRTY_KEY, True, None)
+
+
+def _changed(sender, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(_mark_dirty)
+
+
+def connect_signals():
+    from django.db.models.signals import post_delete, post_save
+
+    for model in (Building, Room, ARMarker, BusStop, BusRoute, RouteStop):
+        post_save.connect(_changed, sender=model, dispatch_uid=f'bundle.save.{model.__name__}')
+        post_delete.connect(_changed, sender=model, dispatch_uid=f'bundle.delete.{model.__name__}')
@@ -0,0 +1,246 @@
+# navigation/hours.py
+"""
+Opening hours for buildings and cafeterias.
+
+``Building.hours_of_operation`` is JSON keyed by weekday (``"mon"`` or
+``"monday"``), ``"daily"`` for every day, and ``"holidays"`` for dated
+overrides. Each value is ``"closed"``, ``"24h"``, a ``"HH:MM-HH:MM"``
+span or a list of spans:
+
+    {"daily": "08:00-22:00", "fri": ["08:00-12:00", "14:00-02:00"],
+     "sun": "closed", "holidays": {"2026-12-25": "closed"}}
+
+A span whose end is not after its start runs past midnight. A cafeteria's
+opening and closing times compile to the same daily span. CAMPUS_HOLIDAYS
+in settings applies to every place without its own override for that
+date.
+
+Hours compile once into per-weekday (start, end) minute intervals. An end
+past 1440 spills into the next morning. HoursTable stacks every place's
+intervals into numpy arrays per weekday, so "which places are open now"
+is two vectorised comparisons: today's intervals and yesterday's
+overnight spill. Only the few places with an override on those dates are
+checked one by one. Buildings with no hours recorded (an empty spec) are
+left out of the table rather than compiled as always closed. Tables are
+cached per process and dropped when a Building or Cafeteria is saved,
+through a generation counter in the shared cache.
+"""
+import logging
+import threading
+import time as time_module
+from datetime import date, timedelta
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import Building
+
+logger = logging.getLogger(__name__)
+
+DAY_MINUTES = 24 * 60
+WEEKDAYS = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+WEEKDAY_NAMES = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+GENERATION_KEY = 'navigation:hours:generation'
+RECHECK_SECONDS = 5
+
+
+def _minutes(text):
+    hours, minutes = text.strip().split(':')
+    value = int(hours) * 60 + int(minutes)
+    if not 0 <= value <= DAY_MINUTES:
+        raise ValueError(f"Invalid time {text!r}")
+    return value
+
+
+def _span(start, end):
+    # An end at or before the start means the span runs past midnight
+    return (start, end if end > start else end + DAY_MINUTES)
+
+
+def parse_spans(value):
+    """Day intervals [(start, end), ...] from "closed", "24h", "HH:MM-HH:MM" or a list of those"""
+    if value in (None, '', 'closed'):
+        return []
+    if value in ('24h', 'open'):
+        return [(0, DAY_MINUTES)]
+    if isinstance(value, str):
+        try:
+            start, end = value.split('-')
+        except ValueError:
+            raise ValueError(f"Invalid span {value!r}")
+        return [_span(_minutes(start), _minutes(end))]
+    spans = []
+    for item in value:
+        if isinstance(item, (list, tuple)):
+            spans.append(_span(_minutes(item[0]), _minutes(item[1])))
+        else:
+            spans.extend(parse_spans(item))
+    return sorted(spans)
+
+
+class Hours:
+    """Compiled opening hours for one place"""
+
+    def __init__(self, weekly, overrides=None):
+        self.weekly = weekly  # Seven lists of (start, end) day-minute intervals, Monday first
+        self.overrides = overrides or {}  # date -> intervals, replacing that day's weekly hours
+
+    @classmethod
+    def compile(cls, spec):
+        spec = {str(key).lower(): value for key, value in (spec or {}).items()}
+        default = parse_spans(spec['daily']) if 'daily' in spec else []
+        weekly = []
+        for day, full_name in zip(WEEKDAYS, WEEKDAY_NAMES):
+            key = day if day in spec else full_name
+            weekly.append(parse_spans(spec[key]) if key in spec else default)
+        overrides = {date.fromisoformat(day): parse_spans(value)
+                     for day, value in (spec.get('holidays') or {}).items()}
+        return cls(weekly, overrides)
+
+    @classmethod
+    def daily(cls, opening_time, closing_time):
+        start = opening_time.hour * 60 + opening_time.minute
+        end = closing_time.hour * 60 + closing_time.minute
+        return cls([[_span(start, end)]] * 7)
+
+    def intervals_on(self, day, holidays=None):
+        if day in self.overrides:
+            return self.overrides[day]
+        if holidays and day in holidays:
+            return holidays[day]
+        return self.weekly[day.weekday()]
+
+    def is_open(self, moment=None, holidays=None):
+        local = timezone.localtime(moment or timezone.now())
+        minute = local.hour * 60 + local.minute
+        if any(start <= minute < end for start, end in self.intervals_on(local.date(), holidays)):
+            return True
+        yesterday = local.date() - timedelta(days=1)
+        return any(start <= minute + DAY_MINUTES < end for start, end in self.intervals_on(yesterday, holidays))
+
+
+def campus_holidays():
+    """{date: intervals} from settings.CAMPUS_HOLIDAYS"""
+    return {date.fromisoformat(day): parse_spans(value)
+            for day, value in getattr(settings, 'CAMPUS_HOLIDAYS', {}).items()}
+
+
+class HoursTable:
+    """Every place's weekly intervals stacked into arrays for bulk lookups"""
+
+    def __init__(self, hours_by_id, holidays=None):
+        self.hours = hours_by_id
+        self.holidays = holidays or {}
+        self.ids = np.array(list(hours_by_id), dtype=np.int64)
+        self.days = []
+        for weekday in range(7):
+            owners, starts, ends = [], [], []
+            for index, hours in enumerate(hours_by_id.values()):
+                for start, end in hours.weekly[weekday]:
+                    owners.append(index)
+                    starts.append(start)
+                    ends.append(end)
+            self.days.append((np.array(owners, dtype=np.int64), np.array(starts, dtype=np.int32),
+                              np.array(ends, dtype=np.int32)))
+        self.overridden = {}  # date -> indexes of places whose hours that day aren't the weekly ones
+        for index, hours in enumerate(hours_by_id.values()):
+            for day in hours.overrides:
+                self.overridden.setdefault(day, set()).add(index)
+
+    def _weekly_open(self, day, minute):
+        owners, starts, ends = self.days[day.weekday()]
+        return owners[(starts <= minute) & (minute < ends)]
+
+    def open_ids(self, moment=None):
+        """Ids of the places open at ``moment`` (default now)"""
+        local = timezone.localtime(moment or timezone.now())
+        today, minute = local.date(), local.hour * 60 + local.minute
+        yesterday = today - timedelta(days=1)
+
+        # Campus holidays replace everyone's weekly hours, so those days go place by place
+        if today in self.holidays or yesterday in self.holidays:
+            return {place_id for place_id, hours in self.hours.items() if hours.is_open(local, self.holidays)}
+
+        special = self.overridden.get(today, set()) | self.overridden.get(yesterday, set())
+        open_mask = np.zeros(len(self.ids), dtype=bool)
+        open_mask[self._weekly_open(today, minute)] = True
+        open_mask[self._weekly_open(yesterday, minute + DAY_MINUTES)] = True
+        if special:
+            indexes = np.fromiter(special, dtype=np.int64)
+            ids = self.ids[indexes].tolist()
+            open_mask[indexes] = [self.hours[place_id].is_open(local, self.holidays) for place_id in ids]
+        return set(self.ids[open_mask].tolist())
+
+    def is_open(self, place_id, moment=None):
+        hours = self.hours.get(place_id)
+        return hours is not None and hours.is_open(moment, self.holidays)
+
+
+def _compile_buildings():
+    compiled = {}
+    for building_id, spec in Building.objects.values_list('id', 'hours_of_operation'):
+        if not spec:
+            continue  # Hours unknown: left out, so the building is never hidden as closed
+        try:
+            compiled[building_id] = Hours.compile(spec)
+        except (ValueError, TypeError, AttributeError, IndexError):
+            logger.warning("Building %s has invalid hours_of_operation; treating it as closed", building_id)
+            compiled[building_id] = Hours([[]] * 7)
+    return compiled
+
+
+def _compile_cafeterias():
+    from cafeteria.models import Cafeteria
+
+    return {cafeteria_id: Hours.daily(opening, closing) for cafeteria_id, opening, closing in
+            Cafeteria.objects.values_list('id', 'opening_time', 'closing_time')}
+
+
+COMPILERS = {'building': _compile_buildings, 'cafeteria': _compile_cafeterias}
+
+_state = {'tables': {}, 'generation': None, 'checked_at': 0}
+_lock = threading.Lock()
+
+
+def get_table(kind):
+    """The hours table for 'building' or 'cafeteria', rebuilt when any process has changed its inputs"""
+    if time_module.monotonic() - _state['checked_at'] > RECHECK_SECONDS:
+        generation = cache.get(GENERATION_KEY)
+        _state['checked_at'] = time_module.monotonic()
+        if generation != _state['generation']:
+            _state.update(tables={}, generation=generation)
+    table = _state['tables'].get(kind)
+    if table is None:
+        with _lock:
+            table = _state['tables'].get(kind)
+            if table is None:
+                table = _state['tables'][kind] = HoursTable(COMPILERS[kind](), campus_holidays())
+    return table
+
+
+def invalidate_tables(*args, **kwargs):
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 1, None)
+    _state['tables'] = {}
+
+
+def open_buildings(moment=None):
+    return get_table('building').open_ids(moment)
+
+
+def open_cafeterias(moment=None):
+    return get_table('cafeteria').open_ids(moment)
+
+
+def connect_signals():
+    from django.db.models.signals import post_delete, post_save
+
+    from cafeteria.models import Cafeteria
+
+    for model in (Building, Cafeteria):
+        post_save.connect(invalidate_tables, sender=model, dispatch_uid=f'hours.save.{model.__name__}')
+        post_delete.connect(invalidate_tables, sender=model, dispatch_uid=f'hours.delete.{model.__name__}')
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from navigation import bundle
+from navigation.models import MapBundle
+
+
+class Command(BaseCommand):
+    help = "Publish an offline map bundle of the current campus data and report its sizes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep', type=int, default=bundle.KEEP_VERSIONS,
+                            help="Number of bundle versions to keep for deltas")
+
+    def handle(self, *args, **options):
+        previous = MapBundle.objects.order_by('-created_at', '-id').values_list('version', flat=True).first()
+        latest = bundle.publish(keep=options['keep'])
+        if latest.version == previous:
+            self.stdout.write(f"Bundle {latest.version} is unchanged")
+            return
+
+        encodings = ['identity', 'gzip'] + (['br'] if bundle.brotli is not None else [])
+        sizes = ', '.join(f"{encoding} {len(bundle.payload(latest.version, encoding=encoding))} B"
+                          for encoding in encodings)
+        self.stdout.write(self.style.SUCCESS(f"Published bundle {latest.version}: {sizes}"))
+        if previous and MapBundle.objects.filter(version=previous).exists():
+            delta = bundle.payload(latest.version, base=previous, encoding='gzip')
+            self.stdout.write(f"Delta from {previous}: gzip {len(delta)} B")
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from navigation.availability import link_locations
+
+
+class Command(BaseCommand):
+    help = "Link class sections and exams to rooms by parsing their location text"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--relink', action='store_true',
+                            help="Re-resolve rows that already have a room as well")
+
+    def handle(self, *args, **options):
+        sections, exams = link_locations(relink=options['relink'])
+        self.stdout.write(self.style.SUCCESS(f"Linked {sections} class sections and {exams} exams to rooms"))
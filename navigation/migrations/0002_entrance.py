@@ -0,0 +1,26 @@
+# Generated by Django 5.1.6 on 2026-10-19 14:23
+
+import django.contrib.gis.db.models.fields
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('navigation', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Entrance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(blank=True, max_length=100)),
+                ('location', django.contrib.gis.db.models.fields.PointField(srid=4326)),
+                ('floor', models.PositiveIntegerField(default=1)),
+                ('accessible', models.BooleanField(default=True)),
+                ('building', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entrances', to='navigation.building')),
+            ],
+        ),
+    ]
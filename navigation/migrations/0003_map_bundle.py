@@ -0,0 +1,26 @@
+# Generated by Django 5.1.6 on 2026-10-19 14:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('navigation', '0002_entrance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MapBundle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.CharField(max_length=16, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('data', models.BinaryField()),
+                ('size', models.PositiveIntegerField()),
+            ],
+            options={
+                'get_latest_by': 'created_at',
+            },
+        ),
+    ]
@@ -26,4 +26,24 @@ class ARMarker(models.Model):
     building = models.ForeignKey(Building, on_delete=models.CASCADE, related_name='markers', null=True, blank=True)
     marker_type = models.CharField(max_length=50)  # QR code, image marker, etc.
     content = models.TextField()  # Information to display when the marker is scanned
-    image = models.ImageField(upload_to='ar_markers/', blank=True, null=True)
\ No newline at end of file
+    image = models.ImageField(upload_to='ar_markers/', blank=True, null=True)
+
+
+class Entrance(models.Model):
+    """A door into a building; the walking graph enters and leaves buildings through these"""
+    building = models.ForeignKey(Building, on_delete=models.CASCADE, related_name='entrances')
+    name = models.CharField(max_length=100, blank=True)
+    location = gis_models.PointField()
+    floor = models.PositiveIntegerField(default=1)
+    accessible = models.BooleanField(default=True)  # Step-free access
+
+
+class MapBundle(models.Model):
+    """A published offline map bundle; ``version`` is a hash of its contents"""
+    version = models.CharField(max_length=16, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    data = models.BinaryField()  # Uncompressed; see navigation.bundle for the format
+    size = models.PositiveIntegerField()
+
+    class Meta:
+        get_latest_by = 'created_at'
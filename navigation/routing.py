@@ -0,0 +1,307 @@
+# navigation/routing.py
+"""
+Walking routes across campus.
+
+The graph has one node per building hub, entrance and AR marker.
+Entrances connect to their building's hub with an indoor edge. Outdoor
+nodes (entrances, markers and hubs of buildings without entrances) are
+linked to every other outdoor node within LINK_RADIUS_M, plus their
+LINK_NEAREST nearest neighbours so the graph stays connected. Edge costs
+are walking seconds.
+
+After a build, a Dijkstra run from every building hub fills a
+building-to-building table of travel times and predecessors. Room-to-room
+routes then need no search at all. Routes from an arbitrary GPS fix use
+A*, with the straight-line walking time as its heuristic.
+
+The graph lives in process memory. Saving a Building, Entrance or ARMarker
+bumps a generation counter in the shared cache once the save commits, so
+every process rebuilds on its next check.
+"""
+import heapq
+import math
+import threading
+import time as time_module
+
+import numpy as np
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import ARMarker, Building, Entrance, Room
+
+WALK_SPEED_MPS = 1.3
+LINK_RADIUS_M = 120
+LINK_NEAREST = 4
+START_LINKS = 3  # Outdoor nodes a GPS fix is connected to
+FLOOR_SECONDS = 20  # Stairs or lift, per floor
+ROOM_SECONDS = 30  # From the floor landing to a room door
+GENERATION_KEY = 'navigation:graph:generation'
+RECHECK_SECONDS = 5
+EARTH_RADIUS_M = 6371008.8
+
+
+class NoRoute(Exception):
+    """The destination can't be reached on the walking graph"""
+
+
+def _distance_m(lat1, lon1, lat2, lon2):
+    """Equirectangular distance; within a few cm of haversine at campus scale"""
+    x = math.radians(lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = math.radians(lat2 - lat1)
+    return EARTH_RADIUS_M * math.hypot(x, y)
+
+
+class WalkingGraph:
+    """Nodes, adjacency lists and precomputed building-to-building travel times"""
+
+    def __init__(self, buildings, entrances, markers):
+        # buildings: [(id, name, lat, lon)], entrances: [(id, building_id, name, lat, lon, floor)],
+        # markers: [(id, name, lat, lon)]
+        self.kind, self.ref, self.name, self.lat, self.lon = [], [], [], [], []
+        self.hub = {}
+        self.ground_floor = {}
+        outdoor = []
+
+        for building_id, name, lat, lon in buildings:
+            self.hub[building_id] = self._add('building', building_id, name, lat, lon)
+        with_entrances = set()
+        for entrance_id, building_id, name, lat, lon, floor in entrances:
+            if building_id not in self.hub:
+                continue
+            node = self._add('entrance', entrance_id, name, lat, lon)
+            outdoor.append(node)
+            with_entrances.add(building_id)
+            self.ground_floor[building_id] = min(floor, self.ground_floor.get(building_id, floor))
+        outdoor.extend(node for building_id, node in self.hub.items() if building_id not in with_entrances)
+        for marker_id, name, lat, lon in markers:
+            outdoor.append(self._add('marker', marker_id, name, lat, lon))
+
+        self.adjacency = [[] for _ in self.kind]
+        self._link_entrances(entrances)
+        self._link_outdoor(outdoor)
+        self.outdoor = outdoor
+        self._precompute_buildings()
+
+    def _add(self, kind, ref, name, lat, lon):
+        self.kind.append(kind)
+        self.ref.append(ref)
+        self.name.append(name)
+        self.lat.append(lat)
+        self.lon.append(lon)
+        return len(self.kind) - 1
+
+    def _edge(self, a, b):
+        seconds = _distance_m(self.lat[a], self.lon[a], self.lat[b], self.lon[b]) / WALK_SPEED_MPS
+        self.adjacency[a].append((b, seconds))
+        self.adjacency[b].append((a, seconds))
+
+    def _link_entrances(self, entrances):
+        entrance_nodes = {(self.kind[node], self.ref[node]): node for node in range(len(self.kind))}
+        for entrance_id, building_id, *_ in entrances:
+            if building_id in self.hub:
+                self._edge(entrance_nodes[('entrance', entrance_id)], self.hub[building_id])
+
+    def _link_outdoor(self, outdoor):
+        if len(outdoor) < 2:
+            return
+        lats = np.radians([self.lat[node] for node in outdoor])
+        lons = np.radians([self.lon[node] for node in outdoor])
+        linked = set()
+        for i, node in enumerate(outdoor):
+            x = (lons - lons[i]) * np.cos((lats + lats[i]) / 2)
+            distances = EARTH_RADIUS_M * np.hypot(x, lats - lats[i])
+            distances[i] = np.inf
+            nearest = np.argsort(distances)[:LINK_NEAREST]
+            within = np.flatnonzero(distances <= LINK_RADIUS_M)
+            for j in set(nearest.tolist()) | set(within.tolist()):
+                pair = (min(i, j), max(i, j))
+                if pair not in linked:
+                    linked.add(pair)
+                    self._edge(node, outdoor[j])
+
+    def _dijkstra(self, source):
+        dist = [math.inf] * len(self.kind)
+        pred = [-1] * len(self.kind)
+        dist[source] = 0
+        heap = [(0, source)]
+        while heap:
+            d, node = heapq.heappop(heap)
+            if d > dist[node]:
+                continue
+            for other, seconds in self.adjacency[node]:
+                nd = d + seconds
+                if nd < dist[other]:
+                    dist[other] = nd
+                    pred[other] = node
+                    heapq.heappush(heap, (nd, other))
+        return dist, pred
+
+    def _precompute_buildings(self):
+        """All-pairs travel times between building hubs, with predecessor rows for the paths"""
+        self.building_ids = sorted(self.hub)
+        self.building_index = {building_id: i for i, building_id in enumerate(self.building_ids)}
+        hubs = [self.hub[building_id] for building_id in self.building_ids]
+        self.building_seconds = np.full((len(hubs), len(hubs)), np.inf)
+        self.building_pred = []
+        for i, hub in enumerate(hubs):
+            dist, pred = self._dijkstra(hub)
+            self.building_seconds[i] = [dist[other] for other in hubs]
+            self.building_pred.append(np.array(pred, dtype=np.int32))
+
+    def building_path(self, from_building, to_building):
+        """(seconds, [node, ...]) between two building hubs from the precomputed table"""
+        i = self.building_index[from_building]
+        seconds = float(self.building_seconds[i, self.building_index[to_building]])
+        if math.isinf(seconds):
+            raise NoRoute
+        pred = self.building_pred[i]
+        path = [self.hub[to_building]]
+        while path[-1] != self.hub[from_building]:
+            path.append(int(pred[path[-1]]))
+        return seconds, path[::-1]
+
+    def astar(self, lat, lon, to_building):
+        """(seconds, [node, ...]) from a GPS fix to a building hub"""
+        target = self.hub[to_building]
+        target_lat, target_lon = self.lat[target], self.lon[target]
+
+        def heuristic(node):
+            return _distance_m(self.lat[node], self.lon[node], target_lat, target_lon) / WALK_SPEED_MPS
+
+        # The fix is linked to its nearest outdoor nodes
+        starts = sorted(
+            (_distance_m(lat, lon, self.lat[node], self.lon[node]) / WALK_SPEED_MPS, node)
+            for node in self.outdoor
+        )[:START_LINKS]
+        if not starts:
+            starts = [(_distance_m(lat, lon, target_lat, target_lon) / WALK_SPEED_MPS, target)]
+
+        best = {}
+        came_from = {}
+        heap = []
+        for seconds, node in starts:
+            if seconds < best.get(node, math.inf):
+                best[node] = seconds
+                came_from[node] = None
+                heapq.heappush(heap, (seconds + heuristic(node), seconds, node))
+        while heap:
+            _, g, node = heapq.heappop(heap)
+            if node == target:
+                path = [node]
+                while came_from[path[-1]] is not None:
+                    path.append(came_from[path[-1]])
+                return g, path[::-1]
+            if g > best[node]:
+                continue
+            for other, seconds in self.adjacency[node]:
+                ng = g + seconds
+                if ng < best.get(other, math.inf):
+                    best[other] = ng
+                    came_from[other] = node
+                    heapq.heappush(heap, (ng + heuristic(other), ng, other))
+        raise NoRoute
+
+    def indoor_seconds(self, building_id, floor):
+        """From the building hub up or down to a room on ``floor``"""
+        ground = self.ground_floor.get(building_id, 1)
+        return abs(floor - ground) * FLOOR_SECONDS + ROOM_SECONDS
+
+    def describe(self, path):
+        return [
+            {'type': self.kind[node], 'id': self.ref[node], 'name': self.name[node],
+             'latitude': self.lat[node], 'longitude': self.lon[node]}
+            for node in path
+        ]
+
+
+def build_graph():
+    return WalkingGraph(
+        [(b.id, b.name, b.location.y, b.location.x) for b in Building.objects.only('id', 'name', 'location')],
+        [(e.id, e.building_id, e.name, e.location.y, e.location.x, e.floor) for e in Entrance.objects.all()],
+        [(m.id, m.name, m.location.y, m.location.x) for m in ARMarker.objects.only('id', 'name', 'location')],
+    )
+
+
+_state = {'graph': None, 'generation': None, 'checked_at': 0}
+_lock = threading.Lock()
+
+
+def get_graph():
+    """The walking graph, rebuilt when any process has changed its inputs"""
+    if time_module.monotonic() - _state['checked_at'] > RECHECK_SECONDS:
+        generation = cache.get(GENERATION_KEY)
+        _state['checked_at'] = time_module.monotonic()
+        if generation != _state['generation']:
+            _state.update(graph=None, generation=generation)
+    if _state['graph'] is None:
+        with _lock:
+            if _state['graph'] is None:
+                _state['graph'] = build_graph()
+    return _state['graph']
+
+
+def invalidate_graph(*args, **kwargs):
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 1, None)
+    _state['graph'] = None
+
+
+def route(to_room=None, to_building=None, from_room=None, from_building=None, lat=None, lon=None):
+    """
+    Walking route to a room or building.
+
+    The start is a room, a building or a GPS fix (``lat``/``lon``).
+    Returns {'seconds', 'distance_m', 'steps'}; raises NoRoute or
+    Room/Building.DoesNotExist.
+    """
+    graph = get_graph()
+    target_room = Room.objects.get(pk=to_room) if to_room else None
+    target = target_room.building_id if target_room else Building.objects.only('id').get(pk=to_building).id
+    if target not in graph.hub:
+        raise NoRoute
+
+    seconds = 0
+    if from_room or from_building:
+        source_room = Room.objects.get(pk=from_room) if from_room else None
+        source = source_room.building_id if source_room else Building.objects.only('id').get(pk=from_building).id
+        if source not in graph.hub:
+            raise NoRoute
+        if source_room:
+            seconds += graph.indoor_seconds(source, source_room.floor)
+        if source == target:
+            path = [graph.hub[target]]
+        else:
+            outdoor_seconds, path = graph.building_path(source, target)
+            seconds += outdoor_seconds
+    else:
+        outdoor_seconds, path = graph.astar(lat, lon, target)
+        seconds += outdoor_seconds
+    if target_room:
+        seconds += graph.indoor_seconds(target, target_room.floor)
+
+    steps = graph.describe(path)
+    distance = sum(
+        _distance_m(graph.lat[a], graph.lon[a], graph.lat[b], graph.lon[b]) for a, b in zip(path, path[1:])
+    )
+    if lat is not None and not (from_room or from_building):
+        steps.insert(0, {'type': 'start', 'latitude': lat, 'longitude': lon})
+        distance += _distance_m(lat, lon, graph.lat[path[0]], graph.lon[path[0]])
+    if target_room:
+        steps.append({'type': 'room', 'id': target_room.id, 'name': target_room.number, 'floor': target_room.floor})
+    return {'seconds': round(seconds), 'distance_m': round(distance, 1), 'steps': steps}
+
+
+def _changed(sender, raw=False, **kwargs):
+    # After commit, so no process rebuilds from rows that aren't visible yet or get rolled back
+    if not raw:
+        transaction.on_commit(invalidate_graph)
+
+
+def connect_signals():
+    from django.db.models.signals import post_delete, post_save
+
+    for model in (Building, Entrance, ARMarker):
+        post_save.connect(_changed, sender=model, dispatch_uid=f'routing.save.{model.__name__}')
+        post_delete.connect(_changed, sender=model, dispatch_uid=f'routing.delete.{model.__name__}')
@@ -0,0 +1,264 @@
+# navigation/spatial.py
+"""
+In-memory nearest-neighbour lookups for AR markers and buildings.
+
+Every marker and building sits in a uniform grid of CELL_M cells. Radius
+queries visit only the cells overlapping the circle. k-nearest queries
+search rings of cells outward until the k-th best distance is inside the
+searched area. Both return ready-made payloads, so a query involves no
+database or serialization work.
+
+Saving or deleting a marker or building updates the local grid at once.
+The change is also logged in the shared cache under a generation number.
+Other processes replay the log every RECHECK_SECONDS, reloading just the
+changed rows, and fall back to a full reload when they are too far behind.
+"""
+import math
+import threading
+import time as time_module
+from functools import partial
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import ARMarker, Building
+
+CELL_M = 50
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS_M / 180
+GENERATION_KEY = 'navigation:spatial:generation'
+CHANGE_KEY = 'navigation:spatial:change:{}'
+CHANGE_TIMEOUT = 60 * 60
+MAX_REPLAY = 500
+RECHECK_SECONDS = 2
+MODELS = {'marker': ARMarker, 'building': Building}
+
+
+def _image_url(image):
+    return image.url if image else None
+
+
+def marker_payload(marker):
+    return {
+        'type': 'marker',
+        'id': marker.id,
+        'name': marker.name,
+        'marker_type': marker.marker_type,
+        'content': marker.content,
+        'building_id': marker.building_id,
+        'image': _image_url(marker.image),
+        'latitude': marker.location.y,
+        'longitude': marker.location.x,
+    }
+
+
+def building_payload(building):
+    return {
+        'type': 'building',
+        'id': building.id,
+        'name': building.name,
+        'code': building.code,
+        'floors': building.floors,
+        'image': _image_url(building.image),
+        'latitude': building.location.y,
+        'longitude': building.location.x,
+    }
+
+
+PAYLOADS = {'marker': marker_payload, 'building': building_payload}
+
+
+class GridIndex:
+    """Points bucketed into CELL_M square cells around a fixed reference latitude"""
+
+    def __init__(self, reference_lat=0.0):
+        self._lock = threading.Lock()
+        self.lon_scale = max(math.cos(math.radians(reference_lat)), 1e-6)
+        self.cells = {}
+        self.entries = {}  # (kind, id) -> (lat, lon, cell, payload)
+        self.generation = None
+
+    def _cell(self, lat, lon):
+        return (int(lat * METERS_PER_DEGREE // CELL_M),
+                int(lon * METERS_PER_DEGREE * self.lon_scale // CELL_M))
+
+    def _distance(self, lat1, lon1, lat2, lon2):
+        x = (lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2))
+        return METERS_PER_DEGREE * math.hypot(x, lat2 - lat1)
+
+    def upsert(self, kind, payload):
+        key = (kind, payload['id'])
+        lat, lon = payload['latitude'], payload['longitude']
+        cell = self._cell(lat, lon)
+        with self._lock:
+            self._discard(key)
+            self.entries[key] = (lat, lon, cell, payload)
+            self.cells.setdefault(cell, []).append(key)
+
+    def remove(self, kind, object_id):
+        with self._lock:
+            self._discard((kind, object_id))
+
+    def _discard(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            bucket = self.cells[entry[2]]
+            bucket.remove(key)
+            if not bucket:
+                del self.cells[entry[2]]
+
+    def _ring(self, center, radius):
+        row, col = center
+        if radius == 0:
+            yield center
+            return
+        for dc in range(-radius, radius + 1):
+            yield row - radius, col + dc
+            yield row + radius, col + dc
+        for dr in range(-radius + 1, radius):
+            yield row + dr, col - radius
+            yield row + dr, col + radius
+
+    def within(self, lat, lon, radius_m, kinds=None, exclude=None):
+        """[(distance_m, payload), ...] within radius_m, nearest first; ``exclude`` holds (kind, id) keys"""
+        center = self._cell(lat, lon)
+        reach = int(math.ceil(radius_m / CELL_M)) + 1
+        found = []
+        cells, entries = self.cells, self.entries
+        for row in range(center[0] - reach, center[0] + reach + 1):
+            for col in range(center[1] - reach, center[1] + reach + 1):
+                for key in cells.get((row, col), ()):
+                    if (kinds and key[0] not in kinds) or (exclude and key in exclude):
+                        continue
+                    entry = entries[key]
+                    distance = self._distance(lat, lon, entry[0], entry[1])
+                    if distance <= radius_m:
+                        found.append((distance, entry[3]))
+        found.sort(key=lambda item: item[0])
+        return found
+
+    def nearest(self, lat, lon, k, max_radius_m=2000, kinds=None, exclude=None):
+        """The k nearest [(distance_m, payload), ...] within max_radius_m"""
+        center = self._cell(lat, lon)
+        found = []
+        cells, entries = self.cells, self.entries
+        for radius in range(int(max_radius_m // CELL_M) + 2):
+            for cell in self._ring(center, radius):
+                for key in cells.get(cell, ()):
+                    if (kinds and key[0] not in kinds) or (exclude and key in exclude):
+                        continue
+                    entry = entries[key]
+                    distance = self._distance(lat, lon, entry[0], entry[1])
+                    if distance <= max_radius_m:
+                        found.append((distance, entry[3]))
+            # Everything closer than ``radius`` cells has been visited
+            if len(found) >= k:
+                found.sort(key=lambda item: item[0])
+                if found[k - 1][0] <= radius * CELL_M:
+                    break
+        found.sort(key=lambda item: item[0])
+        return found[:k]
+
+
+def _rows(kind, ids=None):
+    queryset = MODELS[kind].objects.all()
+    return queryset if ids is None else queryset.filter(id__in=ids)
+
+
+def build_index():
+    rows = {kind: list(_rows(kind)) for kind in MODELS}
+    latitudes = [row.location.y for kind_rows in rows.values() for row in kind_rows]
+    index = GridIndex(sum(latitudes) / len(latitudes) if latitudes else 0.0)
+    for kind, kind_rows in rows.items():
+        for row in kind_rows:
+            index.upsert(kind, PAYLOADS[kind](row))
+    return index
+
+
+_state = {'index': None, 'checked_at': 0}
+_lock = threading.Lock()
+
+
+def _replay(index, generation):
+    """Apply logged changes up to ``generation``; False when a full reload is needed"""
+    if index.generation is None or generation - index.generation > MAX_REPLAY:
+        return False
+    keys = [CHANGE_KEY.format(number) for number in range(index.generation + 1, generation + 1)]
+    changes = cache.get_many(keys)
+    if len(changes) != len(keys):
+        return False
+
+    changed = {}
+    for kind, object_id in changes.values():
+        changed.setdefault(kind, set()).add(object_id)
+    for kind, ids in changed.items():
+        present = {row.id: row for row in _rows(kind, ids)}
+        for object_id in ids:
+            if object_id in present:
+                index.upsert(kind, PAYLOADS[kind](present[object_id]))
+            else:
+                index.remove(kind, object_id)
+    index.generation = generation
+    return True
+
+
+def get_index():
+    """The process's grid index, brought up to date with other processes' changes"""
+    index = _state['index']
+    if index is not None and time_module.monotonic() - _state['checked_at'] < RECHECK_SECONDS:
+        return index
+
+    with _lock:
+        generation = cache.get(GENERATION_KEY) or 0
+        index = _state['index']
+        if index is None or (index.generation != generation and not _replay(index, generation)):
+            index = build_index()
+            index.generation = generation
+            _state['index'] = index
+        _state['checked_at'] = time_module.monotonic()
+    return index
+
+
+def nearby(lat, lon, radius_m=50, kinds=None, exclude=None):
+    return get_index().within(lat, lon, radius_m, kinds, exclude)
+
+
+def nearest(lat, lon, k=5, max_radius_m=2000, kinds=None, exclude=None):
+    return get_index().nearest(lat, lon, k, max_radius_m, kinds, exclude)
+
+
+def _record_change(kind, object_id):
+    try:
+        generation = cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.add(GENERATION_KEY, 0, None)
+        generation = cache.incr(GENERATION_KEY)
+    cache.set(CHANGE_KEY.format(generation), (kind, object_id), CHANGE_TIMEOUT)
+
+    index = _state['index']
+    if index is None:
+        return
+    with _lock:
+        row = _rows(kind, [object_id]).first()
+        if row is None:
+            index.remove(kind, object_id)
+        else:
+            index.upsert(kind, PAYLOADS[kind](row))
+        # Only skip ahead when no other process's change is still unapplied
+        if index.generation == generation - 1:
+            index.generation = generation
+
+
+def _changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    kind = 'marker' if sender is ARMarker else 'building'
+    transaction.on_commit(partial(_record_change, kind, instance.pk))
+
+
+def connect_signals():
+    from django.db.models.signals import post_delete, post_save
+
+    for model in MODELS.values():
+        post_save.connect(_changed, sender=model, dispatch_uid=f'spatial.save.{model.__name__}')
+        post_delete.connect(_changed, sender=model, dispatch_uid=f'spatial.delete.{model.__name__}')
@@ -1,3 +1,202 @@
-from django.test import TestCase
+import gzip
+import random
+from datetime import date, datetime, time
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.gis.geos import Point
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import availability, bundle, hours, routing, spatial
+from .models import Building, MapBundle, Room
+
+
+class BundleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.library = Building.objects.create(name='Library', code='LIB', location=Point(90.4, 23.7), floors=3)
+        Room.objects.create(building=self.library, number='101', floor=1, room_type='Classroom', capacity=40)
+
+    def test_encoding_round_trips(self):
+        tables = bundle.collect()
+        header, decoded = bundle.decode(bundle.encode(tables))
+        self.assertIsNone(header['base'])
+        self.assertEqual(decoded, tables)
+
+    def test_deltas_hold_changes_and_removals(self):
+        old = bundle.collect()
+        Room.objects.all().delete()
+        self.library.name = 'Central Library'
+        self.library.save()
+        new = bundle.collect()
+
+        changed, removed = bundle.diff(old, new)
+        header, tables = bundle.decode(bundle.encode(changed, base='abc', removed=removed))
+        self.assertEqual(header['base'], 'abc')
+        self.assertEqual(tables['buildings'][self.library.id][1], 'Central Library')
+        self.assertEqual(header['tables']['rooms']['removed'], list(old['rooms']))
+
+    def test_reverting_makes_the_older_bundle_latest(self):
+        first = bundle.publish()
+        self.library.name = 'Renamed'
+        self.library.save()
+        second = bundle.publish()
+        self.library.name = 'Library'
+        self.library.save()
+
+        self.assertEqual(bundle.publish().version, first.version)
+        self.assertEqual(bundle.latest().version, first.version)
+        self.assertEqual(MapBundle.objects.count(), 2)
+        self.assertNotEqual(second.version, first.version)
+
+    def test_response_uses_the_best_accepted_encoding(self):
+        latest = bundle.publish()
+        response = self.client.get(reverse('navigation:map_bundle'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(bundle.version_of(gzip.decompress(response.content)), latest.version)
+
+        response = self.client.get(reverse('navigation:map_bundle'), {'since': latest.version})
+        self.assertEqual(response.status_code, 304)
+
+
+class HoursTests(TestCase):
+    def at(self, day, hour, minute=0):
+        return timezone.make_aware(datetime.combine(day, time(hour, minute)))
+
+    def test_spans_parse(self):
+        self.assertEqual(hours.parse_spans('closed'), [])
+        self.assertEqual(hours.parse_spans('24h'), [(0, hours.DAY_MINUTES)])
+        self.assertEqual(hours.parse_spans(['14:00-02:00', '08:00-12:00']), [(480, 720), (840, 1560)])
+        for bad in ('8-12', '08:00-25:00', '08:00'):
+            with self.assertRaises(ValueError):
+                hours.parse_spans(bad)
+
+    def test_overnight_spans_and_overrides(self):
+        compiled = hours.Hours.compile({'Daily': '08:00-22:00', 'friday': '20:00-02:00',
+                                        'holidays': {'2026-12-25': 'closed'}})
+        friday = date(2026, 10, 16)
+        self.assertFalse(compiled.is_open(self.at(friday, 9)))
+        self.assertTrue(compiled.is_open(self.at(date(2026, 10, 17), 1, 30)))
+        self.assertTrue(compiled.is_open(self.at(date(2026, 12, 24), 21)))
+        self.assertFalse(compiled.is_open(self.at(date(2026, 12, 25), 9)))
+
+    def test_buildings_without_hours_are_never_closed(self):
+        point = Point(90.4, 23.7)
+        unknown = Building.objects.create(name='Annex', code='ANX', location=point, floors=1)
+        shut = Building.objects.create(name='Depot', code='DEP', location=point, floors=1,
+                                       hours_of_operation={'daily': 'closed'})
+        table = hours.HoursTable(hours._compile_buildings())
+        self.assertNotIn(unknown.id, table.hours)
+        self.assertIn(shut.id, table.hours)
+        self.assertEqual(table.open_ids(self.at(date(2026, 10, 19), 12)), set())
+
+
+class RoutingTests(TestCase):
+    def setUp(self):
+        # Three buildings due north of each other; only the first has an entrance, on the ground floor
+        self.graph = routing.WalkingGraph(
+            [(1, 'A', 23.700, 90.4), (2, 'B', 23.702, 90.4), (3, 'C', 23.704, 90.4)],
+            [(10, 1, 'North door', 23.7005, 90.4, 0)],
+            [],
+        )
+
+    def test_building_paths_come_from_the_table(self):
+        seconds, path = self.graph.building_path(1, 3)
+        self.assertEqual((path[0], path[-1]), (self.graph.hub[1], self.graph.hub[3]))
+        self.assertIn('entrance', [step['type'] for step in self.graph.describe(path)])
+        self.assertAlmostEqual(seconds, routing._distance_m(23.700, 90.4, 23.704, 90.4) / routing.WALK_SPEED_MPS,
+                               places=3)
+        reverse_seconds, reverse_path = self.graph.building_path(3, 1)
+        self.assertAlmostEqual(reverse_seconds, seconds, places=6)
+        self.assertEqual(reverse_path[-1], self.graph.hub[1])
+
+    def test_astar_agrees_with_the_table(self):
+        table_seconds, _ = self.graph.building_path(2, 3)
+        seconds, path = self.graph.astar(23.702, 90.4, 3)
+        self.assertAlmostEqual(seconds, table_seconds, places=3)
+        self.assertEqual(path[-1], self.graph.hub[3])
+
+    def test_indoor_time_counts_floors_from_the_entrance(self):
+        self.assertEqual(self.graph.indoor_seconds(1, 2), 2 * routing.FLOOR_SECONDS + routing.ROOM_SECONDS)
+        self.assertEqual(self.graph.indoor_seconds(2, 1), routing.ROOM_SECONDS)
+
+    def test_saves_elsewhere_rebuild_the_graph(self):
+        cache.clear()
+        routing._state.update(graph=None, generation=None, checked_at=0)
+        self.addCleanup(routing._state.update, graph=None, generation=None, checked_at=0)
+        first = routing.get_graph()
+        self.assertIs(routing.get_graph(), first)
+
+        cache.set(routing.GENERATION_KEY, 99)  # Bumped by another process
+        routing._state['checked_at'] = 0
+        self.assertIsNot(routing.get_graph(), first)
+
+    def test_saves_invalidate_only_once_committed(self):
+        cache.set(routing.GENERATION_KEY, 1)
+        with self.captureOnCommitCallbacks() as callbacks:
+            Building.objects.create(name='Annex', code='ANX', location=Point(90.4, 23.7), floors=1)
+            self.assertEqual(cache.get(routing.GENERATION_KEY), 1)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(cache.get(routing.GENERATION_KEY), 2)
+
+
+def place(object_id, lat, lon, kind='marker'):
+    return kind, {'id': object_id, 'latitude': lat, 'longitude': lon}
+
+
+class SpatialTests(TestCase):
+    def setUp(self):
+        self.index = spatial.GridIndex(23.7)
+
+    def test_nearest_matches_a_full_scan(self):
+        rng = random.Random(7)
+        points = [(23.7 + rng.uniform(-0.01, 0.01), 90.4 + rng.uniform(-0.01, 0.01)) for _ in range(300)]
+        for object_id, (lat, lon) in enumerate(points):
+            self.index.upsert(*place(object_id, lat, lon))
+        for lat, lon in points[:20]:
+            expected = sorted(self.index._distance(lat, lon, *point) for point in points)[:5]
+            found = self.index.nearest(lat, lon, 5)
+            self.assertEqual([round(distance, 6) for distance, _ in found], [round(d, 6) for d in expected])
+            within = self.index.within(lat, lon, 150)
+            self.assertEqual(len(within), sum(1 for point in points if self.index._distance(lat, lon, *point) <= 150))
+
+    def test_filters_and_moves(self):
+        self.index.upsert(*place(1, 23.7, 90.4))
+        self.index.upsert(*place(1, 23.7001, 90.4, kind='building'))
+        self.assertEqual([payload['id'] for _, payload in self.index.within(23.7, 90.4, 50, kinds={'building'})], [1])
+        self.assertEqual(self.index.nearest(23.7, 90.4, 5, exclude={('marker', 1), ('building', 1)}), [])
+
+        self.index.upsert(*place(1, 23.71, 90.4))  # Moved a kilometre away
+        self.assertEqual(len(self.index.within(23.7, 90.4, 50)), 1)
+        self.index.remove('building', 1)
+        self.assertEqual(self.index.within(23.7, 90.4, 50), [])
+        self.assertEqual(len(self.index.cells), 1)
+
+    def test_other_processes_replay_logged_changes(self):
+        cache.clear()
+        spatial._state.update(index=None, checked_at=0)
+        self.addCleanup(spatial._state.update, index=None, checked_at=0)
+        Building.objects.create(name='Library', code='LIB', location=Point(90.4, 23.7), floors=3)
+        index = spatial.get_index()
+
+        # Another process saves a building; this one only sees the cache log
+        spatial._state['index'] = None
+        with self.captureOnCommitCallbacks(execute=True):
+            added = Building.objects.create(name='Annex', code='ANX', location=Point(90.4001, 23.7), floors=1)
+        spatial._state.update(index=index, checked_at=0)
+        with mock.patch.object(spatial, 'build_index') as build_index:
+            self.assertIs(spatial.get_index(), index)
+        build_index.assert_not_called()
+        self.assertIn(added.id, [payload['id'] for _, payload in spatial.nearby(23.7, 90.4, 100)])
+
+
+class SemesterTests(TestCase):
+    def test_terms_come_from_settings(self):
+        self.assertEqual(availability.semester_of(date(2026, 10, 19)), 'Fall 2026')
+        self.assertEqual(availability.semester_of(date(2026, 6, 1)), 'Summer 2026')
+        with override_settings(ACADEMIC_TERMS=((9, 'Autumn'), (2, 'Spring'))):
+            self.assertEqual(availability.semester_of(date(2026, 10, 19)), 'Autumn 2026')
+            self.assertEqual(availability.semester_of(date(2026, 1, 10)), 'Autumn 2025')
@@ -0,0 +1,16 @@
+# navigation/urls.py
+from django.urls import path
+from .views import (
+    FreeRoomsView, MapBundleVersionView, MapBundleView, NearbyPlacesView, NearestPlacesView, WalkingRouteView,
+)
+
+app_name = 'navigation'  # Namespace for the app
+
+urlpatterns = [
+    path('route/', WalkingRouteView.as_view(), name='walking_route'),
+    path('places/nearby/', NearbyPlacesView.as_view(), name='nearby_places'),
+    path('places/nearest/', NearestPlacesView.as_view(), name='nearest_places'),
+    path('rooms/free/', FreeRoomsView.as_view(), name='free_rooms'),
+    path('bundle/', MapBundleView.as_view(), name='map_bundle'),
+    path('bundle/<str:version>/', MapBundleVersionView.as_view(), name='map_bundle_version'),
+]
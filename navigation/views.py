@@ -1,3 +1,175 @@
-from django.shortcuts import render
+from django.http import Http404, HttpResponse, HttpResponseNotModified, JsonResponse
+from django.views.generic import View
 
-# Create your views here.
+from transportation.views import parse_moment
+
+from . import availability, bundle, hours, routing, spatial
+from .models import Building, Room
+
+
+class WalkingRouteView(View):
+    """
+    Walking directions to a room or building as JSON.
+
+    The destination is ``to_room`` or ``to_building``; the start is
+    ``from_room``, ``from_building`` or a GPS fix given as ``lat``/``lon``.
+    """
+
+    def get(self, request):
+        params = {}
+        try:
+            for name in ('to_room', 'to_building', 'from_room', 'from_building'):
+                if request.GET.get(name):
+                    params[name] = int(request.GET[name])
+            for name in ('lat', 'lon'):
+                if request.GET.get(name):
+                    params[name] = float(request.GET[name])
+        except ValueError:
+            return JsonResponse({'error': 'Ids must be integers and coordinates numbers'}, status=400)
+
+        if not ('to_room' in params or 'to_building' in params):
+            return JsonResponse({'error': 'to_room or to_building is required'}, status=400)
+        if not ('from_room' in params or 'from_building' in params or ('lat' in params and 'lon' in params)):
+            return JsonResponse({'error': 'A start (from_room, from_building or lat/lon) is required'}, status=400)
+
+        try:
+            result = routing.route(**params)
+        except (Room.DoesNotExist, Building.DoesNotExist):
+            return JsonResponse({'error': 'Unknown room or building'}, status=404)
+        except routing.NoRoute:
+            return JsonResponse({'error': 'No walking route found'}, status=404)
+        return JsonResponse(result)
+
+
+def _place_query(request):
+    """(lat, lon, kinds) from the query string; raises ValueError"""
+    lat = float(request.GET['lat'])
+    lon = float(request.GET['lon'])
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError('Invalid location')
+    kinds = set(request.GET.get('types', 'marker,building').split(','))
+    if not kinds <= set(spatial.MODELS):
+        raise ValueError('Unknown type')
+    return lat, lon, kinds
+
+
+def _closed_buildings(request):
+    """(kind, id) keys of closed buildings when ``open_now`` is set, for the spatial index's exclude"""
+    if not request.GET.get('open_now'):
+        return None
+    table = hours.get_table('building')
+    open_ids = table.open_ids()
+    return {('building', building_id) for building_id in table.hours if building_id not in open_ids}
+
+
+def _places(found):
+    return [dict(payload, distance_m=round(distance, 1)) for distance, payload in found]
+
+
+class NearbyPlacesView(View):
+    """AR markers and buildings within a radius of a point as JSON; ``open_now`` hides closed buildings"""
+    MAX_RADIUS_M = 1000
+
+    def get(self, request):
+        try:
+            lat, lon, kinds = _place_query(request)
+            radius = min(float(request.GET.get('radius', 50)), self.MAX_RADIUS_M)
+        except (KeyError, ValueError):
+            return JsonResponse({'error': 'lat and lon are required numbers; types is marker and/or building'},
+                                status=400)
+        if radius <= 0:
+            return JsonResponse({'error': 'Invalid radius'}, status=400)
+        found = spatial.nearby(lat, lon, radius, kinds, exclude=_closed_buildings(request))
+        return JsonResponse({'places': _places(found)})
+
+
+class NearestPlacesView(View):
+    """The k AR markers and buildings closest to a point as JSON; ``open_now`` hides closed buildings"""
+    MAX_K = 50
+
+    def get(self, request):
+        try:
+            lat, lon, kinds = _place_query(request)
+            k = min(max(int(request.GET.get('k', 5)), 1), self.MAX_K)
+        except (KeyError, ValueError):
+            return JsonResponse({'error': 'lat and lon are required numbers; types is marker and/or building'},
+                                status=400)
+        found = spatial.nearest(lat, lon, k, kinds=kinds, exclude=_closed_buildings(request))
+        return JsonResponse({'places': _places(found)})
+
+
+def _bundle_response(request, version, base=None):
+    encoding = bundle.best_encoding(request.META.get('HTTP_ACCEPT_ENCODING'))
+    body = bundle.payload(version, base, encoding)
+    if body is None:
+        return None
+    response = HttpResponse(body, content_type='application/octet-stream')
+    if encoding != 'identity':
+        response['Content-Encoding'] = encoding
+    response['Vary'] = 'Accept-Encoding'
+    response['ETag'] = f'"{version}"'
+    response['X-Bundle-Version'] = version
+    if base:
+        response['X-Bundle-Base'] = base
+    return response
+
+
+class MapBundleView(View):
+    """
+    The latest offline map bundle.
+
+    Clients pass the version they hold as ``since`` (or in If-None-Match)
+    and get a 304, a delta from that version, or the full bundle when the
+    version is no longer stored.
+    """
+
+    def get(self, request):
+        latest = bundle.latest()
+        since = request.GET.get('since') or request.META.get('HTTP_IF_NONE_MATCH', '').strip('"')
+        if since == latest.version:
+            response = HttpResponseNotModified()
+            response['ETag'] = f'"{latest.version}"'
+            return response
+
+        response = since and _bundle_response(request, latest.version, base=since)
+        if not response:
+            response = _bundle_response(request, latest.version)
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+
+class MapBundleVersionView(View):
+    """A specific full bundle; versions never change, so it is cacheable forever"""
+
+    def get(self, request, version):
+        response = _bundle_response(request, version)
+        if response is None:
+            raise Http404("Unknown bundle version")
+        response['Cache-Control'] = 'public, max-age=31536000, immutable'
+        return response
+
+
+class FreeRoomsView(View):
+    """
+    Rooms with no class or exam from ``at`` (default now) for ``minutes``.
+
+    Optional filters: ``capacity`` (minimum seats), ``building`` (id),
+    ``room_type`` and ``semester`` (defaults to the one containing ``at``).
+    """
+    MAX_MINUTES = 7 * 24 * 60
+
+    def get(self, request):
+        try:
+            at = parse_moment(request.GET.get('at'))
+            minutes = int(request.GET.get('minutes', 30))
+            capacity = int(request.GET['capacity']) if request.GET.get('capacity') else None
+            building = int(request.GET['building']) if request.GET.get('building') else None
+        except ValueError:
+            return JsonResponse({'error': 'at must be an ISO 8601 datetime; minutes, capacity and building integers'},
+                                status=400)
+        if not 0 < minutes <= self.MAX_MINUTES:
+            return JsonResponse({'error': 'minutes must be between 1 and one week'}, status=400)
+
+        rooms = availability.free_rooms(at, minutes, capacity, building, request.GET.get('room_type'),
+                                        request.GET.get('semester'))
+        return JsonResponse({'rooms': rooms})
@@ -3,13 +3,13 @@ from django.contrib import admin
 # Register your models here.
 # admin.py
 from django.contrib import admin
-from .models import Notification, NotificationPreference
+from .models import ArchivedNotification, Notification, NotificationDelivery, NotificationPreference, UnreadCounter
 
 # Register your models here.
 
 @admin.register(Notification)
 class NotificationAdmin(admin.ModelAdmin):
-    list_display = ('user', 'type', 'title', 'created_at', 'read', 'priority')
+    list_display = ('user', 'type', 'title', 'created_at', 'read', 'priority', 'occurrences')
     search_fields = ('user__username', 'title', 'message', 'type')
     list_filter = ('type', 'priority', 'read', 'created_at')
     readonly_fields = ('created_at', 'read_at')  # Make these fields read-only in admin
@@ -19,4 +19,26 @@ class NotificationAdmin(admin.ModelAdmin):
 class NotificationPreferenceAdmin(admin.ModelAdmin):
     list_display = ('user', 'email_enabled', 'push_enabled', 'sms_enabled', 'quiet_hours_start', 'quiet_hours_end')
     search_fields = ('user__username',)
-    list_filter = ('email_enabled', 'push_enabled', 'sms_enabled')
\ No newline at end of file
+    list_filter = ('email_enabled', 'push_enabled', 'sms_enabled')
+
+
+@admin.register(UnreadCounter)
+class UnreadCounterAdmin(admin.ModelAdmin):
+    list_display = ('user', 'unread')
+    search_fields = ('user__username',)
+
+
+@admin.register(NotificationDelivery)
+class NotificationDeliveryAdmin(admin.ModelAdmin):
+    list_display = ('notification', 'user', 'channel', 'status', 'send_after', 'deferred', 'attempts', 'sent_at')
+    search_fields = ('user__username', 'notification__title')
+    list_filter = ('channel', 'status', 'deferred')
+    raw_id_fields = ('notification', 'user')
+
+
+@admin.register(ArchivedNotification)
+class ArchivedNotificationAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'type', 'priority', 'created_at', 'archived_at')
+    search_fields = ('user__username',)
+    list_filter = ('type', 'priority')
+    raw_id_fields = ('user',)
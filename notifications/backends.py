@@ -0,0 +1,86 @@
+# notifications/backends.py
+"""
+Channel backends for notifications.delivery.
+
+A backend's ``send`` takes a batch of delivery.Message tuples for its
+channel. It returns one entry per message: None when sent, or an error
+string. Raising fails the whole batch. Each channel's backend is a dotted
+path in settings.NOTIFICATION_BACKENDS. The file and console backends
+stand in for email, push and SMS gateways during development.
+"""
+import json
+import os
+import sys
+
+from django.conf import settings
+from django.core import mail
+
+
+class BaseBackend:
+    def __init__(self, channel):
+        self.channel = channel
+
+    def send(self, messages):
+        raise NotImplementedError
+
+
+class DummyBackend(BaseBackend):
+    """Accepts and discards everything"""
+
+    def send(self, messages):
+        return [None] * len(messages)
+
+
+class ConsoleBackend(BaseBackend):
+    """Writes one line per message to stdout"""
+
+    def __init__(self, channel, stream=None):
+        super().__init__(channel)
+        self.stream = stream or sys.stdout
+
+    def send(self, messages):
+        for message in messages:
+            self.stream.write(f"[{self.channel}] user {message.user_id}: {message.title}\n")
+        self.stream.flush()
+        return [None] * len(messages)
+
+
+class FileBackend(BaseBackend):
+    """Appends messages as JSON lines to <NOTIFICATION_FILE_DIR>/<channel>.jsonl"""
+
+    def __init__(self, channel):
+        super().__init__(channel)
+        directory = settings.NOTIFICATION_FILE_DIR
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f'{channel}.jsonl')
+
+    def send(self, messages):
+        with open(self.path, 'a', encoding='utf-8') as outbox:
+            for message in messages:
+                outbox.write(json.dumps({
+                    'user_id': message.user_id,
+                    'address': message.address,
+                    'title': message.title,
+                    'body': message.body,
+                    'action_url': message.action_url,
+                    'deliveries': message.delivery_ids,
+                }) + '\n')
+        return [None] * len(messages)
+
+
+class EmailBackend(BaseBackend):
+    """Sends through Django's configured EMAIL_BACKEND over one connection per batch"""
+
+    def send(self, messages):
+        results, emails = [], []
+        for message in messages:
+            if not message.address:
+                results.append("User has no email address")
+                continue
+            body = f"{message.body}\n\n{message.action_url}" if message.action_url else message.body
+            emails.append(mail.EmailMessage(message.title, body, to=[message.address]))
+            results.append(None)
+        if emails:
+            with mail.get_connection() as connection:
+                connection.send_messages(emails)
+        return results
@@ -0,0 +1,11 @@
+from django.utils.functional import SimpleLazyObject
+
+from . import inbox
+
+
+def unread_notifications(request):
+    """``unread_notifications`` for the header badge; only looked up if a template uses it, then cached"""
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return {'unread_notifications': 0}
+    return {'unread_notifications': SimpleLazyObject(lambda: inbox.unread_count(user.id))}
@@ -0,0 +1,116 @@
+# notifications/dedup.py
+"""
+Keeping repeated notifications down to one row.
+
+Idempotent fan-out: a sender passes an identity for the event it is
+announcing, such as ``('bus_alert', 17)``. Each recipient's row gets
+``key(identity, user_id)``, a hash of the identity followed by the user
+id, and ``dedup_key`` is unique. Repeating or retrying the same fan-out
+then skips every user who already has the row (INSERT ... ON CONFLICT DO
+NOTHING). See fanout.
+
+Coalescing: ``coalesce`` runs before routing (see delivery). It groups
+pending notifications about the same thing: the same user, type,
+related_object_type and related_object_id, created within
+settings.NOTIFICATION_COALESCE_SECONDS. Notifications already routed keep
+their deliveries and are never merged. Several status changes to one
+order, or an alert edited twice, collapse into the newest row. That row's
+``occurrences`` adds up the rows it replaces, so the inbox shows one entry
+and delivery sends one message. The survivor takes over the dedup key of
+a row it replaces; since it holds only one, rows whose key would be lost
+are left alone. Notifications without a related object are never
+coalesced.
+"""
+import hashlib
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+
+from . import inbox
+from .models import Notification
+
+CHUNK_SIZE = 2000
+FIELDS = ('id', 'user_id', 'type', 'related_object_type', 'related_object_id', 'created_at', 'occurrences',
+          'read', 'dedup_key')
+
+
+def digest(identity):
+    """Hash of an event identity (a string or a tuple of parts), shared by every recipient's key"""
+    if isinstance(identity, (tuple, list)):
+        identity = ':'.join(str(part) for part in identity)
+    return hashlib.sha256(str(identity).encode()).hexdigest()[:40]
+
+
+def key(identity, user_id):
+    return f'{digest(identity)}:{user_id}'
+
+
+def window():
+    return timedelta(seconds=getattr(settings, 'NOTIFICATION_COALESCE_SECONDS', 15 * 60))
+
+
+def _group(row):
+    return row[1:5]
+
+
+def coalesce(chunk_size=CHUNK_SIZE):
+    """Collapse pending notifications into newer or older ones about the same object; returns rows removed"""
+    span = window()
+    removed = 0
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            pending = list(
+                Notification.objects.select_for_update(skip_locked=True)
+                .filter(routed=False, id__gt=last_id, related_object_id__isnull=False)
+                .exclude(related_object_type='').order_by('id')
+                .values_list(*FIELDS)[:chunk_size]
+            )
+            if not pending:
+                return removed
+            last_id = pending[-1][0]
+
+            # Earlier pending notifications in the same groups, from previous chunks
+            cutoff = min(row[5] for row in pending) - span
+            groups = defaultdict(dict)
+            candidates = Notification.objects.filter(
+                routed=False, user_id__in={row[1] for row in pending},
+                related_object_id__in={row[4] for row in pending},
+                created_at__gte=cutoff, id__lte=last_id,
+            ).values_list(*FIELDS)
+            wanted = {_group(row) for row in pending}
+            for row in [*candidates, *pending]:
+                if _group(row) in wanted:
+                    groups[_group(row)][row[0]] = row
+
+            survivors, doomed, unread = [], [], Counter()
+            for rows in groups.values():
+                if len(rows) < 2:
+                    continue
+                rows = sorted(rows.values(), key=lambda row: (row[5], row[0]))
+                newest = rows[-1]
+                # Only the newest row's window counts; older rows outside it stay as they are
+                merged = [row for row in rows[:-1] if newest[5] - row[5] <= span]
+                # The survivor has room for one dedup key and must keep every key it absorbs, so that
+                # retrying those fan-outs still finds them; rows whose key wouldn't fit stay as they are
+                keyed = [row for row in merged if row[8]]
+                merged = [row for row in merged if not row[8]]
+                dedup_key = newest[8]
+                if dedup_key is None and keyed:
+                    merged.append(keyed[-1])
+                    dedup_key = keyed[-1][8]
+                if not merged:
+                    continue
+                survivors.append(Notification(
+                    id=newest[0], occurrences=newest[6] + sum(row[6] for row in merged), dedup_key=dedup_key,
+                ))
+                doomed.extend(row[0] for row in merged)
+                unread[newest[1]] -= sum(1 for row in merged if not row[7])
+
+            if doomed:
+                Notification.objects.filter(id__in=doomed).delete()
+                Notification.objects.bulk_update(survivors, ['occurrences', 'dedup_key'], batch_size=500)
+                inbox.add_unread(unread)
+        removed += len(doomed)
@@ -0,0 +1,315 @@
+# notifications/delivery.py
+"""
+Sending notifications out over email, push and SMS.
+
+Delivery runs on the ``notifications`` Celery queue (see tasks). Repeats
+are first coalesced (see dedup), then two stages follow:
+
+``route_pending`` takes new notifications in id order, CHUNK_SIZE at a
+time. It loads the preferences of every recipient in the chunk with one
+query and compiles each into a Route: the enabled channels, per-type
+overrides from ``preferences_by_type`` and the quiet-hours window. Then it
+writes one NotificationDelivery per notification and channel, as plain
+parameter tuples through executemany, which skips building model
+instances. During a recipient's quiet hours the delivery is held back
+until the window ends, unless the notification is urgent. ``preferences_by_type`` maps a
+notification type to true/false, or to ``{"email": false, ...}`` for
+individual channels.
+
+``dispatch_due`` claims deliveries whose time has come by marking them
+``sending`` and committing, then sends with no transaction open, then
+records the results. Claimed rows that are never resolved, because the
+worker died, become due again after SENDING_SECONDS. Deliveries are
+grouped per user and channel. A group of one is sent as it is. A larger
+group, such as everything held back overnight, becomes a single digest
+message. Each channel's messages go to its backend
+(settings.NOTIFICATION_BACKENDS) as one batch. Failed deliveries are
+retried with exponential backoff, up to MAX_ATTEMPTS. Email to a user
+with no address fails at once, since retrying cannot help.
+
+Both stages lock their rows with SKIP LOCKED where the database supports
+it, so several workers can drain the queue side by side.
+"""
+import logging
+from collections import defaultdict, namedtuple
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .dedup import coalesce
+from .models import Notification, NotificationDelivery, NotificationPreference
+
+logger = logging.getLogger(__name__)
+
+CHANNELS = tuple(channel for channel, _ in NotificationDelivery.CHANNELS)
+CHUNK_SIZE = 2000
+MAX_ATTEMPTS = 5
+RETRY_SECONDS = 60
+SENDING_SECONDS = 10 * 60  # How long a claimed delivery waits before another worker may retry it
+QUEUED_KEY = 'notifications:delivery:queued'
+QUEUED_SECONDS = 5
+
+Message = namedtuple('Message', 'user_id channel address title body action_url delivery_ids')
+
+
+class Route:
+    """One user's compiled delivery preferences"""
+    __slots__ = ('channels', 'by_type', 'quiet')
+
+    def __init__(self, channels, by_type=None, quiet=None):
+        self.channels = channels  # Channels enabled by default
+        self.by_type = by_type or {}  # type -> channels, where preferences_by_type overrides the default
+        self.quiet = quiet  # (start, end) day minutes, or None
+
+    @classmethod
+    def compile(cls, email, push, sms, quiet_start, quiet_end, by_type):
+        enabled = {'email': email, 'push': push, 'sms': sms}
+        channels = tuple(channel for channel in CHANNELS if enabled[channel])
+        overrides = {}
+        for type, value in (by_type or {}).items():
+            if isinstance(value, bool):
+                overrides[type] = channels if value else ()
+            elif isinstance(value, dict):
+                if value.get('enabled') is False:
+                    overrides[type] = ()
+                else:
+                    overrides[type] = tuple(channel for channel in CHANNELS
+                                            if value.get(channel, enabled[channel]))
+        quiet = None
+        if quiet_start is not None and quiet_end is not None and quiet_start != quiet_end:
+            quiet = (quiet_start.hour * 60 + quiet_start.minute, quiet_end.hour * 60 + quiet_end.minute)
+        return cls(channels, overrides, quiet)
+
+    def channels_for(self, type):
+        return self.by_type.get(type, self.channels)
+
+    def is_quiet(self, minute):
+        start, end = self.quiet
+        if start < end:
+            return start <= minute < end
+        return minute >= start or minute < end  # Overnight window
+
+
+# Users without a NotificationPreference row get the model's defaults
+DEFAULT_ROUTE = Route(('email', 'push'))
+
+
+def load_routes(user_ids):
+    """{user_id: Route} for the users that have preferences, in one query"""
+    rows = NotificationPreference.objects.filter(user_id__in=user_ids).values_list(
+        'user_id', 'email_enabled', 'push_enabled', 'sms_enabled', 'quiet_hours_start', 'quiet_hours_end',
+        'preferences_by_type')
+    return {user_id: Route.compile(*fields) for user_id, *fields in rows}
+
+
+class _Releases:
+    """When held-back deliveries go out: the end of the quiet window that contains ``now``"""
+
+    def __init__(self, now):
+        self.now = now
+        self.local = timezone.localtime(now)
+        self.minute = self.local.hour * 60 + self.local.minute
+        self.ends = {}
+
+    def release(self, route):
+        if route.quiet is None or not route.is_quiet(self.minute):
+            return None
+        end = route.quiet[1]
+        release = self.ends.get(end)
+        if release is None:
+            day = self.local.date() + timedelta(days=1 if end <= self.minute else 0)
+            naive = datetime.combine(day, datetime.min.time()) + timedelta(minutes=end)
+            release = self.ends[end] = timezone.make_aware(naive, self.local.tzinfo)
+        return release
+
+
+def _insert_deliveries(rows):
+    """INSERT (notification_id, user_id, channel, send_after, deferred) tuples as pending deliveries"""
+    meta = NotificationDelivery._meta
+    quote = connection.ops.quote_name
+    columns = [meta.get_field(name).column for name in
+               ('notification', 'user', 'channel', 'send_after', 'deferred', 'status', 'attempts', 'error')]
+    send_after = meta.get_field('send_after')
+    prepared = {}
+    params = []
+    for notification_id, user_id, channel, moment, deferred in rows:
+        value = prepared.get(moment)
+        if value is None:
+            value = prepared[moment] = send_after.get_db_prep_save(moment, connection)
+        params.append((notification_id, user_id, channel, value, deferred, 'pending', 0, ''))
+    sql = (f"INSERT INTO {quote(meta.db_table)} ({', '.join(quote(column) for column in columns)}) "
+           f"VALUES ({', '.join(['%s'] * len(columns))})")
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
+
+
+def route_pending(now=None, chunk_size=CHUNK_SIZE):
+    """Plan deliveries for every unrouted notification; returns how many deliveries were created"""
+    planned = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                Notification.objects.select_for_update(skip_locked=True).filter(routed=False)
+                .order_by('id').values_list('id', 'user_id', 'type', 'priority')[:chunk_size]
+            )
+            if not rows:
+                return planned
+            releases = _Releases(now or timezone.now())
+            routes = load_routes({user_id for _, user_id, _, _ in rows})
+            deliveries = []
+            for notification_id, user_id, type, priority in rows:
+                route = routes.get(user_id, DEFAULT_ROUTE)
+                channels = route.channels_for(type)
+                if not channels:
+                    continue
+                release = None if priority == 'urgent' else releases.release(route)
+                for channel in channels:
+                    deliveries.append((notification_id, user_id, channel, release or releases.now,
+                                       release is not None))
+            if deliveries:
+                _insert_deliveries(deliveries)
+            Notification.objects.filter(id__in=[row[0] for row in rows]).update(routed=True)
+        planned += len(deliveries)
+
+
+def _messages(rows):
+    """Group due deliveries into one message per (user, channel), as a digest when there are several"""
+    groups = defaultdict(list)
+    for row in rows:
+        groups[(row['user_id'], row['channel'])].append(row)
+    messages = []
+    for (user_id, channel), group in groups.items():
+        first = group[0]
+        if len(group) == 1:
+            title = first['notification__title']
+            body = first['notification__message']
+            action_url = first['notification__action_url']
+        else:
+            title = f"{len(group)} new notifications"
+            body = '\n'.join(f"- {row['notification__title']}" for row in group)
+            action_url = ''
+        messages.append(Message(user_id, channel, first['user__email'], title, body, action_url,
+                                [row['id'] for row in group]))
+    return messages
+
+
+_backends = {}
+
+
+def get_backend(channel):
+    backend = _backends.get(channel)
+    if backend is None:
+        backend = _backends[channel] = import_string(settings.NOTIFICATION_BACKENDS[channel])(channel)
+    return backend
+
+
+def _send(backend, messages):
+    try:
+        return backend.send(messages)
+    except Exception as exc:
+        logger.exception("Notification backend %s failed for %d messages", backend.channel, len(messages))
+        return [str(exc) or exc.__class__.__name__] * len(messages)
+
+
+def _claim(now, chunk_size):
+    """Mark a chunk of due deliveries as sending and commit, so no other worker picks them up"""
+    with transaction.atomic():
+        rows = list(
+            NotificationDelivery.objects.select_for_update(skip_locked=True, of=('self',))
+            .filter(Q(status='pending') | Q(status='sending'), send_after__lte=now).order_by('id')
+            .values('id', 'user_id', 'channel', 'attempts', 'user__email', 'notification__title',
+                    'notification__message', 'notification__action_url')[:chunk_size]
+        )
+        if rows:
+            # A worker that dies mid-send leaves its rows to be claimed again once the lease runs out
+            NotificationDelivery.objects.filter(id__in=[row['id'] for row in rows]).update(
+                status='sending', send_after=now + timedelta(seconds=SENDING_SECONDS), attempts=F('attempts') + 1)
+    return rows
+
+
+def dispatch_due(now=None, chunk_size=CHUNK_SIZE, backends=None):
+    """Send every delivery that is due; returns (sent, failed) delivery counts"""
+    now = now or timezone.now()
+    sent = failed = 0
+    while True:
+        rows = _claim(now, chunk_size)
+        if not rows:
+            return sent, failed
+        attempts = {row['id']: row['attempts'] + 1 for row in rows}
+
+        # Sent outside any transaction: a slow gateway holds no locks
+        by_channel = defaultdict(list)
+        delivered, errors, permanent = [], {}, {}
+        for message in _messages(rows):
+            if message.channel == 'email' and not message.address:
+                permanent.update(dict.fromkeys(message.delivery_ids, "User has no email address"))
+            else:
+                by_channel[message.channel].append(message)
+        for channel, messages in by_channel.items():
+            backend = (backends or {}).get(channel) or get_backend(channel)
+            for message, error in zip(messages, _send(backend, messages)):
+                if error is None:
+                    delivered.extend(message.delivery_ids)
+                else:
+                    errors.update(dict.fromkeys(message.delivery_ids, error))
+
+        with transaction.atomic():
+            NotificationDelivery.objects.filter(id__in=delivered).update(status='sent', sent_at=now, error='')
+            retries = defaultdict(list)
+            for delivery_id, error in errors.items():
+                retries[(attempts[delivery_id], error)].append(delivery_id)
+            for (attempt, error), ids in retries.items():
+                if attempt >= MAX_ATTEMPTS:
+                    changes = {'status': 'failed'}
+                else:
+                    changes = {'status': 'pending',
+                               'send_after': now + timedelta(seconds=RETRY_SECONDS * 2 ** (attempt - 1))}
+                NotificationDelivery.objects.filter(id__in=ids).update(error=error, **changes)
+            by_error = defaultdict(list)
+            for delivery_id, error in permanent.items():
+                by_error[error].append(delivery_id)
+            for error, ids in by_error.items():
+                NotificationDelivery.objects.filter(id__in=ids).update(status='failed', error=error)
+        sent += len(delivered)
+        failed += len(errors) + len(permanent)
+
+
+def deliver(now=None):
+    """Coalesce and route new notifications, then send whatever is due; returns (planned, sent, failed)"""
+    coalesce()
+    planned = route_pending(now)
+    return (planned, *dispatch_due(now))
+
+
+def _enqueue():
+    # Bursts of notifications share one task; anything missed is picked up by the beat schedule
+    if not cache.add(QUEUED_KEY, True, QUEUED_SECONDS):
+        return
+    from .tasks import deliver_notifications
+
+    try:
+        deliver_notifications.delay()
+    except Exception:
+        cache.delete(QUEUED_KEY)
+        logger.warning("Could not queue notification delivery; leaving it to the periodic task", exc_info=True)
+
+
+def schedule():
+    """Queue delivery of new notifications once the current transaction commits"""
+    transaction.on_commit(_enqueue)
+
+
+def notification_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        schedule()
+
+
+def connect_signals():
+    from django.db.models.signals import post_save
+
+    post_save.connect(notification_created, sender=Notification, dispatch_uid='delivery.created')
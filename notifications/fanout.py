@@ -0,0 +1,202 @@
+# notifications/fanout.py
+"""
+Creating notifications for many users at once.
+
+An audience is a queryset of user ids: the students in a class section,
+an event's RSVPs, a route's subscribers, customers with open orders.
+``fan_out`` turns it into a single INSERT ... SELECT, with the audience
+as the subquery. The database writes every row itself, so a broadcast
+to 100k users is one statement, and no rows pass through Python.
+
+Audiences given as plain lists of ids, and senders whose notifications
+differ per recipient (one per order, say), go through ``write`` instead.
+It bulk_creates an iterable of Notifications in BATCH_SIZE chunks, so
+memory stays bounded.
+
+Given a ``dedup`` identity, both paths skip recipients who already have
+that notification (see dedup), so a repeated or retried fan-out creates
+nothing new.
+
+Both paths raise the recipients' unread counters in the same transaction,
+and queue the new notifications for email/push/SMS delivery once it
+commits (see delivery).
+"""
+from collections import Counter
+from itertools import islice
+
+from django.db import connection, transaction
+from django.db.models import CharField, QuerySet, Value
+from django.db.models.constants import OnConflict
+from django.db.models.functions import Cast, Concat
+from django.utils import timezone
+
+from . import delivery, inbox
+from .dedup import digest, key as dedup_key
+from .models import Notification
+
+BATCH_SIZE = 2000
+
+
+def write(notifications, batch_size=BATCH_SIZE):
+    """
+    bulk_create an iterable of unsaved Notifications in chunks; returns how many were written.
+
+    Notifications whose ``dedup_key`` already exists are skipped.
+    """
+    notifications = iter(notifications)
+    written = 0
+    while True:
+        batch = list(islice(notifications, batch_size))
+        if not batch:
+            if written:
+                delivery.schedule()
+            return written
+        keys = {notification.dedup_key for notification in batch if notification.dedup_key}
+        if keys:
+            fresh = keys - set(Notification.objects.filter(dedup_key__in=keys).values_list('dedup_key', flat=True))
+            kept = []
+            for notification in batch:
+                if notification.dedup_key is None:
+                    kept.append(notification)
+                elif notification.dedup_key in fresh:
+                    fresh.discard(notification.dedup_key)
+                    kept.append(notification)
+            batch = kept
+            if not batch:
+                continue
+        with transaction.atomic():
+            started = timezone.now()
+            Notification.objects.bulk_create(batch, ignore_conflicts=bool(keys))
+            if keys:
+                # A concurrent writer may still take a key between the check above and here; count only ours
+                ours = set(Notification.objects.filter(
+                    dedup_key__in=[notification.dedup_key for notification in batch if notification.dedup_key],
+                    created_at__gte=started,
+                ).values_list('dedup_key', flat=True))
+                batch = [notification for notification in batch
+                         if notification.dedup_key is None or notification.dedup_key in ours]
+            inbox.add_unread(Counter(notification.user_id for notification in batch if not notification.read))
+        written += len(batch)
+
+
+def fan_out(audience, type, title, message, priority='medium', action_url='', related_object_type='',
+            related_object_id=None, exclude=(), dedup=None, batch_size=BATCH_SIZE):
+    """
+    Send one notification to every user in ``audience``; returns how many were created.
+
+    ``audience`` is a flat values_list of user ids (see the audience
+    helpers below) or any iterable of ids. ``exclude`` holds user ids to skip,
+    such as the sender. ``dedup`` identifies the event, such as
+    ``('bus_alert', alert.pk)``; users who already have a notification for
+    it are skipped.
+    """
+    values = {
+        'type': type,
+        'title': title,
+        'message': message,
+        'priority': priority,
+        'action_url': action_url,
+        'related_object_type': related_object_type,
+        'related_object_id': related_object_id,
+    }
+    if isinstance(audience, QuerySet):
+        return _insert_select(audience, values, exclude, dedup)
+
+    skip = set(exclude)
+    return write((Notification(user_id=user_id, dedup_key=dedup_key(dedup, user_id) if dedup else None,
+                                       **values)
+                  for user_id in audience if user_id not in skip),
+                 batch_size)
+
+
+def _insert_select(audience, values, exclude, dedup=None):
+    """INSERT ... SELECT one notification per user id in the audience subquery"""
+    from accounts.models import User
+
+    # Going through User also removes duplicate ids and ids of deleted users
+    user_ids = User.objects.filter(id__in=audience)
+    if exclude:
+        user_ids = user_ids.exclude(id__in=list(exclude))
+    user_ids = user_ids.values_list('id', flat=True)
+    columns = ['user']
+    select = user_ids
+    if dedup:
+        # Each row's key is the event digest followed by the user id, built inside the SELECT
+        prefix = f'{digest(dedup)}:'
+        select = user_ids.annotate(
+            notification_key=Concat(Value(prefix), Cast('id', CharField()), output_field=CharField()),
+        ).values_list('id', 'notification_key')
+        columns.append('dedup_key')
+    select_sql, select_params = select.query.sql_with_params()
+
+    stamp = timezone.now()
+    meta = Notification._meta
+    # Raw SQL skips model defaults, so every other column gets its default here
+    values = dict({field.name: field.get_default() for field in meta.concrete_fields
+                   if not field.primary_key and field.name not in columns},
+                  **values, created_at=stamp)
+    quote = connection.ops.quote_name
+    columns = [meta.get_field(name).column for name in [*columns, *values]]
+    params = [meta.get_field(name).get_db_prep_save(value, connection) for name, value in values.items()]
+    on_conflict = OnConflict.IGNORE if dedup else None
+    sql = (
+        f"{connection.ops.insert_statement(on_conflict=on_conflict)} {quote(meta.db_table)} "
+        f"({', '.join(quote(column) for column in columns)}) "
+        f"SELECT audience.*, {', '.join(['%s'] * len(params))} FROM ({select_sql}) audience "
+        f"{connection.ops.on_conflict_suffix_sql([], on_conflict, [], [])}"
+    )
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(sql, (*params, *select_params))
+            created = cursor.rowcount
+        if dedup:
+            # Only users who got a new row; the rest already had this notification
+            user_ids = Notification.objects.filter(
+                dedup_key__startswith=prefix, created_at=stamp).values_list('user_id', flat=True)
+        if created:
+            inbox.add_unread_for(user_ids)
+    if created:
+        delivery.schedule()
+    return created
+
+
+def section_students(section_id):
+    """Students enrolled in a class section"""
+    from academics.models import Enrollment
+
+    return Enrollment.objects.filter(class_section_id=section_id).values_list('student_id', flat=True).distinct()
+
+
+def event_attendees(event_id, statuses=('going', 'maybe')):
+    """Users who RSVPed to an event with one of ``statuses``"""
+    from events.models import EventRSVP
+
+    return (EventRSVP.objects.filter(event_id=event_id, status__in=statuses)
+            .values_list('user_id', flat=True).distinct())
+
+
+def route_riders(route_id):
+    """Users subscribed to a bus route"""
+    from transportation.models import RouteSubscription
+
+    return RouteSubscription.objects.filter(route_id=route_id).values_list('user_id', flat=True)
+
+
+def open_order_customers(cafeteria_id=None):
+    """Customers with an order that is still pending, preparing or ready; optionally at one cafeteria"""
+    from cafeteria.models import Order
+
+    orders = Order.objects.filter(status__in=('pending', 'preparing', 'ready'))
+    if cafeteria_id is not None:
+        orders = orders.filter(cafeteria_id=cafeteria_id)
+    return orders.values_list('user_id', flat=True).distinct()
+
+
+def users(role=None, **filters):
+    """Active users, optionally with one role; for campus-wide broadcasts"""
+    from accounts.models import User
+
+    queryset = User.objects.filter(is_active=True, **filters)
+    if role:
+        queryset = queryset.filter(role=role)
+    return queryset.values_list('id', flat=True)
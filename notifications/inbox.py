@@ -0,0 +1,162 @@
+# notifications/inbox.py
+"""
+Per-user inbox: unread counters, keyset pages and bulk mark-as-read.
+
+Each user's unread count lives in an UnreadCounter row, which is changed
+only by relative ``F()`` updates in the same transaction as the
+notifications themselves. A counter row is created from a real COUNT the
+first time it is read. ``recount`` rebuilds counters after changes made
+behind the inbox's back, such as deleting unread notifications. It makes
+sure the row exists, locks it and only then counts, so notifications
+written meanwhile are either counted or added to the counter after it,
+never lost or counted twice.
+
+The count is also cached per user, so the header badge (see
+context_processors) costs no queries on most page views. Cached counts
+are tagged with the user's cache generation, read before the counter
+is. A transaction that moves the counter replaces the generation once it
+commits, so a count a reader loaded from the old counter meanwhile is
+never served, even if it is cached after the commit.
+
+Inbox pages are keyed on notification id (newest first) rather than
+OFFSET, so page N costs the same as page 1.
+"""
+from collections import defaultdict
+from functools import partial
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import Notification, UnreadCounter
+
+COUNT_KEY = 'notifications:unread:{}'
+GENERATION_KEY = 'notifications:unread:{}:generation'
+COUNT_TIMEOUT = 60 * 60
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+FIELDS = ('id', 'type', 'title', 'message', 'priority', 'action_url', 'related_object_type',
+          'related_object_id', 'occurrences', 'created_at', 'read', 'read_at')
+
+
+def _forget(user_ids):
+    generation = uuid4().hex
+    keys = {GENERATION_KEY.format(user_id): generation for user_id in user_ids}
+    if keys:
+        transaction.on_commit(partial(cache.set_many, keys, None))
+
+
+def unread_count(user_id):
+    key, generation_key = COUNT_KEY.format(user_id), GENERATION_KEY.format(user_id)
+    cached = cache.get_many([key, generation_key])
+    generation = cached.get(generation_key)
+    if generation is None:
+        cache.add(generation_key, uuid4().hex, None)
+        generation = cache.get(generation_key)
+    entry = cached.get(key)
+    if entry is not None and entry[0] == generation:
+        return entry[1]
+
+    count = UnreadCounter.objects.filter(user_id=user_id).values_list('unread', flat=True).first()
+    if count is None:
+        count = recount(user_id)
+    cache.set(key, (generation, count), COUNT_TIMEOUT)
+    return count
+
+
+def recount(user_id=None):
+    """Rebuild one user's counter from their notifications, or every counter; returns the user's count"""
+    if user_id is not None:
+        with transaction.atomic():
+            UnreadCounter.objects.bulk_create([UnreadCounter(user_id=user_id)], ignore_conflicts=True)
+            UnreadCounter.objects.select_for_update().get(user_id=user_id)
+            count = Notification.objects.filter(user_id=user_id, read=False).count()
+            UnreadCounter.objects.filter(user_id=user_id).update(unread=count)
+            _forget([user_id])
+        return count
+
+    with transaction.atomic():
+        stale = list(UnreadCounter.objects.values_list('user_id', flat=True))
+        UnreadCounter.objects.all().delete()
+        UnreadCounter.objects.bulk_create(
+            [UnreadCounter(user_id=row['user_id'], unread=row['unread']) for row in
+             Notification.objects.filter(read=False).values('user_id').annotate(unread=Count('id'))],
+            batch_size=1000,
+        )
+    _forget(stale)
+    return None
+
+
+def add_unread(counts):
+    """Change counters by ``{user_id: unread notifications added (or removed, when negative)}``"""
+    by_amount = defaultdict(list)
+    for user_id, amount in counts.items():
+        if amount:
+            by_amount[amount].append(user_id)
+    for amount, user_ids in by_amount.items():
+        # Lowering never goes below zero, as in mark_read, even if the counter had drifted
+        unread = F('unread') + amount if amount > 0 else Greatest(F('unread') + amount, 0)
+        UnreadCounter.objects.filter(user_id__in=user_ids).update(unread=unread)
+    _forget(counts)
+
+
+def add_unread_for(user_ids, chunk_size=5000):
+    """Raise by one the counter of every user in a user-id queryset"""
+    counters = UnreadCounter.objects.filter(user_id__in=user_ids)
+    counters.update(unread=F('unread') + 1)
+    # Only users with a counter row can have a cached count
+    chunk = []
+    for user_id in counters.values_list('user_id', flat=True).iterator(chunk_size=chunk_size):
+        chunk.append(user_id)
+        if len(chunk) >= chunk_size:
+            _forget(chunk)
+            chunk = []
+    _forget(chunk)
+
+
+def page(user_id, before=None, limit=PAGE_SIZE, unread_only=False, type=None):
+    """(notifications, next cursor) newest first; pass the cursor back as ``before`` for the next page"""
+    notifications = Notification.objects.filter(user_id=user_id)
+    if before is not None:
+        notifications = notifications.filter(id__lt=before)
+    if unread_only:
+        notifications = notifications.filter(read=False)
+    if type:
+        notifications = notifications.filter(type=type)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    rows = list(notifications.order_by('-id').values(*FIELDS)[:limit + 1])
+    return rows[:limit], (rows[limit - 1]['id'] if len(rows) > limit else None)
+
+
+def mark_read(user_id, ids=None, up_to=None, type=None):
+    """Mark a user's unread notifications read by ids, up to an id and/or by type; returns how many changed"""
+    notifications = Notification.objects.filter(user_id=user_id, read=False)
+    if ids is not None:
+        notifications = notifications.filter(id__in=ids)
+    if up_to is not None:
+        notifications = notifications.filter(id__lte=up_to)
+    if type:
+        notifications = notifications.filter(type=type)
+
+    with transaction.atomic():
+        updated = notifications.update(read=True, read_at=timezone.now())
+        if updated:
+            UnreadCounter.objects.filter(user_id=user_id).update(unread=Greatest(F('unread') - updated, 0))
+    if updated:
+        _forget([user_id])
+    return updated
+
+
+def notification_created(sender, instance, created, raw=False, **kwargs):
+    # Bulk writers (see fanout) update counters themselves; this covers one-off saves
+    if created and not raw and not instance.read:
+        add_unread({instance.user_id: 1})
+
+
+def connect_signals():
+    from django.db.models.signals import post_save
+
+    post_save.connect(notification_created, sender=Notification, dispatch_uid='inbox.created')
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from notifications import retention
+
+
+class Command(BaseCommand):
+    help = "Delete expired notifications, archive old read ones and purge the archive, reporting throughput"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=retention.CHUNK_SIZE)
+        parser.add_argument('--pause', type=float, default=0, help="Seconds to sleep between chunks")
+
+    def handle(self, *args, **options):
+        results = retention.apply(chunk_size=options['chunk_size'], pause=options['pause'])
+        for name, (rows, seconds) in results.items():
+            rate = rows / seconds if seconds else 0
+            self.stdout.write(self.style.SUCCESS(f"{name.capitalize()} {rows} notifications in {seconds:.2f} s "
+                                                 f"({rate:,.0f}/s)"))
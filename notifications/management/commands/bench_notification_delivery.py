@@ -0,0 +1,61 @@
+import time
+from datetime import time as clock
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from accounts.models import User
+from notifications import delivery, fanout
+from notifications.backends import DummyBackend
+from notifications.models import NotificationPreference
+
+
+class Command(BaseCommand):
+    help = "Benchmark routing and dispatching a broadcast to synthetic users (rolled back afterwards)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20000)
+        parser.add_argument('--chunk-size', type=int, default=delivery.CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        count = options['users']
+        now = timezone.now()
+        local = timezone.localtime(now)
+        # A quiet window around now, so every third user's deliveries are held for a digest
+        quiet_start = clock((local.hour - 1) % 24, 0)
+        quiet_end = clock((local.hour + 2) % 24, 0)
+
+        with transaction.atomic():
+            users = User.objects.bulk_create(
+                [User(username=f'delivery-bench-{i}', password='!') for i in range(count)], batch_size=5000)
+            NotificationPreference.objects.bulk_create([
+                NotificationPreference(
+                    user=user, sms_enabled=i % 4 == 0,
+                    quiet_hours_start=quiet_start if i % 3 == 0 else None,
+                    quiet_hours_end=quiet_end if i % 3 == 0 else None,
+                    preferences_by_type={'system': {'push': False}} if i % 5 == 0 else {},
+                )
+                for i, user in enumerate(users) if i % 2 == 0
+            ], batch_size=5000)
+            fanout.fan_out(fanout.users(username__startswith='delivery-bench-'), type='system',
+                           title="Benchmark broadcast", message="Delivery benchmark")
+
+            started = time.perf_counter()
+            planned = delivery.route_pending(now, options['chunk_size'])
+            routed = time.perf_counter() - started
+
+            backends = {channel: DummyBackend(channel) for channel in delivery.CHANNELS}
+            started = time.perf_counter()
+            sent, failed = delivery.dispatch_due(now, options['chunk_size'], backends)
+            dispatched = time.perf_counter() - started
+            started = time.perf_counter()
+            digested, _ = delivery.dispatch_due(now + timezone.timedelta(days=1), options['chunk_size'], backends)
+            digests = time.perf_counter() - started
+
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"Routed {planned} deliveries in {routed:.2f} s ({planned / routed:,.0f}/s)")
+        self.stdout.write(f"Sent {sent} due deliveries ({failed} failed) in {dispatched:.2f} s "
+                          f"({sent / dispatched:,.0f}/s)")
+        self.stdout.write(f"Sent {digested} held-back deliveries in {digests:.2f} s")
@@ -0,0 +1,43 @@
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from accounts.models import User
+from notifications import fanout
+
+
+class Command(BaseCommand):
+    help = "Benchmark a broadcast to a synthetic audience of users (rolled back afterwards)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100000)
+        parser.add_argument('--batch-size', type=int, default=fanout.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            started = time.perf_counter()
+            User.objects.bulk_create(
+                [User(username=f'fanout-bench-{i}', password='!') for i in range(options['users'])],
+                batch_size=5000,
+            )
+            self.stdout.write(f"Inserted {options['users']} users in {time.perf_counter() - started:.2f} s")
+
+            tracemalloc.start()
+            started = time.perf_counter()
+            created = fanout.fan_out(
+                fanout.users(username__startswith='fanout-bench-'),
+                type='system',
+                title="Benchmark broadcast",
+                message="Fan-out benchmark",
+                batch_size=options['batch_size'],
+            )
+            elapsed = time.perf_counter() - started
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"Created {created} notifications in {elapsed:.2f} s "
+                          f"({created / elapsed:,.0f}/s), peak Python memory {peak / 2 ** 20:.1f} MiB")
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from notifications.inbox import recount
+from notifications.models import UnreadCounter
+
+
+class Command(BaseCommand):
+    help = "Rebuild every user's unread notification counter from their notifications"
+
+    def handle(self, *args, **options):
+        recount()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {UnreadCounter.objects.count()} unread counters"))
@@ -32,6 +32,17 @@ class Notification(models.Model):
     action_url = models.CharField(max_length=255, blank=True)  # URL to navigate to when clicked
     related_object_type = models.CharField(max_length=50, blank=True)  # For polymorphic relations
     related_object_id = models.PositiveIntegerField(null=True, blank=True)
+    routed = models.BooleanField(default=False)  # Deliveries planned; see notifications.delivery
+    dedup_key = models.CharField(max_length=64, unique=True, null=True, blank=True)  # See notifications.dedup
+    occurrences = models.PositiveIntegerField(default=1)  # Repeats coalesced into this notification
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of a user's inbox, newest first
+            models.Index(fields=['user', '-id'], name='notif_user_id_idx'),
+            models.Index(fields=['id'], condition=models.Q(routed=False), name='notif_unrouted_idx'),
+            models.Index(fields=['created_at'], name='notif_created_idx'),
+        ]
 
 
 class NotificationPreference(models.Model):
@@ -41,4 +52,60 @@ class NotificationPreference(models.Model):
     sms_enabled = models.BooleanField(default=False)
     quiet_hours_start = models.TimeField(null=True, blank=True)
     quiet_hours_end = models.TimeField(null=True, blank=True)
-    preferences_by_type = models.JSONField(default=dict)  # Detailed preferences for each notification type
\ No newline at end of file
+    preferences_by_type = models.JSONField(default=dict)  # Detailed preferences for each notification type
+
+
+class NotificationDelivery(models.Model):
+    """One notification on one external channel, sent by notifications.delivery"""
+    CHANNELS = (
+        ('email', 'Email'),
+        ('push', 'Push'),
+        ('sms', 'SMS'),
+    )
+
+    STATUSES = (
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),  # Claimed by a worker; see notifications.delivery
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    )
+
+    notification = models.ForeignKey(Notification, on_delete=models.CASCADE, related_name='deliveries')
+    user = models.ForeignKey('accounts.User', on_delete=models.CASCADE, related_name='notification_deliveries')
+    channel = models.CharField(max_length=10, choices=CHANNELS)
+    status = models.CharField(max_length=10, choices=STATUSES, default='pending')
+    send_after = models.DateTimeField()  # Later than creation when held back by quiet hours
+    deferred = models.BooleanField(default=False)  # Held for quiet hours; goes out in a digest
+    attempts = models.PositiveSmallIntegerField(default=0)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'send_after'], name='notif_delivery_due_idx'),
+        ]
+
+
+class ArchivedNotification(models.Model):
+    """A read notification moved out of the live table by notifications.retention"""
+    id = models.BigIntegerField(primary_key=True)  # The original notification's id
+    user = models.ForeignKey('accounts.User', on_delete=models.CASCADE, related_name='archived_notifications')
+    type = models.CharField(max_length=20, choices=Notification.TYPES)
+    priority = models.CharField(max_length=10, choices=Notification.PRIORITIES)
+    created_at = models.DateTimeField()
+    read_at = models.DateTimeField(null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+    content = models.BinaryField()  # zlib-compressed JSON of the remaining fields; see retention.unpack
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-id'], name='notif_archive_user_idx'),
+            models.Index(fields=['created_at'], name='notif_archive_created_idx'),
+        ]
+
+
+class UnreadCounter(models.Model):
+    """Denormalised count of a user's unread notifications, kept by notifications.inbox"""
+    user = models.OneToOneField('accounts.User', on_delete=models.CASCADE, primary_key=True,
+                                related_name='notification_counter')
+    unread = models.PositiveIntegerField(default=0)
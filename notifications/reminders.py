@@ -0,0 +1,193 @@
+# notifications/reminders.py
+"""
+Reminders before assignment due dates, exams and events.
+
+Each source in SOURCES names a model, its datetime field, who is
+reminded and what the notification says. A reminder fires at each of
+NOTIFICATION_REMINDER_OFFSETS before the object's time: 24 hours and 1
+hour by default.
+
+A ReminderQueue holds the reminder instants of the next WINDOW in a heap.
+It fills the heap with one range query per source on the indexed datetime
+fields, loading the next stretch when half the window has gone.
+``send_due`` (every minute from the beat schedule, see tasks) pops
+whatever is due. It re-reads those few objects and fans each reminder
+out to its audience.
+
+Reschedules are incremental. Assignments, exams and events carry an
+indexed ``updated_at``. Each run the queue re-reads the objects saved
+since the newest ``updated_at`` it has seen, and pushes their new
+instants. Saves commit a little after they are stamped, so the query
+looks back CHANGE_SLACK further, skipping versions it already applied.
+This needs nothing shared between web and worker processes besides the
+database. Old instants stay in the heap. When one is popped it no longer
+matches the object's time (or the object is gone), so it is dropped.
+
+Every reminder's fan-out carries a dedup identity of kind, id, offset
+and instant (see dedup). A worker that restarts and reloads a recently
+missed reminder, or two workers popping the same one, still deliver it
+once.
+"""
+import heapq
+import threading
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.utils import timezone
+
+from . import fanout
+
+WINDOW = timedelta(hours=6)
+GRACE = timedelta(minutes=15)  # Reminders this late are still sent, e.g. after a worker restart
+CHANGE_SLACK = timedelta(minutes=5)  # Longest expected gap between a save's updated_at and its commit
+
+
+class Source:
+    """Something people are reminded of"""
+
+    def __init__(self, model, field, type, title, audience, action_url):
+        self.model = model  # 'app_label.ModelName'; needs an indexed auto_now ``updated_at``
+        self.field = field  # The DateTimeField reminded about
+        self.type = type
+        self.title = title  # Format string with {title} and {when}
+        self.audience = audience  # object -> queryset of user ids
+        self.action_url = action_url  # object -> URL
+
+    def get_model(self):
+        return apps.get_model(self.model)
+
+    def moment(self, row):
+        return getattr(row, self.field)
+
+
+SOURCES = {
+    'assignment': Source(
+        'academics.Assignment', 'due_date', 'academic', "{title} is due {when}",
+        lambda assignment: fanout.section_students(assignment.class_section_id),
+        lambda assignment: f"/academics/sections/{assignment.class_section_id}/",
+    ),
+    'exam': Source(
+        'academics.Exam', 'date', 'academic', "Exam {title} starts {when}",
+        lambda exam: fanout.section_students(exam.class_section_id),
+        lambda exam: f"/academics/sections/{exam.class_section_id}/",
+    ),
+    'event': Source(
+        'events.Event', 'start_datetime', 'event', "{title} starts {when}",
+        lambda event: fanout.event_attendees(event.pk),
+        lambda event: '',
+    ),
+}
+
+
+def offsets():
+    """Minutes before an object's time at which reminders fire, largest first"""
+    return tuple(sorted(getattr(settings, 'NOTIFICATION_REMINDER_OFFSETS', (24 * 60, 60)), reverse=True))
+
+
+def describe(minutes):
+    if minutes % 60 == 0:
+        hours = minutes // 60
+        return "in 1 hour" if hours == 1 else f"in {hours} hours"
+    return f"in {minutes} minutes"
+
+
+class ReminderQueue:
+    """Heap of upcoming (fire_at, kind, object_id, offset, moment) reminders"""
+
+    def __init__(self):
+        self.heap = []
+        self.loaded_until = None
+        self.changed_after = None  # Newest updated_at seen
+        self.applied = {}  # (kind, id) -> updated_at already pushed, for saves within CHANGE_SLACK
+
+    def _push(self, kind, object_id, moment, start, end):
+        for offset in offsets():
+            fire_at = moment - timedelta(minutes=offset)
+            if start <= fire_at < end:
+                heapq.heappush(self.heap, (fire_at, kind, object_id, offset, moment))
+
+    def load(self, start, end):
+        """Add every reminder firing in [start, end), one range query per source"""
+        minutes = offsets()
+        for kind, source in SOURCES.items():
+            rows = source.get_model().objects.filter(**{
+                f'{source.field}__gte': start + timedelta(minutes=minutes[-1]),
+                f'{source.field}__lt': end + timedelta(minutes=minutes[0]),
+            }).values_list('pk', source.field)
+            for object_id, moment in rows:
+                self._push(kind, object_id, moment, start, end)
+        self.loaded_until = end
+
+    def refresh(self, now):
+        """Push the current reminders of objects saved since the last look; replaced instants drop out when popped"""
+        since = self.changed_after - CHANGE_SLACK
+        newest = self.changed_after
+        for kind, source in SOURCES.items():
+            rows = (source.get_model().objects.filter(updated_at__gte=since)
+                    .values_list('pk', source.field, 'updated_at'))
+            for object_id, moment, updated_at in rows:
+                if self.applied.get((kind, object_id)) == updated_at:
+                    continue
+                self.applied[(kind, object_id)] = updated_at
+                newest = max(newest, updated_at)
+                self._push(kind, object_id, moment, now - GRACE, self.loaded_until)
+        self.changed_after = newest
+        self.applied = {key: updated_at for key, updated_at in self.applied.items()
+                        if updated_at >= newest - CHANGE_SLACK}
+
+    def pop_due(self, now):
+        due = set()
+        while self.heap and self.heap[0][0] <= now:
+            due.add(heapq.heappop(self.heap))
+        return due
+
+
+_state = {'queue': None}
+_lock = threading.Lock()
+
+
+def _due(now):
+    with _lock:
+        queue = _state['queue']
+        if queue is None:
+            queue = ReminderQueue()
+            queue.changed_after = now
+            queue.load(now - GRACE, now + WINDOW)
+            _state['queue'] = queue
+        queue.refresh(now)
+        if queue.loaded_until - now < WINDOW / 2:
+            queue.load(queue.loaded_until, now + WINDOW)
+        return queue.pop_due(now)
+
+
+def send_due(now=None):
+    """Fan out every reminder whose time has come; returns notifications created"""
+    now = now or timezone.now()
+    due = _due(now)
+    by_kind = {}
+    for fire_at, kind, object_id, offset, moment in due:
+        by_kind.setdefault(kind, []).append((object_id, offset, moment))
+
+    created = 0
+    for kind, entries in by_kind.items():
+        source = SOURCES[kind]
+        objects = source.get_model().objects.in_bulk({object_id for object_id, _, _ in entries})
+        for object_id, offset, moment in sorted(entries, key=lambda entry: entry[2]):
+            row = objects.get(object_id)
+            # Deleted, rescheduled since this entry was queued, or already started
+            if row is None or source.moment(row) != moment or moment <= now:
+                continue
+            local = timezone.localtime(moment)
+            created += fanout.fan_out(
+                source.audience(row),
+                type=source.type,
+                title=source.title.format(title=row.title, when=describe(offset))[:200],
+                message=f"{row.title}: {local:%A %d %B, %H:%M}",
+                priority='high' if offset <= 60 else 'medium',
+                action_url=source.action_url(row),
+                related_object_type=kind,
+                related_object_id=object_id,
+                dedup=('reminder', kind, object_id, offset, moment.isoformat()),
+            )
+    return created
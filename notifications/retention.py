@@ -0,0 +1,177 @@
+# notifications/retention.py
+"""
+Keeping the live notification table small.
+
+``apply`` runs three phases, usually nightly from the beat schedule (see
+tasks):
+
+* delete: NOTIFICATION_DELETE_POLICIES hard-delete notifications of a
+  type and/or priority once they are older than the policy's ``days``,
+  read or not, from the live table and the archive. Unread counters drop
+  by the unread rows removed, counted with the rows locked.
+* archive: read notifications older than NOTIFICATION_ARCHIVE_AFTER_DAYS
+  move to ArchivedNotification. Only the columns worth filtering on stay
+  as columns; the rest is packed into one zlib-compressed JSON blob.
+* purge: archived rows older than NOTIFICATION_ARCHIVE_KEEP_DAYS are
+  deleted, when that setting is not None.
+
+Every phase walks matching ids in ascending order, CHUNK_SIZE at a time,
+and handles each chunk in its own short transaction. Locks are held for
+one chunk and never for the whole run, and the next chunk starts after
+the last id instead of rescanning. The upper id bound comes from the
+created_at index. Rows are moved and deleted with plain SQL, so no model
+instances are built along the way. Each phase reports rows and seconds,
+so throughput shows up in the logs and in the management command.
+"""
+import json
+import logging
+import time
+import zlib
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max, Q
+from django.db.models.constants import OnConflict
+from django.utils import timezone
+
+from . import inbox
+from .models import ArchivedNotification, Notification, NotificationDelivery
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1000
+CONTENT_FIELDS = ('title', 'message', 'action_url', 'related_object_type', 'related_object_id', 'occurrences')
+
+
+def pack(values):
+    return zlib.compress(json.dumps(values, separators=(',', ':')).encode(), 6)
+
+
+def unpack(content):
+    """The archived fields (title, message, ...) of an ArchivedNotification.content"""
+    return json.loads(zlib.decompress(content))
+
+
+def _drain(queryset, handle, chunk_size=CHUNK_SIZE, pause=0):
+    """Call ``handle(ids)`` on the matching ids in ascending chunks, one transaction each; returns rows handled"""
+    high = queryset.aggregate(high=Max('id'))['high']
+    handled, last_id = 0, 0
+    while high is not None:
+        with transaction.atomic():
+            ids = list(queryset.filter(id__gt=last_id, id__lte=high).order_by('id')
+                       .values_list('id', flat=True)[:chunk_size])
+            if not ids:
+                break
+            handled += handle(ids)
+        last_id = ids[-1]
+        if pause:
+            time.sleep(pause)
+    return handled
+
+
+def _remove(ids):
+    """Delete notifications by id without loading them; returns rows deleted"""
+    # QuerySet.delete() would fetch every row to cascade to its deliveries, so those go first
+    NotificationDelivery.objects.filter(notification_id__in=ids).delete()
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {quote(Notification._meta.db_table)} WHERE {quote('id')} IN "
+                       f"({', '.join(['%s'] * len(ids))})", ids)
+        return cursor.rowcount
+
+
+def _delete_notifications(ids):
+    # Locked first, so a concurrent mark_read either finishes before the count or finds the rows gone
+    rows = Notification.objects.select_for_update().filter(id__in=ids).values_list('user_id', 'read')
+    unread = Counter(user_id for user_id, read in rows if not read)
+    deleted = _remove(ids)
+    inbox.add_unread({user_id: -count for user_id, count in unread.items()})
+    return deleted
+
+
+def _delete_archived(ids):
+    deleted, _ = ArchivedNotification.objects.filter(id__in=ids).delete()
+    return deleted
+
+
+def _archive(ids):
+    # Re-checked under the chunk's transaction in case a row was marked unread since it was picked
+    rows = list(Notification.objects.filter(id__in=ids, read=True).values_list(
+        'id', 'user_id', 'type', 'priority', 'created_at', 'read_at', *CONTENT_FIELDS))
+    if not rows:
+        return 0
+
+    meta = ArchivedNotification._meta
+    fields = [meta.get_field(name) for name in
+              ('id', 'user', 'type', 'priority', 'created_at', 'read_at', 'archived_at', 'content')]
+    created_at, read_at, archived_at = fields[4], fields[5], fields[6]
+    now = archived_at.get_db_prep_save(timezone.now(), connection)
+    params = [
+        (notification_id, user_id, type, priority, created_at.get_db_prep_save(created, connection),
+         read_at.get_db_prep_save(read, connection), now, pack(dict(zip(CONTENT_FIELDS, content))))
+        for notification_id, user_id, type, priority, created, read, *content in rows
+    ]
+    quote = connection.ops.quote_name
+    on_conflict = OnConflict.IGNORE  # A rerun after a failed delete finds the rows already archived
+    sql = (f"{connection.ops.insert_statement(on_conflict=on_conflict)} {quote(meta.db_table)} "
+           f"({', '.join(quote(field.column) for field in fields)}) VALUES ({', '.join(['%s'] * len(fields))}) "
+           f"{connection.ops.on_conflict_suffix_sql([], on_conflict, [], [])}")
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
+    _remove([row[0] for row in rows])
+    return len(rows)
+
+
+def _policy(policy):
+    match = Q()
+    if policy.get('type'):
+        match &= Q(type=policy['type'])
+    if policy.get('priority'):
+        match &= Q(priority=policy['priority'])
+    return match
+
+
+def delete_expired(now=None, chunk_size=CHUNK_SIZE, pause=0):
+    """Apply NOTIFICATION_DELETE_POLICIES to live and archived notifications; returns rows deleted"""
+    now = now or timezone.now()
+    deleted = 0
+    for policy in getattr(settings, 'NOTIFICATION_DELETE_POLICIES', ()):
+        match = _policy(policy) & Q(created_at__lt=now - timedelta(days=policy['days']))
+        deleted += _drain(Notification.objects.filter(match), _delete_notifications, chunk_size, pause)
+        deleted += _drain(ArchivedNotification.objects.filter(match), _delete_archived, chunk_size, pause)
+    return deleted
+
+
+def archive_read(now=None, chunk_size=CHUNK_SIZE, pause=0):
+    """Move read notifications past NOTIFICATION_ARCHIVE_AFTER_DAYS to the archive; returns rows moved"""
+    now = now or timezone.now()
+    cutoff = now - timedelta(days=getattr(settings, 'NOTIFICATION_ARCHIVE_AFTER_DAYS', 30))
+    return _drain(Notification.objects.filter(read=True, created_at__lt=cutoff), _archive, chunk_size, pause)
+
+
+def purge_archive(now=None, chunk_size=CHUNK_SIZE, pause=0):
+    """Delete archived notifications past NOTIFICATION_ARCHIVE_KEEP_DAYS; returns rows deleted"""
+    keep_days = getattr(settings, 'NOTIFICATION_ARCHIVE_KEEP_DAYS', None)
+    if keep_days is None:
+        return 0
+    cutoff = (now or timezone.now()) - timedelta(days=keep_days)
+    return _drain(ArchivedNotification.objects.filter(created_at__lt=cutoff), _delete_archived, chunk_size, pause)
+
+
+PHASES = (('deleted', delete_expired), ('archived', archive_read), ('purged', purge_archive))
+
+
+def apply(now=None, chunk_size=CHUNK_SIZE, pause=0):
+    """Run every retention phase; returns {phase: (rows, seconds)}"""
+    now = now or timezone.now()
+    results = {}
+    for name, phase in PHASES:
+        started = time.perf_counter()
+        rows = phase(now, chunk_size, pause)
+        results[name] = (rows, time.perf_counter() - started)
+    logger.info("Notification retention: %s", ', '.join(
+        f"{name} {rows} in {seconds:.2f} s ({rows / seconds if seconds else 0:,.0f}/s)"
+        for name, (rows, seconds) in results.items()))
+    return results
@@ -0,0 +1,24 @@
+from celery import shared_task
+from django.core.cache import cache
+
+from . import delivery, reminders, retention
+
+
+@shared_task(ignore_result=True)
+def deliver_notifications():
+    """Route new notifications and send the deliveries that are due"""
+    # Notifications created from here on need a task of their own
+    cache.delete(delivery.QUEUED_KEY)
+    delivery.deliver()
+
+
+@shared_task(ignore_result=True)
+def apply_retention():
+    """Delete, archive and purge notifications according to the retention settings"""
+    retention.apply()
+
+
+@shared_task(ignore_result=True)
+def send_reminders():
+    """Notify people of assignments, exams and events coming up"""
+    reminders.send_due()
@@ -1,3 +1,296 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from accounts.models import User
+from events.models import Event, EventRSVP
+
+from . import dedup, delivery, fanout, inbox, reminders, retention
+from .models import ArchivedNotification, Notification, NotificationDelivery, UnreadCounter
+
+
+class NotificationTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='student', email='student@example.com')
+
+    def setUp(self):
+        cache.clear()
+        enqueue = mock.patch.object(delivery, '_enqueue')
+        enqueue.start()
+        self.addCleanup(enqueue.stop)
+
+    def notify(self, user=None, **fields):
+        return Notification.objects.create(user=user or self.user, type=fields.pop('type', 'system'),
+                                           title=fields.pop('title', 'Hello'), message='', **fields)
+
+
+class InboxTests(NotificationTestCase):
+    def test_counts_are_created_lazily_and_kept(self):
+        self.notify()
+        self.notify()
+        UnreadCounter.objects.all().delete()
+        self.assertEqual(inbox.unread_count(self.user.id), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.notify()
+        self.assertEqual(inbox.unread_count(self.user.id), 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(inbox.mark_read(self.user.id), 3)
+        self.assertEqual(inbox.unread_count(self.user.id), 0)
+
+    def test_recount_overwrites_an_existing_counter(self):
+        self.notify()
+        UnreadCounter.objects.update_or_create(user=self.user, defaults={'unread': 7})
+        self.assertEqual(inbox.recount(self.user.id), 1)
+        self.assertEqual(UnreadCounter.objects.get(user=self.user).unread, 1)
+
+    def test_cached_counts_are_dropped_after_commit(self):
+        self.assertEqual(inbox.unread_count(self.user.id), 0)
+        with self.assertNumQueries(0):
+            self.assertEqual(inbox.unread_count(self.user.id), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.notify()
+        self.assertEqual(inbox.unread_count(self.user.id), 1)
+
+    def test_counts_read_before_a_commit_are_not_served_after_it(self):
+        inbox.recount(self.user.id)
+        cache_set = cache.set
+        writes = []
+
+        def commit_meanwhile(*args, **kwargs):
+            # A writer commits after this reader loaded the counter but before it caches it
+            if not writes:
+                writes.append(True)
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.notify()
+            cache_set(*args, **kwargs)
+
+        with mock.patch.object(inbox.cache, 'set', side_effect=commit_meanwhile):
+            self.assertEqual(inbox.unread_count(self.user.id), 0)
+        self.assertEqual(inbox.unread_count(self.user.id), 1)
+
+class RecordingBackend:
+    """Fails the first ``failures`` batches, and notes each delivery's status as it is sent"""
+
+    def __init__(self, channel, failures=0):
+        self.channel = channel
+        self.failures = failures
+        self.statuses = []
+
+    def send(self, messages):
+        ids = [delivery_id for message in messages for delivery_id in message.delivery_ids]
+        self.statuses.extend(NotificationDelivery.objects.filter(id__in=ids).values_list('status', flat=True))
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("Gateway down")
+        return [None] * len(messages)
+
+
+class DispatchTests(NotificationTestCase):
+    def deliver_to(self, user, channel='email'):
+        notification = self.notify(user)
+        return NotificationDelivery.objects.create(notification=notification, user=user, channel=channel,
+                                                   send_after=timezone.now())
+
+    def test_deliveries_are_claimed_before_sending(self):
+        delivery_row = self.deliver_to(self.user)
+        backend = RecordingBackend('email')
+        self.assertEqual(delivery.dispatch_due(backends={'email': backend}), (1, 0))
+        self.assertEqual(backend.statuses, ['sending'])
+        delivery_row.refresh_from_db()
+        self.assertEqual((delivery_row.status, delivery_row.attempts), ('sent', 1))
+
+    def test_failures_are_retried_later(self):
+        delivery_row = self.deliver_to(self.user)
+        backend = RecordingBackend('email', failures=1)
+        now = timezone.now()
+        with self.assertLogs('notifications.delivery', 'ERROR'):
+            self.assertEqual(delivery.dispatch_due(now, backends={'email': backend}), (0, 1))
+        delivery_row.refresh_from_db()
+        self.assertEqual((delivery_row.status, delivery_row.error), ('pending', "Gateway down"))
+        self.assertEqual(delivery_row.send_after, now + timedelta(seconds=delivery.RETRY_SECONDS))
+
+        later = now + timedelta(seconds=delivery.RETRY_SECONDS)
+        self.assertEqual(delivery.dispatch_due(later, backends={'email': backend}), (1, 0))
+
+    def test_abandoned_claims_are_picked_up_again(self):
+        delivery_row = self.deliver_to(self.user)
+        now = timezone.now()
+        delivery._claim(now, 10)
+        backend = RecordingBackend('email')
+        self.assertEqual(delivery.dispatch_due(now, backends={'email': backend}), (0, 0))
+        later = now + timedelta(seconds=delivery.SENDING_SECONDS)
+        self.assertEqual(delivery.dispatch_due(later, backends={'email': backend}), (1, 0))
+        delivery_row.refresh_from_db()
+        self.assertEqual(delivery_row.attempts, 2)
+
+    def test_missing_email_addresses_fail_at_once(self):
+        nobody = User.objects.create(username='noemail')
+        delivery_row = self.deliver_to(nobody)
+        backend = RecordingBackend('email')
+        self.assertEqual(delivery.dispatch_due(backends={'email': backend}), (0, 1))
+        self.assertEqual(backend.statuses, [])
+        delivery_row.refresh_from_db()
+        self.assertEqual((delivery_row.status, delivery_row.error), ('failed', "User has no email address"))
+
+
+class FanOutTests(NotificationTestCase):
+    def test_keys_are_stable_per_event_and_user(self):
+        self.assertEqual(dedup.key(('bus_alert', 3), 7), dedup.key('bus_alert:3', 7))
+        self.assertNotEqual(dedup.key(('bus_alert', 3), 7), dedup.key(('bus_alert', 3), 8))
+        self.assertLessEqual(len(dedup.key(('reminder', 'exam', 1, 60, '2026-10-19T09:00:00+00:00'), 10 ** 9)), 64)
+
+    def test_repeated_fan_outs_create_nothing(self):
+        other = User.objects.create(username='other')
+        audience = User.objects.filter(id__in=[self.user.id, other.id]).values_list('id', flat=True)
+        for send in (lambda: fanout.fan_out(audience, 'system', 'Hi', '', dedup=('hello', 1)),
+                     lambda: fanout.fan_out([self.user.id, other.id], 'system', 'Hi', '', dedup=('hello', 2))):
+            self.assertEqual(send(), 2)
+            self.assertEqual(send(), 0)
+        self.assertEqual(inbox.recount(self.user.id), 2)
+
+    def test_rows_taken_by_a_concurrent_writer_are_not_counted(self):
+        other = User.objects.create(username='other')
+        inbox.recount(self.user.id)
+        inbox.recount(other.id)
+        bulk_create = Notification.objects.bulk_create
+
+        def race(batch, **kwargs):
+            # Another fan-out inserted this user's row after our existence check
+            taken = self.notify(dedup_key=dedup.key(('hello', 1), self.user.id))
+            Notification.objects.filter(pk=taken.pk).update(created_at=timezone.now() - timedelta(seconds=1))
+            return bulk_create(batch, **kwargs)
+
+        with mock.patch.object(Notification.objects, 'bulk_create', side_effect=race):
+            self.assertEqual(fanout.fan_out([self.user.id, other.id], 'system', 'Hi', '', dedup=('hello', 1)), 1)
+        counters = dict(UnreadCounter.objects.values_list('user_id', 'unread'))
+        self.assertEqual(counters, {self.user.id: 1, other.id: 1})
+
+    def test_audience_queries_insert_one_row_per_user(self):
+        event = Event.objects.create(title='Concert', description='', location='Hall',
+                                     start_datetime=timezone.now(), end_datetime=timezone.now())
+        sender, maybe, declined = (User.objects.create(username=name) for name in ('sender', 'maybe', 'declined'))
+        for user, status in ((self.user, 'going'), (sender, 'going'), (maybe, 'maybe'), (declined, 'not_going')):
+            EventRSVP.objects.create(event=event, user=user, status=status)
+        inbox.recount(sender.id)
+        inbox.recount(maybe.id)
+
+        audience = fanout.event_attendees(event.pk)
+        self.assertEqual(fanout.fan_out(audience, 'event', 'Moved', 'To the lawn', exclude=[sender.id]), 2)
+        rows = Notification.objects.filter(type='event')
+        self.assertEqual(set(rows.values_list('user_id', flat=True)), {self.user.id, maybe.id})
+        self.assertEqual({(row.title, row.message, row.read, row.occurrences, row.dedup_key)
+                          for row in rows},
+                         {('Moved', 'To the lawn', False, 1, None)})
+        self.assertEqual(dict(UnreadCounter.objects.values_list('user_id', 'unread')), {sender.id: 0, maybe.id: 1})
+
+    def test_broadcasts_skip_inactive_users(self):
+        User.objects.create(username='gone', is_active=False)
+        staff = User.objects.create(username='staff', role='faculty')
+        self.assertEqual(set(fanout.users()), {self.user.id, staff.id})
+        self.assertEqual(list(fanout.users(role='faculty')), [staff.id])
+        self.assertEqual(fanout.fan_out(fanout.users(role='faculty'), 'system', 'Staff only', ''), 1)
+
+
+class CoalesceTests(NotificationTestCase):
+    def about(self, order_id, key=None):
+        return self.notify(type='order', related_object_type='order', related_object_id=order_id,
+                           dedup_key=key)
+
+    def test_survivor_takes_over_a_merged_key(self):
+        older = self.about(1, key='a:1')
+        newest = self.about(1)
+        inbox.recount(self.user.id)
+        self.assertEqual(dedup.coalesce(), 1)
+        newest.refresh_from_db()
+        self.assertEqual((newest.dedup_key, newest.occurrences), ('a:1', 2))
+        self.assertFalse(Notification.objects.filter(pk=older.pk).exists())
+        self.assertEqual(UnreadCounter.objects.get(user=self.user).unread, 1)
+
+    def test_rows_whose_key_would_be_lost_are_kept(self):
+        self.about(2, key='a:1')
+        self.about(2, key='b:1')
+        self.assertEqual(dedup.coalesce(), 0)
+        self.assertEqual(Notification.objects.count(), 2)
+
+    def test_routed_notifications_are_never_merged(self):
+        sent = self.about(3)
+        NotificationDelivery.objects.create(notification=sent, user=self.user, channel='push', status='sent',
+                                            send_after=timezone.now())
+        Notification.objects.filter(pk=sent.pk).update(routed=True)
+        pending = self.about(3)
+        self.assertEqual(dedup.coalesce(), 0)
+        self.assertEqual(NotificationDelivery.objects.get().notification_id, sent.pk)
+        pending.refresh_from_db()
+        self.assertEqual(pending.occurrences, 1)
+
+    def test_lowered_counters_never_go_negative(self):
+        UnreadCounter.objects.create(user=self.user, unread=1)
+        inbox.add_unread({self.user.id: -3})
+        self.assertEqual(UnreadCounter.objects.get(user=self.user).unread, 0)
+
+
+@override_settings(NOTIFICATION_DELETE_POLICIES=({'type': 'transport', 'days': 14},),
+                   NOTIFICATION_ARCHIVE_AFTER_DAYS=30, NOTIFICATION_ARCHIVE_KEEP_DAYS=365)
+class RetentionTests(NotificationTestCase):
+    def aged(self, days, **fields):
+        notification = self.notify(**fields)
+        Notification.objects.filter(pk=notification.pk).update(created_at=timezone.now() - timedelta(days=days))
+        return notification
+
+    def test_expired_notifications_are_deleted_and_uncounted(self):
+        self.aged(20, type='transport')
+        self.aged(20, type='transport', read=True)
+        kept = self.aged(5, type='transport')
+        inbox.recount(self.user.id)
+
+        self.assertEqual(retention.delete_expired(chunk_size=1), 2)
+        self.assertEqual(list(Notification.objects.values_list('id', flat=True)), [kept.id])
+        self.assertEqual(UnreadCounter.objects.get(user=self.user).unread, 1)
+
+    def test_old_read_notifications_are_archived_then_purged(self):
+        old = self.aged(40, read=True, title='Old news', action_url='/x/')
+        self.aged(40)  # Unread, so never archived
+        self.assertEqual(retention.archive_read(), 1)
+        archived = ArchivedNotification.objects.get()
+        self.assertEqual(archived.id, old.id)
+        self.assertEqual(retention.unpack(archived.content)['title'], 'Old news')
+        self.assertEqual(retention.archive_read(), 0)
+
+        self.assertEqual(retention.purge_archive(timezone.now() + timedelta(days=400)), 1)
+        self.assertFalse(ArchivedNotification.objects.exists())
+
+
+@override_settings(NOTIFICATION_REMINDER_OFFSETS=(60,))
+class ReminderTests(NotificationTestCase):
+    def setUp(self):
+        super().setUp()
+        reminders._state['queue'] = None
+        self.now = timezone.now()
+        self.event = Event.objects.create(title='Concert', description='', location='Hall',
+                                          start_datetime=self.now + timedelta(hours=3),
+                                          end_datetime=self.now + timedelta(hours=4))
+        EventRSVP.objects.create(event=self.event, user=self.user, status='going')
+
+    def test_reschedules_reach_the_worker_through_the_database(self):
+        self.assertEqual(reminders.send_due(self.now), 0)
+        self.event.start_datetime = self.now + timedelta(minutes=62)
+        self.event.save()
+        cache.clear()  # Nothing shared but the database
+
+        self.assertEqual(reminders.send_due(self.now + timedelta(minutes=3)), 1)
+        self.assertEqual(reminders.send_due(self.now + timedelta(minutes=4)), 0)
+        self.assertEqual(Notification.objects.get().title, "Concert starts in 1 hour")
+
+    def test_replaced_instants_are_dropped(self):
+        self.event.start_datetime = self.now + timedelta(minutes=62)
+        self.event.save()
+        self.assertEqual(reminders.send_due(self.now), 0)
+        self.event.start_datetime = self.now + timedelta(hours=5)
+        self.event.save()
+        self.assertEqual(reminders.send_due(self.now + timedelta(minutes=3)), 0)
+        self.assertEqual(reminders.send_due(self.now + timedelta(hours=4, minutes=1)), 1)
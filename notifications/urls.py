@@ -0,0 +1,10 @@
+# notifications/urls.py
+from django.urls import path
+from .views import InboxView, MarkReadView
+
+app_name = 'notifications'  # Namespace for the app
+
+urlpatterns = [
+    path('', InboxView.as_view(), name='inbox'),
+    path('read/', MarkReadView.as_view(), name='mark_read'),
+]
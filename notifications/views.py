@@ -1,3 +1,56 @@
-from django.shortcuts import render
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.http import JsonResponse
+from django.views.generic import View
 
-# Create your views here.
+from . import inbox
+
+
+def _int_or_none(value):
+    return int(value) if value not in (None, '') else None
+
+
+class InboxView(LoginRequiredMixin, View):
+    """
+    A page of the user's notifications as JSON, newest first.
+
+    Pass ``next`` from the response back as ``before`` for the following
+    page. ``unread=1`` and ``type`` narrow the list.
+    """
+
+    def get(self, request):
+        try:
+            before = _int_or_none(request.GET.get('before'))
+            limit = int(request.GET.get('limit', inbox.PAGE_SIZE))
+        except ValueError:
+            return JsonResponse({'error': 'before and limit must be integers'}, status=400)
+
+        notifications, cursor = inbox.page(request.user.id, before=before, limit=limit,
+                                           unread_only=bool(request.GET.get('unread')),
+                                           type=request.GET.get('type'))
+        return JsonResponse({
+            'notifications': notifications,
+            'next': cursor,
+            'unread': inbox.unread_count(request.user.id),
+        })
+
+
+class MarkReadView(LoginRequiredMixin, View):
+    """
+    Mark notifications read.
+
+    POST any of ``ids`` (repeatable), ``up_to`` (every notification with
+    an id up to this one) and ``type``; ``all=1`` marks everything read.
+    """
+
+    def post(self, request):
+        try:
+            ids = [int(value) for value in request.POST.getlist('ids')] or None
+            up_to = _int_or_none(request.POST.get('up_to'))
+        except ValueError:
+            return JsonResponse({'error': 'ids and up_to must be integers'}, status=400)
+        type = request.POST.get('type') or None
+        if ids is None and up_to is None and type is None and not request.POST.get('all'):
+            return JsonResponse({'error': 'Give ids, up_to, type or all'}, status=400)
+
+        updated = inbox.mark_read(request.user.id, ids=ids, up_to=up_to, type=type)
+        return JsonResponse({'updated': updated, 'unread': inbox.unread_count(request.user.id)})
@@ -3,15 +3,19 @@ from django.contrib import admin
 from django.contrib.gis.admin import GISModelAdmin
 
 # For GIS fields
-from .models import BusRoute, BusStop, RouteStop, BusSchedule, Bus, BusAlert
+from .models import (
+    BusRoute, BusStop, RouteStop, BusSchedule, Bus, BusAlert, BusPositionLog, BusPositionHistory,
+    RouteLoadProfile, RouteSubscription,
+)
 
 # Register your models here.
 
 @admin.register(BusRoute)
 class BusRouteAdmin(admin.ModelAdmin):
-    list_display = ('name', 'description', 'color_code', 'active')
+    list_display = ('name', 'description', 'color_code', 'active', 'length_m')
     search_fields = ('name', 'description')
     list_filter = ('active',)
+    readonly_fields = ('path', 'length_m')
 
 
 @admin.register(BusStop)
@@ -23,7 +27,8 @@ class BusStopAdmin(GISModelAdmin):  # Inherit from OSMGeoAdmin
 
 @admin.register(RouteStop)
 class RouteStopAdmin(admin.ModelAdmin):
-    list_display = ('route', 'stop', 'order')
+    list_display = ('route', 'stop', 'order', 'distance_m')
+    readonly_fields = ('distance_m',)
     search_fields = ('route__name', 'stop__name')
     list_filter = ('route', 'stop')
 
@@ -37,13 +42,46 @@ class BusScheduleAdmin(admin.ModelAdmin):
 
 @admin.register(Bus)
 class BusAdmin(GISModelAdmin):  # Inherit from OSMGeoAdmin
-    list_display = ('bus_number', 'route', 'capacity', 'current_location', 'last_updated', 'is_active')
+    list_display = ('bus_number', 'route', 'capacity', 'current_load', 'current_location', 'last_updated', 'is_active')
     search_fields = ('bus_number', 'route__name')
     list_filter = ('route', 'is_active')
 
 
 @admin.register(BusAlert)
 class BusAlertAdmin(admin.ModelAdmin):
-    list_display = ('route', 'title', 'start_date', 'end_date', 'active')
+    list_display = ('route', 'title', 'start_date', 'end_date', 'active', 'notified_at')
     search_fields = ('route__name', 'title', 'description')
-    list_filter = ('route', 'active', 'start_date', 'end_date')
\ No newline at end of file
+    list_filter = ('route', 'active', 'start_date', 'end_date')
+    readonly_fields = ('notified_at',)
+
+
+@admin.register(RouteLoadProfile)
+class RouteLoadProfileAdmin(admin.ModelAdmin):
+    list_display = ('route', 'hour', 'filled', 'mean_load_factor', 'open_day')
+    list_filter = ('route',)
+    exclude = ('samples',)
+    readonly_fields = ('head', 'filled', 'ring_total', 'open_day', 'open_total', 'open_count')
+
+
+@admin.register(RouteSubscription)
+class RouteSubscriptionAdmin(admin.ModelAdmin):
+    list_display = ('user', 'route', 'created_at')
+    list_filter = ('route',)
+    raw_id_fields = ('user',)
+
+
+@admin.register(BusPositionLog)
+class BusPositionLogAdmin(admin.ModelAdmin):
+    list_display = ('bus', 'latitude', 'longitude', 'recorded_at')
+    list_filter = ('bus__route',)
+    raw_id_fields = ('bus',)
+    date_hierarchy = 'recorded_at'
+
+
+@admin.register(BusPositionHistory)
+class BusPositionHistoryAdmin(admin.ModelAdmin):
+    list_display = ('bus', 'day', 'point_count', 'start_time', 'end_time')
+    list_filter = ('day',)
+    raw_id_fields = ('bus',)
+    exclude = ('data',)
+    readonly_fields = ('point_count', 'start_time', 'end_time', 'file_path')
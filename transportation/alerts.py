@@ -0,0 +1,174 @@
+# transportation/alerts.py
+"""
+In-memory index of bus alerts by route and time window.
+
+All enabled, unexpired alerts are loaded at once and kept per route,
+sorted by start time. "What is active on route R now" is a bisect plus
+a short scan, with no queries. The index reloads itself when:
+
+* the next start or end boundary among the loaded alerts passes;
+* an alert is saved or deleted. A generation counter in the shared cache
+  carries this to other processes, which check it every RECHECK_SECONDS.
+
+When an alert starts, everyone subscribed to its route gets a
+notification. That happens in the worker, never in a request: the
+notify_bus_alerts task runs every minute from the beat schedule, and
+saving an alert that is already in effect queues it straight away.
+``notified_at`` is claimed with a conditional UPDATE in the same
+transaction as the fan-out, so each alert fans out exactly once across
+processes, and again later if the fan-out failed.
+"""
+import logging
+import threading
+import time as time_module
+from bisect import bisect_right
+from collections import defaultdict
+from functools import partial
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from notifications import fanout
+
+from .models import BusAlert
+
+logger = logging.getLogger(__name__)
+
+GENERATION_KEY = 'transport:alerts:generation'
+RECHECK_SECONDS = 5
+
+
+class AlertIndex:
+    """Unexpired alerts per route with the next time the active set changes"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_route = {}  # route_id -> ([start_date, ...], [alert, ...]) sorted by start
+        self._next_boundary = None
+        self._generation = None
+        self._loaded = False
+        self._checked_at = 0
+
+    def _load(self, now):
+        alerts = list(BusAlert.objects.filter(active=True, end_date__gte=now).order_by('start_date'))
+        by_route = defaultdict(list)
+        for alert in alerts:
+            by_route[alert.route_id].append(alert)
+        self._by_route = {
+            route_id: ([alert.start_date for alert in route_alerts], route_alerts)
+            for route_id, route_alerts in by_route.items()
+        }
+        self._next_boundary = min(
+            (moment for alert in alerts for moment in (alert.start_date, alert.end_date) if moment > now),
+            default=None,
+        )
+        self._loaded = True
+
+    def _refresh(self, now):
+        stale = not self._loaded or (self._next_boundary is not None and now >= self._next_boundary)
+        if time_module.monotonic() - self._checked_at > RECHECK_SECONDS:
+            generation = cache.get(GENERATION_KEY)
+            self._checked_at = time_module.monotonic()
+            if generation != self._generation:
+                self._generation = generation
+                stale = True
+        if not stale:
+            return
+
+        with self._lock:
+            self._load(now)
+
+    def invalidate(self):
+        self._loaded = False
+
+    def active(self, route_id, now=None):
+        """Alerts in effect on a route at ``now``"""
+        now = now or timezone.now()
+        self._refresh(now)
+        starts, alerts = self._by_route.get(route_id, ((), ()))
+        return [alert for alert in alerts[:bisect_right(starts, now)] if alert.end_date >= now]
+
+    def all_active(self, now=None):
+        """Alerts in effect on any route at ``now``, soonest ending first"""
+        now = now or timezone.now()
+        self._refresh(now)
+        active = [alert for starts, alerts in self._by_route.values()
+                  for alert in alerts[:bisect_right(starts, now)] if alert.end_date >= now]
+        return sorted(active, key=lambda alert: alert.end_date)
+
+
+index = AlertIndex()
+
+
+def active_alerts(route_id, now=None):
+    return index.active(route_id, now)
+
+
+def all_active_alerts(now=None):
+    return index.all_active(now)
+
+
+def fan_out(alert, now=None):
+    """Notify the route's subscribers about an alert once; returns notifications created"""
+    now = now or timezone.now()
+    with transaction.atomic():
+        claimed = BusAlert.objects.filter(pk=alert.pk, notified_at__isnull=True).update(notified_at=now)
+        if not claimed:
+            return 0
+        created = fanout.fan_out(
+            fanout.route_riders(alert.route_id),
+            type='transport',
+            title=alert.title,
+            message=alert.description,
+            priority='high',
+            action_url=f"/transportation/routes/{alert.route_id}/",
+            related_object_type='bus_alert',
+            related_object_id=alert.pk,
+            dedup=('bus_alert', alert.pk),
+        )
+    alert.notified_at = now
+    return created
+
+
+def notify_started_alerts(now=None):
+    """Fan out every alert that has started but not been announced; for periodic runs"""
+    now = now or timezone.now()
+    started = BusAlert.objects.filter(active=True, start_date__lte=now, end_date__gte=now, notified_at__isnull=True)
+    return sum(fan_out(alert, now) for alert in started)
+
+
+def _changed(alert_id=None):
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 1, None)
+    index.invalidate()
+    if alert_id is None:
+        return
+    now = timezone.now()
+    if BusAlert.objects.filter(pk=alert_id, active=True, start_date__lte=now, end_date__gte=now,
+                               notified_at__isnull=True).exists():
+        from .tasks import notify_bus_alerts
+
+        try:
+            notify_bus_alerts.delay()
+        except Exception:
+            logger.warning("Could not queue bus alert notifications; leaving them to the periodic task",
+                           exc_info=True)
+
+
+def alert_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(partial(_changed, instance.pk))
+
+
+def alert_deleted(sender, instance, **kwargs):
+    transaction.on_commit(_changed)
+
+
+def connect_signals():
+    from django.db.models.signals import post_delete, post_save
+
+    post_save.connect(alert_saved, sender=BusAlert, dispatch_uid='alerts.save')
+    post_delete.connect(alert_deleted, sender=BusAlert, dispatch_uid='alerts.delete')
@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class TransportationConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'transportation'
+
+    def ready(self):
+        from . import alerts, eta, live, spatial, telemetry, timetable
+        alerts.connect_signals()
+        eta.connect_signals()
+        spatial.connect_signals()
+        timetable.connect_signals()
+        # Freshly flushed positions feed the live tracker streams
+        telemetry.buffer.on_flush = live.publish
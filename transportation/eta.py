@@ -0,0 +1,253 @@
+# transportation/eta.py
+"""
+Arrival predictions for bus stops.
+
+Each active route gets a precomputed table: its stored path and the
+distance of every stop along it (see spatial), and the expected
+travel time of every stop-to-stop segment, learned from position history
+where available and stored on the route. Every ``SNAPSHOT_TTL`` seconds, one query loads all active
+bus positions. Each bus is projected onto its route and its arrival at
+every downstream stop is predicted. The result is cached as a
+stop -> arrivals map, so a stop page costs no per-route queries.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .geometry import Polyline
+from .models import Bus, BusRoute, RouteStop
+
+ROUTE_TABLES_KEY = 'transport:eta:route_tables'
+SNAPSHOT_KEY = 'transport:eta:snapshot'
+SNAPSHOT_TTL = 10
+ROUTE_TABLES_TIMEOUT = 60 * 60
+
+DEFAULT_SPEED_MPS = 6.0  # ~22 km/h including traffic on campus roads
+DWELL_SECONDS = 20
+MAX_OFF_ROUTE_M = 150  # Buses further than this from their route are not predicted
+MAX_SEGMENT_SECONDS = 30 * 60
+MAX_FIX_AGE_SECONDS = 5 * 60  # Buses silent for longer are left out of predictions
+
+
+class RouteTable:
+    """Precomputed stop geometry and segment travel times for one route"""
+
+    def __init__(self, route_id, stop_ids, vertices, stop_offsets, segment_seconds=None):
+        self.route_id = route_id
+        self.stop_ids = stop_ids
+        self.polyline = Polyline(vertices)
+        self.stop_offsets = np.asarray(stop_offsets, dtype=np.float64)
+        self.is_loop = len(stop_ids) > 2 and stop_ids[0] == stop_ids[-1]
+        lengths = np.diff(self.stop_offsets)
+        default = lengths / DEFAULT_SPEED_MPS + DWELL_SECONDS
+        if segment_seconds is not None and len(segment_seconds) == len(default):
+            self.segment_seconds = np.where(np.isfinite(segment_seconds), segment_seconds, default)
+        else:
+            self.segment_seconds = default
+        self.segment_lengths = np.maximum(lengths, 1e-6)
+        # Seconds from the first stop to each stop
+        self.cumulative_seconds = np.concatenate(([0.0], np.cumsum(self.segment_seconds)))
+
+    def seconds_to_stops(self, along):
+        """(stop index, seconds) for every stop ahead of a bus at ``along`` metres"""
+        segment = int(np.searchsorted(self.stop_offsets, along, side='right')) - 1
+        segment = min(max(segment, 0), len(self.segment_seconds) - 1)
+        fraction = (along - self.stop_offsets[segment]) / self.segment_lengths[segment]
+        position = self.cumulative_seconds[segment] + min(max(fraction, 0), 1) * self.segment_seconds[segment]
+
+        ahead = [(index, self.cumulative_seconds[index] - position)
+                 for index in range(segment + 1, len(self.stop_ids))]
+        if self.is_loop:
+            lap = self.cumulative_seconds[-1]
+            ahead += [(index, lap - position + self.cumulative_seconds[index])
+                      for index in range(1, segment + 1)]
+        return ahead
+
+
+def _route_geometry():
+    """{route_id: (path coords, [(stop_id, distance_m), ...], segment seconds)} for active routes, in two queries"""
+    unmaterialized = list(BusRoute.objects.filter(active=True, path__isnull=True).values_list('id', flat=True))
+    if unmaterialized:
+        from .spatial import materialize_routes
+        materialize_routes(unmaterialized)
+
+    geometry = {
+        route_id: (path.coords, [], segment_seconds)
+        for route_id, path, segment_seconds in
+        BusRoute.objects.filter(active=True, path__isnull=False).values_list('id', 'path', 'segment_seconds')
+    }
+    rows = (RouteStop.objects.filter(route_id__in=geometry.keys())
+            .order_by('route_id', 'order').values_list('route_id', 'stop_id', 'distance_m'))
+    for route_id, stop_id, distance in rows:
+        geometry[route_id][1].append((stop_id, distance))
+    return geometry
+
+
+def build_route_tables():
+    tables = {}
+    for route_id, (coords, stops, segment_seconds) in _route_geometry().items():
+        if len(stops) < 2 or any(distance is None for _, distance in stops):
+            continue
+        if segment_seconds is not None:
+            segment_seconds = np.array([np.nan if value is None else value for value in segment_seconds],
+                                       dtype=np.float64)
+        tables[route_id] = RouteTable(
+            route_id,
+            [stop_id for stop_id, _ in stops],
+            [(lat, lon) for lon, lat in coords],
+            [distance for _, distance in stops],
+            segment_seconds,
+        )
+    cache.set(ROUTE_TABLES_KEY, tables, ROUTE_TABLES_TIMEOUT)
+    return tables
+
+
+def route_tables():
+    tables = cache.get(ROUTE_TABLES_KEY)
+    if tables is None:
+        tables = build_route_tables()
+    return tables
+
+
+def invalidate_route_tables():
+    cache.delete_many([ROUTE_TABLES_KEY, SNAPSHOT_KEY])
+
+
+def predict_arrivals(now=None):
+    """{stop_id: [arrival, ...]} for every active bus, sorted by arrival time"""
+    from .occupancy import crowding_level, forecast, profile_table
+
+    now = now or timezone.now()
+    tables = route_tables()
+    profiles = profile_table()
+    max_age = getattr(settings, 'TRANSPORT_ETA_MAX_FIX_AGE', MAX_FIX_AGE_SECONDS)
+    buses = list(
+        Bus.objects.filter(is_active=True, route_id__in=tables.keys(), current_location__isnull=False,
+                           last_updated__gte=now - timedelta(seconds=max_age))
+        .values_list('id', 'route_id', 'bus_number', 'current_location', 'last_updated',
+                     'capacity', 'current_load', 'load_updated')
+    )
+
+    by_route = defaultdict(list)
+    for bus in buses:
+        by_route[bus[1]].append(bus)
+
+    arrivals = defaultdict(list)
+    for route_id, route_buses in by_route.items():
+        table = tables[route_id]
+        along, off_route = table.polyline.project_many(
+            [bus[3].y for bus in route_buses], [bus[3].x for bus in route_buses]
+        )
+        for bus, bus_along, bus_off in zip(route_buses, along, off_route):
+            if bus_off > MAX_OFF_ROUTE_M:
+                continue
+            bus_id, _, bus_number, _, last_updated, capacity, current_load, load_updated = bus
+            # Time passed since the fix was taken is time already travelled
+            age = max((now - last_updated).total_seconds(), 0) if last_updated else 0
+            for index, seconds in table.seconds_to_stops(bus_along):
+                seconds = max(seconds - age, 0)
+                arrival_time = now + timedelta(seconds=seconds)
+                load_factor = forecast(route_id, arrival_time, current_load, capacity, load_updated,
+                                       now=now, profiles=profiles)
+                arrivals[table.stop_ids[index]].append({
+                    'route_id': route_id,
+                    'bus_id': bus_id,
+                    'bus_number': bus_number,
+                    'eta_seconds': round(seconds),
+                    'arrival_time': arrival_time,
+                    'load_factor': None if load_factor is None else round(load_factor, 2),
+                    'crowding': crowding_level(load_factor),
+                })
+
+    for stop_arrivals in arrivals.values():
+        stop_arrivals.sort(key=lambda arrival: arrival['eta_seconds'])
+    return dict(arrivals)
+
+
+def arrivals_snapshot():
+    snapshot = cache.get(SNAPSHOT_KEY)
+    if snapshot is None:
+        snapshot = {'generated_at': timezone.now(), 'arrivals': predict_arrivals()}
+        cache.set(SNAPSHOT_KEY, snapshot, SNAPSHOT_TTL)
+    return snapshot
+
+
+def arrivals_for_stop(stop_id, limit=None):
+    arrivals = arrivals_snapshot()['arrivals'].get(stop_id, [])
+    return arrivals[:limit] if limit else arrivals
+
+
+def fit_segment_times(days=7):
+    """
+    Learn median stop-to-stop travel times from recent position history.
+
+    Each bus's pings are projected onto its route. A stop is crossed when
+    consecutive pings straddle its offset while moving forward, and the
+    times between consecutive crossings become segment samples. Routes and
+    segments without samples in the window keep their stored times.
+    """
+    from .history import positions
+
+    end = timezone.now()
+    start = end - timedelta(days=days)
+    tables = build_route_tables()
+    samples = defaultdict(lambda: defaultdict(list))
+
+    for bus_id, route_id in Bus.objects.filter(route_id__in=tables.keys()).values_list('id', 'route_id'):
+        table = tables[route_id]
+        ts, lats, lons = positions(bus_id, start, end)
+        if len(ts) < 2:
+            continue
+        along, off_route = table.polyline.project_many(lats, lons)
+        on_route = off_route <= MAX_OFF_ROUTE_M
+
+        crossings = []
+        for k in range(len(ts) - 1):
+            if not (on_route[k] and on_route[k + 1]) or along[k + 1] <= along[k]:
+                continue
+            first = int(np.searchsorted(table.stop_offsets, along[k], side='right'))
+            last = int(np.searchsorted(table.stop_offsets, along[k + 1], side='right'))
+            for index in range(first, last):
+                fraction = (table.stop_offsets[index] - along[k]) / (along[k + 1] - along[k])
+                crossings.append((ts[k] + fraction * (ts[k + 1] - ts[k]), index))
+
+        for (t1, i1), (t2, i2) in zip(crossings, crossings[1:]):
+            if i2 == i1 + 1 and 0 < t2 - t1 <= MAX_SEGMENT_SECONDS:
+                samples[route_id][i1].append(t2 - t1)
+
+    stored = dict(BusRoute.objects.filter(pk__in=samples.keys()).values_list('id', 'segment_seconds'))
+    segment_times = {}
+    for route_id, by_segment in samples.items():
+        seconds = np.full(len(tables[route_id].segment_seconds), np.nan)
+        previous = stored.get(route_id)
+        if previous is not None and len(previous) == len(seconds):
+            seconds[:] = [np.nan if value is None else value for value in previous]
+        for index, durations in by_segment.items():
+            seconds[index] = float(np.median(durations))
+        segment_times[route_id] = seconds
+
+    # A plain UPDATE: saving the routes would re-materialize their geometry
+    for route_id, seconds in segment_times.items():
+        BusRoute.objects.filter(pk=route_id).update(
+            segment_seconds=[float(value) if np.isfinite(value) else None for value in seconds])
+    invalidate_route_tables()
+    # Stop offsets in the expanded timetables come from the segment times
+    from .timetable import invalidate_timetables
+    invalidate_timetables()
+    return segment_times
+
+
+def invalidate_on_change(sender, **kwargs):
+    invalidate_route_tables()
+
+
+def connect_signals():
+    from django.db.models.signals import post_delete, post_save
+
+    # Stop and RouteStop changes re-materialize the route, which invalidates too (see spatial)
+    post_save.connect(invalidate_on_change, sender=BusRoute, dispatch_uid='eta.save.BusRoute')
+    post_delete.connect(invalidate_on_change, sender=BusRoute, dispatch_uid='eta.delete.BusRoute')
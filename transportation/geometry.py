@@ -0,0 +1,81 @@
+# transportation/geometry.py
+"""
+Small planar geometry helpers for campus-scale distances.
+
+Coordinates are projected onto a local equirectangular plane in metres,
+which is accurate to well under a metre over a few kilometres and keeps
+all the maths vectorizable with NumPy.
+"""
+import math
+
+import numpy as np
+
+EARTH_RADIUS_M = 6371008.8
+_DEG = math.pi / 180
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Great-circle distance in metres; works on scalars or NumPy arrays"""
+    lat1, lon1, lat2, lon2 = (np.asarray(v, dtype=np.float64) * _DEG for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    distance = 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+    return float(distance) if distance.ndim == 0 else distance
+
+
+class LocalProjection:
+    """Equirectangular projection around a fixed origin"""
+
+    def __init__(self, lat0, lon0):
+        self.lat0, self.lon0 = lat0, lon0
+        self.kx = math.cos(lat0 * _DEG) * EARTH_RADIUS_M * _DEG
+        self.ky = EARTH_RADIUS_M * _DEG
+
+    def to_xy(self, lat, lon):
+        return (np.asarray(lon, dtype=np.float64) - self.lon0) * self.kx, \
+               (np.asarray(lat, dtype=np.float64) - self.lat0) * self.ky
+
+    def to_latlon(self, x, y):
+        return self.lat0 + np.asarray(y) / self.ky, self.lon0 + np.asarray(x) / self.kx
+
+
+class Polyline:
+    """A path through (lat, lon) vertices with distance-along-path lookups"""
+
+    def __init__(self, vertices):
+        if len(vertices) < 2:
+            raise ValueError("A polyline needs at least two vertices")
+        lats, lons = zip(*vertices)
+        self.projection = LocalProjection(lats[0], lons[0])
+        x, y = self.projection.to_xy(lats, lons)
+        self.points = np.column_stack((x, y))
+        self.seg_start = self.points[:-1]
+        self.seg_vec = self.points[1:] - self.points[:-1]
+        self.seg_len2 = np.maximum((self.seg_vec ** 2).sum(axis=1), 1e-9)
+        self.cumulative = np.concatenate(([0.0], np.cumsum(np.sqrt(self.seg_len2))))
+
+    @property
+    def length(self):
+        return float(self.cumulative[-1])
+
+    def project_many(self, lats, lons, chunk_size=4096):
+        """Distance along the path and off-path distance for many points at once"""
+        x, y = self.projection.to_xy(lats, lons)
+        pts = np.column_stack((np.atleast_1d(x), np.atleast_1d(y)))
+        along = np.empty(len(pts))
+        offset = np.empty(len(pts))
+        for start in range(0, len(pts), chunk_size):
+            chunk = pts[start:start + chunk_size]
+            rel = chunk[:, None, :] - self.seg_start[None, :, :]
+            t = np.clip((rel * self.seg_vec[None]).sum(axis=2) / self.seg_len2[None], 0, 1)
+            nearest = self.seg_start[None] + t[..., None] * self.seg_vec[None]
+            dist2 = ((chunk[:, None, :] - nearest) ** 2).sum(axis=2)
+            best = dist2.argmin(axis=1)
+            rows = np.arange(len(chunk))
+            along[start:start + chunk_size] = (self.cumulative[best] +
+                                               t[rows, best] * np.sqrt(self.seg_len2[best]))
+            offset[start:start + chunk_size] = np.sqrt(dist2[rows, best])
+        return along, offset
+
+    def project(self, lat, lon):
+        along, offset = self.project_many([lat], [lon])
+        return float(along[0]), float(offset[0])
@@ -0,0 +1,238 @@
+# transportation/history.py
+"""
+Compact per-bus, per-day position history.
+
+Raw pings land in BusPositionLog (see telemetry). ``compact_day`` packs a
+day of them into one BusPositionHistory segment per bus and deletes the
+raw rows it packed. A segment holds the first ping followed by int32 delta
+arrays for time (ms) and latitude/longitude (1e-7 degrees); the rare
+segment with a delta outside int32 stores int64 deltas instead. Segments
+are zlib-compressed in the database, or written uncompressed under
+BUS_HISTORY_ROOT so they can be memory-mapped. Every file write goes to a
+new name, so a rolled back compaction leaves the previous file in place.
+"""
+import os
+import struct
+import uuid
+import zlib
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from functools import partial
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from .models import BusPositionHistory, BusPositionLog
+
+MAGIC = b'BPH1'
+HEADER = struct.Struct('<4sBIqii')  # magic, flags, count, t0 (ms), lat0, lon0 (1e-7 deg)
+FLAG_COMPRESSED = 1
+FLAG_WIDE = 2  # Deltas are int64
+COORD_SCALE = 10 ** 7
+INT32 = np.iinfo(np.int32)
+DELETE_CHUNK = 5000
+
+
+def encode_segment(ts_ms, lat_e7, lon_e7, compress=True):
+    """Pack sorted int arrays into a segment"""
+    ts_ms = np.asarray(ts_ms, dtype=np.int64)
+    lat_e7 = np.asarray(lat_e7, dtype=np.int64)
+    lon_e7 = np.asarray(lon_e7, dtype=np.int64)
+    count = len(ts_ms)
+    if not count:
+        raise ValueError("Cannot encode an empty segment")
+
+    deltas = [np.diff(values) for values in (ts_ms, lat_e7, lon_e7)]
+    flags = 0
+    dtype = '<i4'
+    if any(len(delta) and (delta.min() < INT32.min or delta.max() > INT32.max) for delta in deltas):
+        flags |= FLAG_WIDE
+        dtype = '<i8'
+    body = b''.join(delta.astype(dtype).tobytes() for delta in deltas)
+    if compress:
+        body = zlib.compress(body, 6)
+        flags |= FLAG_COMPRESSED
+    return HEADER.pack(MAGIC, flags, count, int(ts_ms[0]), int(lat_e7[0]), int(lon_e7[0])) + body
+
+
+def decode_segment(buffer):
+    """(ts_ms int64, lat_e7 int64, lon_e7 int64) arrays from a segment (bytes or mmap)"""
+    magic, flags, count, t0, lat0, lon0 = HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a bus position segment")
+
+    body = memoryview(buffer)[HEADER.size:]
+    if flags & FLAG_COMPRESSED:
+        body = zlib.decompress(body)
+    dtype = '<i8' if flags & FLAG_WIDE else '<i4'
+    deltas = np.frombuffer(body, dtype=dtype, count=3 * (count - 1)).reshape(3, count - 1)
+
+    columns = []
+    for first, delta in zip((t0, lat0, lon0), deltas):
+        column = np.empty(count, dtype=np.int64)
+        column[0] = first
+        np.cumsum(delta, out=column[1:], dtype=np.int64)
+        column[1:] += first
+        columns.append(column)
+    return tuple(columns)
+
+
+def _history_root():
+    return getattr(settings, 'BUS_HISTORY_ROOT', None)
+
+
+def _segment_path(bus_id, day):
+    # A fresh name per write; the row is only pointed at it once the transaction commits
+    return os.path.join(_history_root(), f"{day:%Y/%m/%d}", f"{bus_id}-{uuid.uuid4().hex[:12]}.seg")
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _read_segment(segment):
+    """The segment's arrays, or None when it holds nothing readable, e.g. its file is gone"""
+    if segment.file_path:
+        try:
+            if os.path.getsize(segment.file_path) < HEADER.size:
+                return None
+            # Memory-map the file so decoding reads it straight from the page cache
+            return decode_segment(np.memmap(segment.file_path, dtype=np.uint8, mode='r'))
+        except FileNotFoundError:
+            return None
+    return decode_segment(bytes(segment.data))
+
+
+def _write_segment(segment, ts_ms, lat_e7, lon_e7, written):
+    """Store a segment's points; new files are appended to ``written``"""
+    root = _history_root()
+    previous = segment.file_path
+    if root:
+        path = _segment_path(segment.bus_id, segment.day)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as fh:
+            fh.write(encode_segment(ts_ms, lat_e7, lon_e7, compress=False))
+        os.replace(tmp_path, path)
+        written.append(path)
+        segment.file_path = path
+        segment.data = b''
+    else:
+        segment.data = encode_segment(ts_ms, lat_e7, lon_e7)
+        segment.file_path = ''
+
+    segment.point_count = len(ts_ms)
+    segment.start_time = datetime.fromtimestamp(ts_ms[0] / 1000, tz=dt_timezone.utc)
+    segment.end_time = datetime.fromtimestamp(ts_ms[-1] / 1000, tz=dt_timezone.utc)
+    segment.save()
+    if previous and previous != segment.file_path:
+        transaction.on_commit(partial(_remove_file, previous))
+
+
+def _day_bounds(day):
+    start = datetime.combine(day, time.min, tzinfo=dt_timezone.utc)
+    return start, start + timedelta(days=1)
+
+
+def compact_day(day):
+    """Move one UTC day of BusPositionLog rows into per-bus segments; returns pings compacted"""
+    start, end = _day_bounds(day)
+    logs = list(
+        BusPositionLog.objects.filter(recorded_at__gte=start, recorded_at__lt=end)
+        .order_by('bus_id', 'recorded_at').values_list('id', 'bus_id', 'recorded_at', 'latitude', 'longitude')
+    )
+    if not logs:
+        return 0
+    rows = np.array([(bus_id, recorded_at.timestamp() * 1000, lat, lon)
+                     for _, bus_id, recorded_at, lat, lon in logs], dtype=np.float64)
+
+    bus_ids = rows[:, 0].astype(np.int64)
+    boundaries = np.flatnonzero(np.diff(bus_ids)) + 1
+    written = []
+    try:
+        with transaction.atomic():
+            for chunk in np.split(rows, boundaries):
+                bus_id = int(chunk[0, 0])
+                ts_ms = chunk[:, 1].round().astype(np.int64)
+                lat_e7 = (chunk[:, 2] * COORD_SCALE).round().astype(np.int64)
+                lon_e7 = (chunk[:, 3] * COORD_SCALE).round().astype(np.int64)
+
+                segment, created = BusPositionHistory.objects.select_for_update().get_or_create(
+                    bus_id=bus_id, day=day,
+                    defaults={'point_count': 0, 'start_time': start, 'end_time': start},
+                )
+                if not created:
+                    existing = _read_segment(segment)
+                    if existing is not None:
+                        ts_ms, lat_e7, lon_e7 = (np.concatenate((old, new)) for old, new in
+                                                 zip(existing, (ts_ms, lat_e7, lon_e7)))
+                        order = np.argsort(ts_ms, kind='stable')
+                        ts_ms, lat_e7, lon_e7 = ts_ms[order], lat_e7[order], lon_e7[order]
+                _write_segment(segment, ts_ms, lat_e7, lon_e7, written)
+
+            # Only the rows packed above; pings inserted meanwhile wait for the next run
+            ids = [row[0] for row in logs]
+            for offset in range(0, len(ids), DELETE_CHUNK):
+                BusPositionLog.objects.filter(id__in=ids[offset:offset + DELETE_CHUNK]).delete()
+    except Exception:
+        for path in written:
+            _remove_file(path)
+        raise
+    return len(rows)
+
+
+def positions(bus_id, start, end):
+    """
+    Pings for a bus in [start, end) as (unix_seconds, lat, lon) float arrays.
+
+    Reads the day segments covering the window plus any raw pings that
+    haven't been compacted yet.
+    """
+    parts = []
+    segments = BusPositionHistory.objects.filter(
+        bus_id=bus_id, day__gte=start.astimezone(dt_timezone.utc).date(),
+        day__lte=end.astimezone(dt_timezone.utc).date(),
+    ).order_by('day')
+    lo, hi = start.timestamp() * 1000, end.timestamp() * 1000
+    for segment in segments:
+        decoded = _read_segment(segment)
+        if decoded is None:
+            continue
+        ts_ms, lat_e7, lon_e7 = decoded
+        left, right = np.searchsorted(ts_ms, [lo, hi])
+        parts.append(np.column_stack((ts_ms[left:right] / 1000,
+                                      lat_e7[left:right] / COORD_SCALE,
+                                      lon_e7[left:right] / COORD_SCALE)))
+
+    pending = list(
+        BusPositionLog.objects.filter(bus_id=bus_id, recorded_at__gte=start, recorded_at__lt=end)
+        .order_by('recorded_at').values_list('recorded_at', 'latitude', 'longitude')
+    )
+    if pending:
+        parts.append(np.array([(t.timestamp(), lat, lon) for t, lat, lon in pending], dtype=np.float64))
+
+    if not parts:
+        return np.empty(0), np.empty(0), np.empty(0)
+    merged = np.concatenate(parts)
+    merged = merged[np.argsort(merged[:, 0], kind='stable')]
+    return merged[:, 0], merged[:, 1], merged[:, 2]
+
+
+def prune(retention_days=None, today=None):
+    """Delete history older than the retention window; returns segments removed"""
+    retention_days = retention_days or getattr(settings, 'BUS_HISTORY_RETENTION_DAYS', 90)
+    today = today or datetime.now(dt_timezone.utc).date()
+    cutoff = today - timedelta(days=retention_days)
+
+    old = BusPositionHistory.objects.filter(day__lt=cutoff)
+    with transaction.atomic():
+        paths = list(old.exclude(file_path='').values_list('file_path', flat=True))
+        count, _ = old.delete()
+        BusPositionLog.objects.filter(recorded_at__lt=_day_bounds(cutoff)[0]).delete()
+        # Files go only once no row can point at them
+        for path in paths:
+            transaction.on_commit(partial(_remove_file, path))
+    return count
@@ -0,0 +1,257 @@
+# transportation/live.py
+"""
+Live bus positions pushed to map clients as Server-Sent Events.
+
+Every telemetry flush hands the fresh positions to a broker. The in-memory
+broker applies them to this process's LiveState directly. The Redis
+broker publishes them on a channel that every web process subscribes to.
+LiveState keeps the latest position per bus, grouped by route, and gives
+each route a version counter that goes up once per applied batch. Every
+BUS_ROUTES_TTL the bus -> route map is reloaded, and buses that went
+inactive or moved to another route are dropped from their old route.
+
+Each client coroutine wakes once per interval and asks for the delta since
+the version it last saw. Updates in between are coalesced into a single
+frame. Clients at the same version share one encoded frame, so thousands
+of viewers cost one dict lookup each per tick. Versions only mean
+something within one process, so event ids carry the process's epoch; a
+client reconnecting to another process (or after a restart) gets a full
+frame.
+
+Frames are compact JSON: ``{"id": "epoch-version", "full": bool, "b":
+[[bus, lat, lon, ts], ...], "gone": [bus, ...]}`` with coordinates in 1e-5
+degrees (about a metre). A full frame replaces everything the client
+knows; a delta lists the buses that changed and those that left.
+
+Streaming needs the ASGI app. Under WSGI the endpoint answers with one
+frame per request instead, for clients to poll with ``?since=<id>``.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .models import Bus
+from .telemetry import encode_binary, parse_binary
+
+logger = logging.getLogger(__name__)
+
+COORD_SCALE = 10 ** 5
+BUS_ROUTES_TTL = 60
+KEEPALIVE_SECONDS = 15
+
+
+class RouteState:
+    """Latest positions and version for one route"""
+    __slots__ = ('version', 'buses', 'gone', 'frames')
+
+    def __init__(self):
+        self.version = 0
+        self.buses = {}  # bus_id -> [lat, lon, ts, version changed]
+        self.gone = {}  # bus_id -> version it left the route at
+        self.frames = {}  # since version -> (encoded frame, version); cleared on change
+
+
+class LiveState:
+    """Per-route live positions shared by every stream in the process"""
+
+    def __init__(self):
+        self.epoch = uuid.uuid4().hex[:8]
+        self._lock = threading.Lock()
+        self._routes = {}
+        self._seeded = set()
+        self._bus_routes = {}
+        self._bus_routes_loaded = 0
+
+    def refresh_due(self):
+        return time.monotonic() - self._bus_routes_loaded > BUS_ROUTES_TTL
+
+    def refresh(self):
+        """Reload which route each active bus is on, dropping buses that left a route; returns the map"""
+        route_of = dict(Bus.objects.filter(is_active=True).values_list('id', 'route_id'))
+        with self._lock:
+            self._bus_routes, self._bus_routes_loaded = route_of, time.monotonic()
+            for route_id, route in self._routes.items():
+                left = [bus_id for bus_id in route.buses if route_of.get(bus_id) != route_id]
+                if not left:
+                    continue
+                route.version += 1
+                for bus_id in left:
+                    del route.buses[bus_id]
+                    route.gone[bus_id] = route.version
+                route.frames.clear()
+        return route_of
+
+    def apply(self, positions):
+        """Record (bus_id, lat, lon, ts) positions; bumps each touched route's version once"""
+        route_of = self.refresh() if self.refresh_due() else self._bus_routes
+        with self._lock:
+            touched = {}
+            for bus_id, lat, lon, ts in positions:
+                route_id = route_of.get(bus_id)
+                if route_id is None:
+                    continue
+                route = self._routes.get(route_id)
+                if route is None:
+                    route = self._routes[route_id] = RouteState()
+                current = route.buses.get(bus_id)
+                if current is not None and current[2] > ts:
+                    continue  # Out of order
+                if route_id not in touched:
+                    touched[route_id] = route.version + 1
+                route.buses[bus_id] = [round(lat * COORD_SCALE), round(lon * COORD_SCALE), int(ts),
+                                       touched[route_id]]
+                route.gone.pop(bus_id, None)
+            for route_id, version in touched.items():
+                route = self._routes[route_id]
+                route.version = version
+                route.frames.clear()
+
+    def seed(self, route_id):
+        """Load current positions from the database the first time a route is watched"""
+        if route_id in self._seeded:
+            return
+        buses = Bus.objects.filter(route_id=route_id, is_active=True, current_location__isnull=False)
+        self.apply([(bus_id, location.y, location.x, last_updated.timestamp())
+                    for bus_id, location, last_updated in
+                    buses.values_list('id', 'current_location', 'last_updated')])
+        self._seeded.add(route_id)
+
+    def event_id(self, version):
+        return f"{self.epoch}-{version}"
+
+    def parse_event_id(self, value):
+        """The version in an event id this process issued; 0, asking for a full frame, for anything else"""
+        epoch, _, version = str(value or '').partition('-')
+        if epoch != self.epoch or not version.isdigit():
+            return 0
+        return int(version)
+
+    def frame_since(self, route_id, since):
+        """(encoded frame, version) with everything changed after ``since``, or (None, since)"""
+        with self._lock:
+            route = self._routes.get(route_id)
+            if route is None or route.version == since:
+                return None, since
+            if since > route.version:
+                since = 0
+            cached = route.frames.get(since)
+            if cached is None:
+                frame = {
+                    'id': self.event_id(route.version),
+                    'full': since == 0,
+                    'b': [[bus_id, lat, lon, ts] for bus_id, (lat, lon, ts, changed) in route.buses.items()
+                          if changed > since],
+                }
+                if since:
+                    frame['gone'] = [bus_id for bus_id, version in route.gone.items() if version > since]
+                cached = route.frames[since] = (json.dumps(frame, separators=(',', ':')), route.version)
+            return cached
+
+
+state = LiveState()
+
+
+class MemoryBroker:
+    """Single-process broker: published positions go straight into the local state"""
+
+    def publish(self, positions):
+        state.apply(positions)
+
+    def start(self):
+        pass
+
+
+class RedisBroker:
+    """Fans positions out to every process through Redis pub/sub"""
+
+    def __init__(self, url, channel='transport:live'):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.channel = channel
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def publish(self, positions):
+        if positions:
+            self.client.publish(self.channel, encode_binary(positions))
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._listen, name='live-subscriber', daemon=True)
+                self._thread.start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                for message in pubsub.listen():
+                    state.apply(parse_binary(message['data']))
+            except Exception:
+                logger.exception("Live position subscriber failed; reconnecting")
+                time.sleep(1)
+
+
+_broker = None
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        if getattr(settings, 'TRANSPORT_LIVE_BROKER', 'memory') == 'redis':
+            _broker = RedisBroker(settings.TRANSPORT_LIVE_REDIS_URL)
+        else:
+            _broker = MemoryBroker()
+    return _broker
+
+
+def publish(positions):
+    """TelemetryBuffer.on_flush hook"""
+    get_broker().publish(positions)
+
+
+def poll(route_id, since_id=None):
+    """One frame for clients that poll instead of streaming (under WSGI)"""
+    get_broker().start()
+    state.seed(route_id)
+    if state.refresh_due():
+        state.refresh()
+    since = state.parse_event_id(since_id)
+    frame, version = state.frame_since(route_id, since)
+    if frame is None:
+        frame = json.dumps({'id': state.event_id(version), 'full': False, 'b': [], 'gone': []},
+                           separators=(',', ':'))
+    return frame
+
+
+async def stream(route_id, since_id=None, interval=None):
+    """SSE events for one route: a full frame first, then at most one delta per interval"""
+    interval = interval or getattr(settings, 'TRANSPORT_LIVE_INTERVAL', 1.0)
+    get_broker().start()
+    await sync_to_async(state.seed)(route_id)
+    since = state.parse_event_id(since_id)
+
+    yield f"retry: {int(interval * 3000)}\n\n"
+    quiet = 0
+    while True:
+        if state.refresh_due():
+            await sync_to_async(state.refresh)()
+        frame, version = state.frame_since(route_id, since)
+        if frame is not None:
+            since = version
+            quiet = 0
+            yield f"id: {state.event_id(version)}\nevent: positions\ndata: {frame}\n\n"
+        else:
+            quiet += interval
+            if quiet >= KEEPALIVE_SECONDS:
+                quiet = 0
+                yield ": keepalive\n\n"
+        await asyncio.sleep(interval)
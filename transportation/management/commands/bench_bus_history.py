@@ -0,0 +1,50 @@
+import math
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from transportation.history import COORD_SCALE, decode_segment, encode_segment
+
+
+class Command(BaseCommand):
+    help = "Benchmark history segment size and query time for a synthetic day of fleet pings"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--buses', type=int, default=50)
+        parser.add_argument('--interval', type=float, default=5, help="Seconds between pings")
+        parser.add_argument('--hours', type=float, default=18, help="Service hours in the day")
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(42)
+        count = int(options['hours'] * 3600 / options['interval'])
+        t0 = 1_700_000_000_000
+
+        segments = []
+        for _ in range(options['buses']):
+            # A bus looping around a ~2 km campus circuit with GPS jitter
+            ts_ms = t0 + np.cumsum(rng.normal(options['interval'] * 1000, 200, count).clip(100)).astype(np.int64)
+            angle = np.linspace(0, 2 * math.pi * options['hours'] * 2, count)
+            lat = 23.78 + 0.003 * np.sin(angle) + rng.normal(0, 2e-6, count)
+            lon = 90.40 + 0.003 * np.cos(angle) + rng.normal(0, 2e-6, count)
+            segments.append(encode_segment(ts_ms, (lat * COORD_SCALE).round(), (lon * COORD_SCALE).round()))
+
+        pings = count * options['buses']
+        stored = sum(len(segment) for segment in segments)
+        self.stdout.write(f"{options['buses']} buses x {count} pings = {pings} pings/day")
+        self.stdout.write(f"Stored: {stored / 1024:.1f} KiB, {stored / pings:.2f} bytes/ping "
+                          f"(raw float rows ~{8 * 3} bytes/ping)")
+
+        started = time.perf_counter()
+        for segment in segments:
+            decode_segment(segment)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"Full-day decode, whole fleet: {elapsed * 1000:.1f} ms "
+                          f"({elapsed / options['buses'] * 1000:.2f} ms per bus)")
+
+        started = time.perf_counter()
+        ts_ms, lat_e7, lon_e7 = decode_segment(segments[0])
+        lo, hi = np.searchsorted(ts_ms, [ts_ms[0] + 3_600_000, ts_ms[0] + 7_200_000])
+        window = np.column_stack((lat_e7[lo:hi], lon_e7[lo:hi])) / COORD_SCALE
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"One-hour window for one bus: {len(window)} pings in {elapsed * 1000:.2f} ms")
@@ -0,0 +1,58 @@
+import time
+
+import numpy as np
+from django.contrib.gis.geos import Point
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from transportation.geometry import haversine_m
+from transportation.models import BusStop
+from transportation.spatial import stops_within
+
+
+class Command(BaseCommand):
+    help = "Benchmark nearby-stop queries against a synthetic set of stops (rolled back afterwards)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stops', type=int, default=10000)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--radius', type=float, default=400, help="Search radius in metres")
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(7)
+        # Stops scattered over a ~20 x 20 km area
+        lats = 23.70 + rng.uniform(0, 0.18, options['stops'])
+        lons = 90.35 + rng.uniform(0, 0.20, options['stops'])
+        probes = np.column_stack((23.70 + rng.uniform(0, 0.18, options['queries']),
+                                  90.35 + rng.uniform(0, 0.20, options['queries'])))
+
+        with transaction.atomic():
+            started = time.perf_counter()
+            BusStop.objects.bulk_create(
+                [BusStop(name=f'Bench {i}', address='', location=Point(lon, lat, srid=4326))
+                 for i, (lat, lon) in enumerate(zip(lats, lons))],
+                batch_size=1000,
+            )
+            self.stdout.write(f"Inserted {options['stops']} stops in {time.perf_counter() - started:.2f} s")
+            queryset = BusStop.objects.filter(name__startswith='Bench ')
+
+            started = time.perf_counter()
+            found = [len(stops_within(lat, lon, options['radius'], queryset=queryset)) for lat, lon in probes]
+            indexed = time.perf_counter() - started
+
+            started = time.perf_counter()
+            expected = []
+            for lat, lon in probes:
+                stops = list(queryset)
+                distances = haversine_m(lat, lon, [s.location.y for s in stops], [s.location.x for s in stops])
+                expected.append(int((distances <= options['radius']).sum()))
+            scan = time.perf_counter() - started
+
+            transaction.set_rollback(True)
+
+        queries = options['queries']
+        self.stdout.write(f"Indexed lookup: {indexed / queries * 1000:.2f} ms/query, "
+                          f"{np.mean(found):.1f} stops within {options['radius']:.0f} m on average")
+        self.stdout.write(f"Full scan:      {scan / queries * 1000:.2f} ms/query")
+        if found != expected:
+            self.stderr.write("Indexed and full-scan results differ")
@@ -0,0 +1,78 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from transportation.planner import Network, NoJourney
+from transportation.timetable import DayTimetable
+
+
+class Command(BaseCommand):
+    help = "Benchmark journey planning on a synthetic network (nothing is written to the database)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--routes', type=int, default=100)
+        parser.add_argument('--stops-per-route', type=int, default=20)
+        parser.add_argument('--grid', type=int, default=40, help="Stops are placed on a grid x grid lattice")
+        parser.add_argument('--headway', type=int, default=10, help="Minutes between trips")
+        parser.add_argument('--queries', type=int, default=500)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(11)
+        grid = options['grid']
+        spacing = 0.0025  # ~250 m between lattice points
+        coords = {row * grid + col + 1: (23.70 + row * spacing, 90.35 + col * spacing)
+                  for row in range(grid) for col in range(grid)}
+
+        routes = {}
+        steps = np.array([(0, 1), (1, 0), (0, -1), (-1, 0)])
+        for route_id in range(1, options['routes'] + 1):
+            # A random walk across the lattice that never turns straight back
+            position = rng.integers(0, grid, 2)
+            direction = rng.integers(0, 4)
+            stop_ids = []
+            while len(stop_ids) < options['stops_per_route']:
+                stop_id = int(position[0] * grid + position[1] + 1)
+                if stop_id not in stop_ids:
+                    stop_ids.append(stop_id)
+                direction = (direction + rng.choice([-1, 0, 0, 1])) % 4
+                step = position + steps[direction]
+                if ((step < 0) | (step >= grid)).any():
+                    direction = (direction + 2) % 4
+                    step = position + steps[direction]
+                position = step
+            hops = rng.integers(60, 150, len(stop_ids) - 1)
+            offsets = np.concatenate(([0], np.cumsum(hops))).astype(np.int32)
+            first = 6 * 3600 + int(rng.integers(0, options['headway'] * 60))
+            trip_starts = np.arange(first, 22 * 3600, options['headway'] * 60, dtype=np.int32)
+            routes[route_id] = (stop_ids, offsets, trip_starts)
+
+        started = time.perf_counter()
+        day = DayTimetable(0, routes)
+        network = Network(day, {stop_id: coords[stop_id] for stop_id in day.stops})
+        built = time.perf_counter() - started
+        footpaths = sum(len(paths) for paths in network.footpaths)
+        self.stdout.write(f"{len(routes)} routes, {len(network.stop_ids)} stops, {len(network.dep)} connections, "
+                          f"{footpaths} walking transfers; built in {built * 1000:.0f} ms")
+
+        stop_ids = network.stop_ids
+        pairs = [(stop_ids[a], stop_ids[b]) for a, b in rng.integers(0, len(stop_ids), (options['queries'], 2))]
+        times = rng.integers(7 * 3600, 20 * 3600, options['queries']).tolist()
+
+        for label, query in (('Depart at', network.earliest_arrival), ('Arrive by', network.latest_departure)):
+            found, legs, elapsed = 0, 0, []
+            for (source, target), moment in zip(pairs, times):
+                if source == target:
+                    continue
+                started = time.perf_counter()
+                try:
+                    journey = query(source, target, moment)
+                    found += 1
+                    legs += len(journey)
+                except NoJourney:
+                    pass
+                elapsed.append(time.perf_counter() - started)
+            elapsed = np.array(elapsed) * 1000
+            self.stdout.write(f"{label}: median {np.median(elapsed):.2f} ms, p95 {np.percentile(elapsed, 95):.2f} ms, "
+                              f"max {elapsed.max():.2f} ms; {found}/{len(elapsed)} journeys found, "
+                              f"{legs / max(found, 1):.1f} legs on average")
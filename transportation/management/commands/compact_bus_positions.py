@@ -0,0 +1,29 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+
+from transportation.history import compact_day, prune
+
+
+class Command(BaseCommand):
+    help = "Pack raw bus pings into per-day history segments and prune expired history"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--day', help="UTC day to compact (YYYY-MM-DD); defaults to yesterday")
+        parser.add_argument('--prune', action='store_true', help="Also delete history past the retention window")
+
+    def handle(self, *args, **options):
+        if options['day']:
+            try:
+                day = datetime.strptime(options['day'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError("--day must be a date in YYYY-MM-DD format")
+        else:
+            day = datetime.now(dt_timezone.utc).date() - timedelta(days=1)
+
+        count = compact_day(day)
+        self.stdout.write(self.style.SUCCESS(f"Compacted {count} pings for {day}"))
+
+        if options['prune']:
+            removed = prune()
+            self.stdout.write(self.style.SUCCESS(f"Pruned {removed} expired history rows"))
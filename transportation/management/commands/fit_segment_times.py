@@ -0,0 +1,18 @@
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from transportation.eta import fit_segment_times
+
+
+class Command(BaseCommand):
+    help = "Learn stop-to-stop travel times from recent bus position history"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7, help="How many days of history to use")
+
+    def handle(self, *args, **options):
+        segment_times = fit_segment_times(days=options['days'])
+        learned = sum(int(np.isfinite(seconds).sum()) for seconds in segment_times.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"Learned {learned} segment times across {len(segment_times)} routes"
+        ))
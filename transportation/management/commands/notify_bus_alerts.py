@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from transportation.alerts import notify_started_alerts
+
+
+class Command(BaseCommand):
+    help = "Notify route subscribers about bus alerts that have started; also run every minute by the beat schedule"
+
+    def handle(self, *args, **options):
+        created = notify_started_alerts()
+        self.stdout.write(self.style.SUCCESS(f"Created {created} alert notifications"))
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.6 on 2026-10-19 14:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transportation', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BusPositionLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+                ('recorded_at', models.DateTimeField()),
+                ('bus', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='position_log', to='transportation.bus')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['bus', 'recorded_at'], name='transport_poslog_bus_time_idx')],
+            },
+        ),
+    ]
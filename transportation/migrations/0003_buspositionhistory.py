@@ -0,0 +1,31 @@
+# Generated by Django 5.1.6 on 2026-10-19 14:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transportation', '0002_buspositionlog'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BusPositionHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('point_count', models.PositiveIntegerField()),
+                ('start_time', models.DateTimeField()),
+                ('end_time', models.DateTimeField()),
+                ('data', models.BinaryField(blank=True)),
+                ('file_path', models.CharField(blank=True, max_length=255)),
+                ('bus', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='position_history', to='transportation.bus')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day'], name='transport_poshist_day_idx')],
+                'unique_together': {('bus', 'day')},
+            },
+        ),
+    ]
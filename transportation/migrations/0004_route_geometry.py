@@ -0,0 +1,29 @@
+# Generated by Django 5.1.6 on 2026-10-19 14:30
+
+import django.contrib.gis.db.models.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transportation', '0003_buspositionhistory'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='busroute',
+            name='length_m',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='busroute',
+            name='path',
+            field=django.contrib.gis.db.models.fields.LineStringField(blank=True, null=True, srid=4326),
+        ),
+        migrations.AddField(
+            model_name='routestop',
+            name='distance_m',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
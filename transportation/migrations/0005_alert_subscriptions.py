@@ -0,0 +1,32 @@
+# Generated by Django 5.1.6 on 2026-10-19 15:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_alter_user_role'),
+        ('transportation', '0004_route_geometry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='busalert',
+            name='notified_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='RouteSubscription',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('route', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='subscriptions', to='transportation.busroute')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='route_subscriptions', to='accounts.user')),
+            ],
+            options={
+                'unique_together': {('user', 'route')},
+            },
+        ),
+    ]
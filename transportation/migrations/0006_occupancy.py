@@ -0,0 +1,42 @@
+# Generated by Django 5.1.6 on 2026-10-19 14:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transportation', '0005_alert_subscriptions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bus',
+            name='current_load',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='bus',
+            name='load_updated',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='RouteLoadProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.PositiveSmallIntegerField()),
+                ('samples', models.BinaryField(default=bytes)),
+                ('head', models.PositiveSmallIntegerField(default=0)),
+                ('filled', models.PositiveSmallIntegerField(default=0)),
+                ('ring_total', models.PositiveIntegerField(default=0)),
+                ('open_day', models.DateField(blank=True, null=True)),
+                ('open_total', models.FloatField(default=0)),
+                ('open_count', models.PositiveIntegerField(default=0)),
+                ('route', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='load_profiles', to='transportation.busroute')),
+            ],
+            options={
+                'unique_together': {('route', 'hour')},
+            },
+        ),
+    ]
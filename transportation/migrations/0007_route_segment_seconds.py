@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-19 15:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transportation', '0006_occupancy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='busroute',
+            name='segment_seconds',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.6 on 2026-10-19 15:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transportation', '0007_route_segment_seconds'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bus',
+            name='load_stop',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='transportation.busstop'),
+        ),
+    ]
@@ -11,11 +11,15 @@ class BusRoute(models.Model):
     description = models.TextField(blank=True)
     color_code = models.CharField(max_length=7)  # Hex color code for the route
     active = models.BooleanField(default=True)
+    path = gis_models.LineStringField(null=True, blank=True)  # Materialized from the ordered stops
+    length_m = models.FloatField(null=True, blank=True)
+    # Learned stop-to-stop travel seconds in stop order, null where unknown (see eta.fit_segment_times)
+    segment_seconds = models.JSONField(null=True, blank=True, editable=False)
 
 
 class BusStop(models.Model):
     name = models.CharField(max_length=100)
-    location = gis_models.PointField()  # Geographical point
+    location = gis_models.PointField(spatial_index=True)  # Geographical point, R-tree indexed
     address = models.CharField(max_length=200)
     routes = models.ManyToManyField(BusRoute, through='RouteStop', related_name='stops')
 
@@ -24,6 +28,7 @@ class RouteStop(models.Model):
     route = models.ForeignKey(BusRoute, on_delete=models.CASCADE)
     stop = models.ForeignKey(BusStop, on_delete=models.CASCADE)
     order = models.PositiveIntegerField()  # The order of the stop in the route
+    distance_m = models.FloatField(null=True, blank=True)  # Distance along the route path
 
 
 class BusSchedule(models.Model):
@@ -41,6 +46,14 @@ class Bus(models.Model):
     current_location = gis_models.PointField(null=True, blank=True)
     last_updated = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
+    current_load = models.PositiveIntegerField(default=0)  # Riders on board, from boarding counts
+    load_updated = models.DateTimeField(null=True, blank=True)
+    load_stop = models.ForeignKey(BusStop, on_delete=models.SET_NULL, null=True, blank=True,
+                                  related_name='+')  # Where the latest boarding count was taken
+
+    @property
+    def load_factor(self):
+        return self.current_load / self.capacity if self.capacity else None
 
 
 class BusAlert(models.Model):
@@ -49,4 +62,94 @@ class BusAlert(models.Model):
     description = models.TextField()
     start_date = models.DateTimeField()
     end_date = models.DateTimeField()
-    active = models.BooleanField(default=True)
\ No newline at end of file
+    active = models.BooleanField(default=True)
+    notified_at = models.DateTimeField(null=True, blank=True)  # When subscribers were told about it
+
+
+class RouteSubscription(models.Model):
+    """A rider who wants alerts for a route"""
+    user = models.ForeignKey('accounts.User', on_delete=models.CASCADE, related_name='route_subscriptions')
+    route = models.ForeignKey(BusRoute, on_delete=models.CASCADE, related_name='subscriptions')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('user', 'route')
+
+
+class RouteLoadProfile(models.Model):
+    """Recent daily load factors for one route and hour of day, kept as a ring buffer"""
+    RING_SIZE = 28
+
+    route = models.ForeignKey(BusRoute, on_delete=models.CASCADE, related_name='load_profiles')
+    hour = models.PositiveSmallIntegerField()
+    samples = models.BinaryField(default=bytes)  # One byte per day: mean load factor in percent
+    head = models.PositiveSmallIntegerField(default=0)
+    filled = models.PositiveSmallIntegerField(default=0)
+    ring_total = models.PositiveIntegerField(default=0)  # Sum of the filled samples
+    open_day = models.DateField(null=True, blank=True)  # Day still being accumulated
+    open_total = models.FloatField(default=0)
+    open_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('route', 'hour')
+
+    def push(self, load_factor):
+        """Append a day's mean load factor, overwriting the oldest when full"""
+        ring = bytearray(bytes(self.samples) or bytes(self.RING_SIZE))
+        percent = min(max(round(load_factor * 100), 0), 255)
+        if self.filled == self.RING_SIZE:
+            self.ring_total -= ring[self.head]
+        ring[self.head] = percent
+        self.ring_total += percent
+        self.head = (self.head + 1) % self.RING_SIZE
+        self.filled = min(self.filled + 1, self.RING_SIZE)
+        self.samples = bytes(ring)
+
+    def observe(self, day, load_factor):
+        """Add one observation, closing the previous day's bucket when the day changes"""
+        if self.open_day is not None and day < self.open_day:
+            return  # Late count for a day already closed into the ring
+        if self.open_day != day:
+            if self.open_count:
+                self.push(self.open_total / self.open_count)
+            self.open_day, self.open_total, self.open_count = day, 0, 0
+        self.open_total += load_factor
+        self.open_count += 1
+
+    @property
+    def mean_load_factor(self):
+        samples = self.filled + (1 if self.open_count else 0)
+        if not samples:
+            return None
+        today = self.open_total / self.open_count if self.open_count else 0
+        return (self.ring_total / 100 + today) / samples
+
+
+class BusPositionLog(models.Model):
+    """Raw GPS pings appended in batches by the telemetry ingester"""
+    bus = models.ForeignKey(Bus, on_delete=models.CASCADE, related_name='position_log')
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    recorded_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['bus', 'recorded_at'], name='transport_poslog_bus_time_idx'),
+        ]
+
+
+class BusPositionHistory(models.Model):
+    """One bus's pings for one UTC day, delta-encoded (see transportation.history)"""
+    bus = models.ForeignKey(Bus, on_delete=models.CASCADE, related_name='position_history')
+    day = models.DateField()
+    point_count = models.PositiveIntegerField()
+    start_time = models.DateTimeField()
+    end_time = models.DateTimeField()
+    data = models.BinaryField(blank=True)  # Encoded segment when stored in the database
+    file_path = models.CharField(max_length=255, blank=True)  # Segment file when stored on disk
+
+    class Meta:
+        unique_together = ('bus', 'day')
+        indexes = [
+            models.Index(fields=['day'], name='transport_poshist_day_idx'),
+        ]
@@ -0,0 +1,251 @@
+# transportation/occupancy.py
+"""
+Boarding counts, bus loads and crowding forecasts.
+
+Door counters post boarding/alighting counts in batches, in the same way
+GPS trackers post pings. Counts are buffered in-process and a background
+flush applies the net change per bus to Bus.current_load and records the
+stop of the latest count as Bus.load_stop. Each resulting
+load factor is folded into the RouteLoadProfile for the bus's route and
+hour of day. A profile is a ring buffer of daily means with a running
+total, so updates and forecasts never scan history. Counts for a day the
+profile has already closed are still applied to the bus's load but left
+out of the profile.
+
+Counts stamped outside telemetry's accepted window are rejected when
+buffered. A batch that fails to flush is put back and retried, up to
+MAX_FLUSH_ATTEMPTS times, as with pings. At most ``max_pending`` counts
+are held; when the database falls behind, the oldest are shed.
+
+Binary payloads are 16-byte little-endian records: bus id (uint32), stop
+id (uint32), boarded and alighted (uint16 each), Unix timestamp (uint32).
+"""
+import atexit
+import json
+import logging
+import struct
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .models import Bus, BusStop, RouteLoadProfile
+from .telemetry import MAX_FLUSH_ATTEMPTS, TelemetryError, valid_timestamp
+
+logger = logging.getLogger(__name__)
+
+BINARY_RECORD = struct.Struct('<IIHHI')
+MAX_LOAD_FACTOR = 1.5  # Counter drift is clamped to this much over capacity
+LIVE_LOAD_SECONDS = 30 * 60  # A bus's own load is trusted for this long after its last count
+LIVE_HORIZON_SECONDS = 15 * 60  # Beyond this, forecasts use the route's hourly profile
+PROFILES_KEY = 'transport:occupancy:profiles'
+PROFILES_TIMEOUT = 5 * 60
+CROWDING_LEVELS = ((0.5, 'low'), (0.8, 'medium'), (1.0, 'high'))
+
+
+def parse_json(body):
+    """Counts from ``{"counts": [[bus, stop, boarded, alighted, ts], ...]}``"""
+    try:
+        counts = json.loads(body)['counts']
+        return [(int(bus), int(stop), int(boarded), int(alighted), float(ts))
+                for bus, stop, boarded, alighted, ts in counts]
+    except (ValueError, KeyError, TypeError) as e:
+        raise TelemetryError(f"Invalid JSON occupancy counts: {e}")
+
+
+def parse_binary(body):
+    if len(body) % BINARY_RECORD.size:
+        raise TelemetryError(f"Binary occupancy counts must be a multiple of {BINARY_RECORD.size} bytes")
+    return [(bus, stop, boarded, alighted, float(ts))
+            for bus, stop, boarded, alighted, ts in BINARY_RECORD.iter_unpack(body)]
+
+
+def encode_binary(counts):
+    return b''.join(BINARY_RECORD.pack(bus, stop, boarded, alighted, int(ts))
+                    for bus, stop, boarded, alighted, ts in counts)
+
+
+def crowding_level(load_factor):
+    if load_factor is None:
+        return None
+    for limit, level in CROWDING_LEVELS:
+        if load_factor < limit:
+            return level
+    return 'full'
+
+
+class OccupancyBuffer:
+    """Thread-safe count buffer with a periodic background flush"""
+
+    def __init__(self, flush_interval_ms=1000, max_pending=200000):
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._pending = []
+        self._thread = None
+        self._stop = threading.Event()
+        self._failures = 0
+        self.stats = {'accepted': 0, 'rejected': 0, 'flushes': 0, 'dropped': 0}
+
+    def add(self, counts):
+        """Buffer parsed counts; returns how many were accepted"""
+        now = time.time()
+        accepted = [count for count in counts
+                    if count[2] >= 0 and count[3] >= 0 and valid_timestamp(count[4], now)]
+        with self._lock:
+            self._buffer(accepted)
+            self.stats['accepted'] += len(accepted)
+            self.stats['rejected'] += len(counts) - len(accepted)
+        self.start()
+        return len(accepted)
+
+    def _buffer(self, counts, front=False):
+        # Called with the lock held; a retried batch goes back in front of newer counts
+        if front:
+            self._pending[:0] = counts
+        else:
+            self._pending.extend(counts)
+        excess = len(self._pending) - self.max_pending
+        if excess > 0:
+            # The database is falling behind; shed the oldest counts
+            del self._pending[:excess]
+            self.stats['dropped'] += excess
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._stop.clear()
+                    self._thread = threading.Thread(target=self._run, name='occupancy-flush', daemon=True)
+                    self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Occupancy flush failed")
+            finally:
+                close_old_connections()
+
+    def flush(self):
+        """Apply buffered counts; returns the number of buses updated"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return 0
+        try:
+            updated = self._apply(pending)
+        except Exception:
+            self._retry(pending)
+            raise
+        self._failures = 0
+        self.stats['flushes'] += 1
+        return updated
+
+    def _retry(self, pending):
+        """Put a batch that failed to apply back in front of newer counts, unless it keeps failing"""
+        self._failures += 1
+        if self._failures >= MAX_FLUSH_ATTEMPTS:
+            logger.error("Dropping %d occupancy counts after %d failed flushes", len(pending), self._failures)
+            self.stats['dropped'] += len(pending)
+            self._failures = 0
+            return
+        with self._lock:
+            self._buffer(pending, front=True)
+
+    def _apply(self, pending):
+        # Replay each bus's counts in time order so every stop yields a load sample
+        pending.sort(key=lambda count: count[4])
+        by_bus = defaultdict(list)
+        last_stop = {}
+        for bus_id, stop_id, boarded, alighted, ts in pending:
+            by_bus[bus_id].append((boarded - alighted, ts))
+            last_stop[bus_id] = stop_id
+
+        with transaction.atomic():
+            known_stops = set(BusStop.objects.filter(id__in=set(last_stop.values())).values_list('id', flat=True))
+            buses = list(Bus.objects.select_for_update().filter(id__in=by_bus.keys())
+                         .only('id', 'route_id', 'capacity', 'current_load'))
+            samples = []
+            for bus in buses:
+                ceiling = int(bus.capacity * MAX_LOAD_FACTOR)
+                load = bus.current_load
+                for change, ts in by_bus[bus.id]:
+                    load = min(max(load + change, 0), ceiling)
+                    if bus.capacity:
+                        samples.append((bus.route_id, ts, load / bus.capacity))
+                bus.current_load = load
+                bus.load_updated = datetime.fromtimestamp(by_bus[bus.id][-1][1], tz=dt_timezone.utc)
+                bus.load_stop_id = last_stop[bus.id] if last_stop[bus.id] in known_stops else None
+            Bus.objects.bulk_update(buses, ['current_load', 'load_updated', 'load_stop'], batch_size=500)
+            record_samples(samples)
+        return len(buses)
+
+
+def record_samples(samples):
+    """Fold (route_id, unix ts, load factor) samples into the hourly profiles"""
+    grouped = defaultdict(list)
+    for route_id, ts, load_factor in samples:
+        local = timezone.localtime(datetime.fromtimestamp(ts, tz=dt_timezone.utc))
+        grouped[(route_id, local.hour)].append((local.date(), load_factor))
+    if not grouped:
+        return
+
+    route_ids = {route_id for route_id, _ in grouped}
+    profiles = {(p.route_id, p.hour): p for p in
+                RouteLoadProfile.objects.select_for_update().filter(route_id__in=route_ids)}
+    missing = [RouteLoadProfile(route_id=route_id, hour=hour) for route_id, hour in grouped
+               if (route_id, hour) not in profiles]
+    if missing:
+        RouteLoadProfile.objects.bulk_create(missing, ignore_conflicts=True)
+        profiles = {(p.route_id, p.hour): p for p in
+                    RouteLoadProfile.objects.select_for_update().filter(route_id__in=route_ids)}
+
+    changed = []
+    for key, observations in grouped.items():
+        profile = profiles[key]
+        for day, load_factor in observations:
+            profile.observe(day, load_factor)
+        changed.append(profile)
+    RouteLoadProfile.objects.bulk_update(
+        changed, ['samples', 'head', 'filled', 'ring_total', 'open_day', 'open_total', 'open_count'],
+        batch_size=500,
+    )
+
+
+def profile_table():
+    """{(route_id, hour): mean load factor}, cached briefly"""
+    table = cache.get(PROFILES_KEY)
+    if table is None:
+        table = {(profile.route_id, profile.hour): profile.mean_load_factor
+                 for profile in RouteLoadProfile.objects.all()}
+        cache.set(PROFILES_KEY, table, PROFILES_TIMEOUT)
+    return table
+
+
+def forecast(route_id, arrival_time, current_load=None, capacity=None, load_updated=None,
+             now=None, profiles=None):
+    """Expected load factor of a bus when it reaches a stop at ``arrival_time``"""
+    now = now or timezone.now()
+    if (capacity and load_updated is not None and
+            (now - load_updated).total_seconds() <= LIVE_LOAD_SECONDS and
+            (arrival_time - now).total_seconds() <= LIVE_HORIZON_SECONDS):
+        return current_load / capacity
+    profiles = profile_table() if profiles is None else profiles
+    return profiles.get((route_id, timezone.localtime(arrival_time).hour))
+
+
+buffer = OccupancyBuffer(flush_interval_ms=getattr(settings, 'TRANSPORT_OCCUPANCY_FLUSH_MS', 1000))
+atexit.register(buffer.stop)
@@ -0,0 +1,256 @@
+# transportation/planner.py
+"""
+Journey planning across bus routes with the Connection Scan Algorithm.
+
+A day's timetable (see timetable) is flattened into one array of
+elementary connections: a trip leaving stop A at time t and reaching the
+next stop B at time t'. The array is sorted by departure time. Walking
+transfers link every pair of stops within WALK_RADIUS_M of each other.
+
+An earliest-arrival query binary-searches to the departure time and scans
+forward once. It stops as soon as no connection can improve the arrival at
+the target. An arrive-by query is the mirror image: it scans connections
+backwards by arrival time to find the latest departure. Networks are built
+once per weekday timetable and kept in process memory.
+"""
+import math
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+from django.utils import timezone
+
+from . import timetable
+from .geometry import EARTH_RADIUS_M, haversine_m
+from .models import BusStop
+
+WALK_RADIUS_M = 400
+WALK_SPEED_MPS = 1.25
+INFINITY = float('inf')
+
+
+class NoJourney(Exception):
+    """No journey connects the stops in the requested window"""
+
+
+class Network:
+    """Connections and walking transfers for one day's timetable"""
+
+    def __init__(self, day, stop_coords):
+        # stop_coords: {stop_id: (lat, lon)}
+        self.built_at = day.built_at
+        self.stop_ids = sorted(stop_coords)
+        self.stop_index = {stop_id: index for index, stop_id in enumerate(self.stop_ids)}
+
+        dep_stop, arr_stop, dep, arr, trip_of, self.trip_route = [], [], [], [], [], []
+        for route_id, (stop_ids, offsets, trip_starts) in day.routes.items():
+            indices = np.array([self.stop_index.get(stop_id, -1) for stop_id in stop_ids])
+            if len(stop_ids) < 2 or not len(trip_starts) or (indices < 0).any():
+                continue
+            first_trip = len(self.trip_route)
+            self.trip_route.extend([route_id] * len(trip_starts))
+            # One row per trip, one column per stop-to-stop hop
+            times = trip_starts[:, None].astype(np.int64) + offsets[None, :]
+            hops = len(stop_ids) - 1
+            dep_stop.append(np.tile(indices[:-1], len(trip_starts)))
+            arr_stop.append(np.tile(indices[1:], len(trip_starts)))
+            dep.append(times[:, :-1].ravel())
+            arr.append(times[:, 1:].ravel())
+            trip_of.append(np.repeat(np.arange(first_trip, first_trip + len(trip_starts)), hops))
+
+        if dep:
+            dep_stop, arr_stop, dep, arr, trip_of = (np.concatenate(part) for part in
+                                                     (dep_stop, arr_stop, dep, arr, trip_of))
+        else:
+            dep_stop = arr_stop = dep = arr = trip_of = np.empty(0, dtype=np.int64)
+
+        # Ties broken by arrival so chained zero-length hops stay in trip order
+        order = np.lexsort((arr, dep))
+        # Plain lists: the scan loops are faster on them than on NumPy scalars
+        self.dep_stop = dep_stop[order].tolist()
+        self.arr_stop = arr_stop[order].tolist()
+        self.dep = dep[order].tolist()
+        self.arr = arr[order].tolist()
+        self.trip = trip_of[order].tolist()
+        self.by_arrival = np.lexsort((np.asarray(self.dep), np.asarray(self.arr))).tolist()
+        self.arr_sorted = [self.arr[c] for c in self.by_arrival]
+
+        self.footpaths = self._footpaths(stop_coords)
+
+    def _footpaths(self, stop_coords):
+        """[(other stop index, walking seconds), ...] per stop, via a grid of WALK_RADIUS_M cells"""
+        cell_deg = math.degrees(WALK_RADIUS_M / EARTH_RADIUS_M)
+        lats = np.array([stop_coords[stop_id][0] for stop_id in self.stop_ids])
+        lons = np.array([stop_coords[stop_id][1] for stop_id in self.stop_ids])
+        lon_scale = max(math.cos(math.radians(float(lats.mean()))), 1e-6) if len(lats) else 1
+        cells = {}
+        keys = list(zip((lats // cell_deg).astype(int).tolist(),
+                        (lons * lon_scale // cell_deg).astype(int).tolist()))
+        for index, key in enumerate(keys):
+            cells.setdefault(key, []).append(index)
+
+        footpaths = [[] for _ in self.stop_ids]
+        for index, (row, col) in enumerate(keys):
+            candidates = [other for dr in (-1, 0, 1) for dc in (-1, 0, 1)
+                          for other in cells.get((row + dr, col + dc), ()) if other != index]
+            if not candidates:
+                continue
+            distances = np.atleast_1d(haversine_m(lats[index], lons[index], lats[candidates], lons[candidates]))
+            footpaths[index] = [(other, int(math.ceil(distance / WALK_SPEED_MPS)))
+                                for other, distance in zip(candidates, distances.tolist())
+                                if distance <= WALK_RADIUS_M]
+        return footpaths
+
+    def earliest_arrival(self, source, target, depart_at):
+        """Legs of the journey arriving first at ``target`` when leaving ``source`` at ``depart_at``"""
+        s, t = self.stop_index[source], self.stop_index[target]
+        earliest = [INFINITY] * len(self.stop_ids)
+        journey = [None] * len(self.stop_ids)
+        earliest[s] = depart_at
+        for other, seconds in self.footpaths[s]:
+            earliest[other] = depart_at + seconds
+            journey[other] = ('walk', s, seconds)
+
+        dep_stop, arr_stop, dep, arr, trips, footpaths = (
+            self.dep_stop, self.arr_stop, self.dep, self.arr, self.trip, self.footpaths)
+        boarded = {}
+        for c in range(bisect_left(dep, depart_at), len(dep)):
+            if dep[c] >= earliest[t]:
+                break
+            trip = trips[c]
+            if trip not in boarded:
+                if earliest[dep_stop[c]] > dep[c]:
+                    continue
+                boarded[trip] = c
+            stop, arrival = arr_stop[c], arr[c]
+            if arrival < earliest[stop]:
+                earliest[stop] = arrival
+                journey[stop] = ('bus', boarded[trip], c)
+                for other, seconds in footpaths[stop]:
+                    if arrival + seconds < earliest[other]:
+                        earliest[other] = arrival + seconds
+                        journey[other] = ('walk', stop, seconds)
+
+        if earliest[t] == INFINITY:
+            raise NoJourney
+        legs = []
+        stop = t
+        while stop != s:
+            leg = journey[stop]
+            if leg[0] == 'bus':
+                legs.append(self._bus_leg(leg[1], leg[2]))
+                stop = dep_stop[leg[1]]
+            else:
+                legs.append(self._walk_leg(leg[1], stop, earliest[stop] - leg[2], earliest[stop]))
+                stop = leg[1]
+        return legs[::-1]
+
+    def latest_departure(self, source, target, arrive_by):
+        """Legs of the journey leaving ``source`` last while still reaching ``target`` by ``arrive_by``"""
+        s, t = self.stop_index[source], self.stop_index[target]
+        latest = [-INFINITY] * len(self.stop_ids)
+        journey = [None] * len(self.stop_ids)
+        latest[t] = arrive_by
+        for other, seconds in self.footpaths[t]:
+            latest[other] = arrive_by - seconds
+            journey[other] = ('walk', t, seconds)
+
+        dep_stop, arr_stop, dep, arr, trips, footpaths = (
+            self.dep_stop, self.arr_stop, self.dep, self.arr, self.trip, self.footpaths)
+        alighted = {}
+        for k in range(bisect_right(self.arr_sorted, arrive_by) - 1, -1, -1):
+            c = self.by_arrival[k]
+            if arr[c] <= latest[s]:
+                break
+            trip = trips[c]
+            if trip not in alighted:
+                if arr[c] > latest[arr_stop[c]]:
+                    continue
+                alighted[trip] = c
+            stop, departure = dep_stop[c], dep[c]
+            if departure > latest[stop]:
+                latest[stop] = departure
+                journey[stop] = ('bus', c, alighted[trip])
+                for other, seconds in footpaths[stop]:
+                    if departure - seconds > latest[other]:
+                        latest[other] = departure - seconds
+                        journey[other] = ('walk', stop, seconds)
+
+        if latest[s] == -INFINITY:
+            raise NoJourney
+        legs = []
+        stop = s
+        while stop != t:
+            leg = journey[stop]
+            if leg[0] == 'bus':
+                legs.append(self._bus_leg(leg[1], leg[2]))
+                stop = arr_stop[leg[2]]
+            else:
+                legs.append(self._walk_leg(stop, leg[1], latest[stop], latest[stop] + leg[2]))
+                stop = leg[1]
+        return legs
+
+    def _bus_leg(self, enter, exit):
+        return {
+            'mode': 'bus',
+            'route_id': self.trip_route[self.trip[enter]],
+            'from_stop': self.stop_ids[self.dep_stop[enter]],
+            'to_stop': self.stop_ids[self.arr_stop[exit]],
+            'depart': self.dep[enter],
+            'arrive': self.arr[exit],
+        }
+
+    def _walk_leg(self, origin, destination, depart, arrive):
+        return {
+            'mode': 'walk',
+            'from_stop': self.stop_ids[origin],
+            'to_stop': self.stop_ids[destination],
+            'depart': depart,
+            'arrive': arrive,
+        }
+
+
+def build_network(weekday):
+    day = timetable.get_day(weekday)
+    stop_ids = {stop_id for stop_ids, _, _ in day.routes.values() for stop_id in stop_ids}
+    coords = {stop_id: (location.y, location.x) for stop_id, location in
+              BusStop.objects.filter(id__in=stop_ids).values_list('id', 'location')}
+    return Network(day, coords)
+
+
+_networks = {}
+
+
+def get_network(weekday):
+    """Network for a weekday, rebuilt whenever its timetable has been"""
+    day = timetable.get_day(weekday)
+    network = _networks.get(weekday)
+    if network is None or network.built_at != day.built_at:
+        network = _networks[weekday] = build_network(weekday)
+    return network
+
+
+def plan(source, target, depart_at=None, arrive_by=None):
+    """
+    Journey between two stops as a list of legs with aware datetimes.
+
+    Pass ``depart_at`` for the earliest arrival or ``arrive_by`` for the
+    latest departure. Raises NoJourney when the stops aren't connected on
+    that day.
+    """
+    moment = timezone.localtime(arrive_by or depart_at or timezone.now())
+    day_start = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    seconds = moment.hour * 3600 + moment.minute * 60 + moment.second
+    network = get_network(day_start.weekday())
+    if source not in network.stop_index or target not in network.stop_index:
+        raise NoJourney
+    if source == target:
+        return []
+
+    if arrive_by is not None:
+        legs = network.latest_departure(source, target, seconds)
+    else:
+        legs = network.earliest_arrival(source, target, seconds)
+    for leg in legs:
+        leg['depart'] = timetable.local_datetime(day_start, leg['depart'])
+        leg['arrive'] = timetable.local_datetime(day_start, leg['arrive'])
+    return legs
@@ -0,0 +1,125 @@
+# transportation/spatial.py
+"""
+Stored route geometry and nearby-stop lookups.
+
+``materialize_routes`` stores each route's shape as a LineString through
+its ordered stops, plus the distance of every stop along it. The data is
+rebuilt whenever a RouteStop or BusStop changes, so request paths never
+re-derive it.
+
+``stops_within`` finds stops near a point in two steps. A bounding box is
+matched against the R-tree that SpatiaLite keeps for BusStop.location,
+and the few candidates are then refined with an exact haversine distance.
+"""
+import math
+from functools import partial
+
+import numpy as np
+from django.contrib.gis.geos import LineString, Polygon
+from django.db import connection, transaction
+from django.db.models.expressions import RawSQL
+
+from .geometry import EARTH_RADIUS_M, Polyline, haversine_m
+from .models import BusRoute, BusStop, RouteStop
+
+# Candidate ids from SpatiaLite's R-tree for a bounding box
+SPATIAL_INDEX_SQL = (
+    "SELECT ROWID FROM SpatialIndex WHERE f_table_name = %s AND f_geometry_column = %s "
+    "AND search_frame = BuildMbr(%s, %s, %s, %s, 4326)"
+)
+
+
+def materialize_routes(route_ids=None):
+    """Rebuild path, length and stop distances for routes; returns routes updated"""
+    route_stops = RouteStop.objects.select_related('stop').order_by('route_id', 'order')
+    routes = BusRoute.objects.all()
+    if route_ids is not None:
+        route_stops = route_stops.filter(route_id__in=route_ids)
+        routes = routes.filter(id__in=route_ids)
+
+    by_route = {route_id: [] for route_id in routes.values_list('id', flat=True)}
+    for route_stop in route_stops:
+        by_route[route_stop.route_id].append(route_stop)
+
+    updated_routes = []
+    updated_stops = []
+    for route_id, stops in by_route.items():
+        route = BusRoute(id=route_id, path=None, length_m=None)
+        if len(stops) >= 2:
+            vertices = [(rs.stop.location.y, rs.stop.location.x) for rs in stops]
+            polyline = Polyline(vertices)
+            route.path = LineString([(lon, lat) for lat, lon in vertices], srid=4326)
+            route.length_m = polyline.length
+            for route_stop, distance in zip(stops, polyline.cumulative):
+                route_stop.distance_m = float(distance)
+        else:
+            for route_stop in stops:
+                route_stop.distance_m = None
+        updated_routes.append(route)
+        updated_stops.extend(stops)
+
+    with transaction.atomic():
+        BusRoute.objects.bulk_update(updated_routes, ['path', 'length_m'], batch_size=500)
+        RouteStop.objects.bulk_update(updated_stops, ['distance_m'], batch_size=500)
+
+    from .eta import invalidate_route_tables
+    from .timetable import invalidate_timetables
+    invalidate_route_tables()
+    invalidate_timetables()
+    return len(updated_routes)
+
+
+def _bounding_box(lat, lon, radius_m):
+    dlat = math.degrees(radius_m / EARTH_RADIUS_M)
+    dlon = dlat / max(math.cos(math.radians(lat)), 1e-6)
+    return lon - dlon, lat - dlat, lon + dlon, lat + dlat
+
+
+def _uses_spatialite_index():
+    return getattr(connection.ops, 'spatialite', False)
+
+
+def stops_within(lat, lon, radius_m, limit=None, queryset=None):
+    """[(stop, distance_m), ...] within radius_m of a point, nearest first"""
+    queryset = BusStop.objects.all() if queryset is None else queryset
+    xmin, ymin, xmax, ymax = _bounding_box(lat, lon, radius_m)
+    if _uses_spatialite_index():
+        candidates = queryset.filter(id__in=RawSQL(
+            SPATIAL_INDEX_SQL, (BusStop._meta.db_table, 'location', xmin, ymin, xmax, ymax)
+        ))
+    else:
+        # PostGIS and friends use their spatial index for bounding-box overlaps directly
+        candidates = queryset.filter(location__bboverlaps=Polygon.from_bbox((xmin, ymin, xmax, ymax)))
+
+    candidates = list(candidates)
+    if not candidates:
+        return []
+    distances = np.atleast_1d(haversine_m(
+        lat, lon,
+        [stop.location.y for stop in candidates], [stop.location.x for stop in candidates],
+    ))
+    order = np.argsort(distances, kind='stable')
+    nearby = [(candidates[i], float(distances[i])) for i in order if distances[i] <= radius_m]
+    return nearby[:limit] if limit else nearby
+
+
+def _rematerialize_route(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    transaction.on_commit(partial(materialize_routes, [instance.route_id]))
+
+
+def _rematerialize_stop_routes(sender, instance, created=False, raw=False, **kwargs):
+    if raw or created:
+        return
+    route_ids = list(RouteStop.objects.filter(stop=instance).values_list('route_id', flat=True).distinct())
+    if route_ids:
+        transaction.on_commit(partial(materialize_routes, route_ids))
+
+
+def connect_signals():
+    from django.db.models.signals import post_delete, post_save
+
+    post_save.connect(_rematerialize_route, sender=RouteStop, dispatch_uid='spatial.routestop.save')
+    post_delete.connect(_rematerialize_route, sender=RouteStop, dispatch_uid='spatial.routestop.delete')
+    post_save.connect(_rematerialize_stop_routes, sender=BusStop, dispatch_uid='spatial.busstop.save')
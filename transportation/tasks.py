@@ -0,0 +1,9 @@
+from celery import shared_task
+
+from . import alerts
+
+
+@shared_task(ignore_result=True)
+def notify_bus_alerts():
+    """Notify route subscribers about bus alerts that have started"""
+    alerts.notify_started_alerts()
@@ -0,0 +1,217 @@
+# transportation/telemetry.py
+"""
+Batched GPS ingestion for buses.
+
+Pings are parsed straight into tuples, checked for sane coordinates and
+timestamps, and dropped into an in-process buffer. A background thread
+flushes it every TELEMETRY_FLUSH_MS: pings from buses that are unknown or
+inactive are dropped, the latest position per bus goes out as one bulk
+UPDATE, and every ping is appended to BusPositionLog with bulk_create.
+Request handlers never touch the database. A batch that fails to write is
+put back and retried with the next flush, up to MAX_FLUSH_ATTEMPTS times.
+
+Binary payloads are a sequence of 16-byte little-endian records:
+bus id (uint32), latitude and longitude in 1e-7 degrees (int32 each),
+Unix timestamp in seconds (uint32).
+"""
+import atexit
+import json
+import logging
+import math
+import struct
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.contrib.gis.geos import Point
+from django.db import close_old_connections
+
+from .models import Bus, BusPositionLog
+
+logger = logging.getLogger(__name__)
+
+BINARY_RECORD = struct.Struct('<IiiI')
+COORD_SCALE = 1e7
+KNOWN_BUSES_TTL = 60
+MAX_CLOCK_SKEW = 5 * 60  # Reject pings stamped further in the future than this
+MAX_PING_AGE = 24 * 60 * 60  # ... or further in the past than this
+MAX_FLUSH_ATTEMPTS = 3
+
+
+class TelemetryError(ValueError):
+    """The payload could not be parsed"""
+
+
+def parse_json(body):
+    """
+    Pings from a JSON body.
+
+    Accepts ``{"pings": [[bus, lat, lon, ts], ...]}`` or the verbose
+    ``{"pings": [{"bus": 1, "lat": .., "lon": .., "ts": ..}, ...]}`` form.
+    """
+    try:
+        pings = json.loads(body)['pings']
+        if pings and isinstance(pings[0], dict):
+            return [(int(p['bus']), float(p['lat']), float(p['lon']), float(p['ts'])) for p in pings]
+        return [(int(bus), float(lat), float(lon), float(ts)) for bus, lat, lon, ts in pings]
+    except (ValueError, KeyError, TypeError, IndexError) as e:
+        raise TelemetryError(f"Invalid JSON telemetry: {e}")
+
+
+def parse_binary(body):
+    if len(body) % BINARY_RECORD.size:
+        raise TelemetryError(f"Binary telemetry must be a multiple of {BINARY_RECORD.size} bytes")
+    return [(bus, lat / COORD_SCALE, lon / COORD_SCALE, float(ts))
+            for bus, lat, lon, ts in BINARY_RECORD.iter_unpack(body)]
+
+
+def encode_binary(pings):
+    """Inverse of parse_binary, for clients and load tests"""
+    return b''.join(BINARY_RECORD.pack(bus, round(lat * COORD_SCALE), round(lon * COORD_SCALE), int(ts))
+                    for bus, lat, lon, ts in pings)
+
+
+def valid_timestamp(ts, now=None):
+    """A finite Unix timestamp within MAX_PING_AGE before and MAX_CLOCK_SKEW after ``now``"""
+    now = time.time() if now is None else now
+    return math.isfinite(ts) and now - MAX_PING_AGE <= ts <= now + MAX_CLOCK_SKEW
+
+
+class TelemetryBuffer:
+    """Thread-safe ping buffer with a periodic background flush"""
+
+    def __init__(self, flush_interval_ms=500, max_pending=200000):
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._latest = {}
+        self._history = []
+        self._flushed_ts = {}
+        self._known_buses = frozenset()
+        self._known_loaded = 0
+        self._thread = None
+        self._stop = threading.Event()
+        self._failures = 0
+        self.stats = {'accepted': 0, 'rejected': 0, 'flushes': 0, 'written': 0, 'dropped': 0}
+
+    def _bus_ids(self):
+        """Ids of active buses, reloaded every KNOWN_BUSES_TTL; only called from flushes"""
+        if time.monotonic() - self._known_loaded > KNOWN_BUSES_TTL:
+            self._known_buses = frozenset(Bus.objects.filter(is_active=True).values_list('id', flat=True))
+            self._known_loaded = time.monotonic()
+        return self._known_buses
+
+    def add(self, pings):
+        """Buffer parsed pings; returns how many were accepted"""
+        now = time.time()
+        accepted = [
+            ping for ping in pings
+            if -90 <= ping[1] <= 90 and -180 <= ping[2] <= 180 and valid_timestamp(ping[3], now)
+        ]
+        with self._lock:
+            self._buffer(accepted, accepted)
+            self.stats['accepted'] += len(accepted)
+            self.stats['rejected'] += len(pings) - len(accepted)
+        self.start()
+        return len(accepted)
+
+    def _buffer(self, history, positions):
+        # Called with the lock held
+        if len(self._history) + len(history) > self.max_pending:
+            # The database is falling behind; shed the oldest history, keep latest positions
+            del self._history[:len(history)]
+        self._history.extend(history)
+        latest = self._latest
+        for ping in positions:
+            current = latest.get(ping[0])
+            if current is None or ping[3] >= current[3]:
+                latest[ping[0]] = ping
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._stop.clear()
+                    self._thread = threading.Thread(target=self._run, name='telemetry-flush', daemon=True)
+                    self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Telemetry flush failed")
+            finally:
+                close_old_connections()
+
+    def flush(self):
+        """Write buffered pings; returns the number of buses updated"""
+        with self._lock:
+            latest, self._latest = self._latest, {}
+            history, self._history = self._history, []
+        if not latest and not history:
+            return 0
+
+        try:
+            known = self._bus_ids()
+            history = [ping for ping in history if ping[0] in known]
+            # Drop positions of unknown buses, or older than what an earlier flush already wrote
+            fresh = [ping for bus_id, ping in latest.items()
+                     if bus_id in known and ping[3] > self._flushed_ts.get(bus_id, float('-inf'))]
+            if fresh:
+                Bus.objects.bulk_update(
+                    [Bus(pk=bus_id, current_location=Point(lon, lat, srid=4326),
+                         last_updated=datetime.fromtimestamp(ts, tz=dt_timezone.utc))
+                     for bus_id, lat, lon, ts in fresh],
+                    ['current_location', 'last_updated'],
+                    batch_size=500,
+                )
+            if history:
+                self.write_history(history)
+        except Exception:
+            self._retry(latest, history)
+            raise
+        self._failures = 0
+
+        for bus_id, _, _, ts in fresh:
+            self._flushed_ts[bus_id] = ts
+        self.stats['flushes'] += 1
+        self.stats['written'] += len(history)
+        self.on_flush(fresh)
+        return len(fresh)
+
+    def _retry(self, latest, history):
+        """Put a batch that failed to write back in front of newer pings, unless it keeps failing"""
+        self._failures += 1
+        self._known_loaded = 0  # A bus may have been deleted or deactivated since
+        if self._failures >= MAX_FLUSH_ATTEMPTS:
+            logger.error("Dropping %d telemetry pings after %d failed flushes", len(history), self._failures)
+            self.stats['dropped'] += len(history)
+            self._failures = 0
+            return
+        with self._lock:
+            newer, self._history = self._history, []
+            self._buffer(history, latest.values())
+            self._buffer(newer, ())
+
+    def write_history(self, history):
+        BusPositionLog.objects.bulk_create(
+            [BusPositionLog(bus_id=bus_id, latitude=lat, longitude=lon,
+                            recorded_at=datetime.fromtimestamp(ts, tz=dt_timezone.utc))
+             for bus_id, lat, lon, ts in history],
+            batch_size=1000,
+        )
+
+    def on_flush(self, positions):
+        """Hook for consumers of freshly written positions"""
+
+
+buffer = TelemetryBuffer(flush_interval_ms=getattr(settings, 'TRANSPORT_TELEMETRY_FLUSH_MS', 500))
+atexit.register(buffer.stop)
@@ -1,3 +1,468 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.contrib.gis.geos import Point
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import User
+from notifications import fanout
+from notifications.models import Notification
+
+from . import alerts, eta, history, live, occupancy, planner, spatial, tasks, telemetry, timetable
+from .geometry import Polyline, haversine_m
+from .models import (
+    Bus, BusAlert, BusPositionHistory, BusPositionLog, BusRoute, BusStop, RouteLoadProfile, RouteStop,
+    RouteSubscription,
+)
+
+
+class QuietTelemetryBuffer(telemetry.TelemetryBuffer):
+    """Flushed by the test itself instead of a background thread"""
+
+    def start(self):
+        pass
+
+
+class TransportTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.route = BusRoute.objects.create(name='Loop', color_code='#ff0000')
+        cls.bus = Bus.objects.create(route=cls.route, bus_number='1', capacity=40)
+
+
+class TelemetryTests(TransportTestCase):
+    def test_timestamps_must_be_finite_and_recent(self):
+        now = time.time()
+        self.assertTrue(telemetry.valid_timestamp(now - 60, now))
+        for ts in (float('nan'), float('inf'), float('-inf'), -1e12, 0.0,
+                   now - telemetry.MAX_PING_AGE - 1, now + telemetry.MAX_CLOCK_SKEW + 1):
+            self.assertFalse(telemetry.valid_timestamp(ts, now), ts)
+
+    def test_add_rejects_bad_pings_without_queries(self):
+        buffer = QuietTelemetryBuffer()
+        now = time.time()
+        with self.assertNumQueries(0):
+            accepted = buffer.add([(self.bus.id, 23.7, 90.4, now), (self.bus.id, 91, 90.4, now),
+                                   (self.bus.id, 23.7, float('nan'), now), (self.bus.id, 23.7, 90.4, float('-inf'))])
+        self.assertEqual(accepted, 1)
+        self.assertEqual(buffer.stats['rejected'], 3)
+
+    def test_flush_drops_unknown_buses(self):
+        buffer = QuietTelemetryBuffer()
+        now = time.time()
+        buffer.add([(self.bus.id, 23.7, 90.4, now - 1), (self.bus.id, 23.8, 90.5, now), (999999, 1, 2, now)])
+
+        self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(BusPositionLog.objects.count(), 2)
+        self.bus.refresh_from_db()
+        self.assertAlmostEqual(self.bus.current_location.y, 23.8)
+
+    def test_failed_flush_keeps_the_batch(self):
+        buffer = QuietTelemetryBuffer()
+        now = time.time()
+        buffer.add([(self.bus.id, 23.7, 90.4, now - 1)])
+        with mock.patch.object(buffer, 'write_history', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                buffer.flush()
+        buffer.add([(self.bus.id, 23.8, 90.5, now)])
+
+        buffer.flush()
+        self.assertEqual(list(BusPositionLog.objects.order_by('recorded_at').values_list('latitude', flat=True)),
+                         [23.7, 23.8])
+
+    def test_batches_that_keep_failing_are_dropped(self):
+        buffer = QuietTelemetryBuffer()
+        buffer.add([(self.bus.id, 23.7, 90.4, time.time())])
+        with mock.patch.object(buffer, 'write_history', side_effect=RuntimeError):
+            for _ in range(telemetry.MAX_FLUSH_ATTEMPTS):
+                with self.assertRaises(RuntimeError):
+                    buffer.flush()
+        self.assertEqual(buffer.stats['dropped'], 1)
+        self.assertEqual(buffer.flush(), 0)
+
+
+class QuietOccupancyBuffer(occupancy.OccupancyBuffer):
+    def start(self):
+        pass
+
+
+class OccupancyTests(TransportTestCase):
+    def test_counts_outside_the_telemetry_window_are_rejected(self):
+        buffer = QuietOccupancyBuffer()
+        now = time.time()
+        accepted = buffer.add([(self.bus.id, 1, 5, 0, now), (self.bus.id, 1, 5, 0, float('nan')),
+                               (self.bus.id, 1, 5, 0, now - telemetry.MAX_PING_AGE - 1),
+                               (self.bus.id, 1, 5, 0, now + telemetry.MAX_CLOCK_SKEW + 1)])
+        self.assertEqual((accepted, buffer.stats['rejected']), (1, 3))
+
+    def test_failed_flush_keeps_the_counts(self):
+        buffer = QuietOccupancyBuffer()
+        now = time.time()
+        buffer.add([(self.bus.id, 1, 10, 0, now - 10)])
+        with mock.patch.object(occupancy, 'record_samples', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                buffer.flush()
+        buffer.add([(self.bus.id, 2, 0, 4, now)])
+
+        self.assertEqual(buffer.flush(), 1)
+        self.bus.refresh_from_db()
+        self.assertEqual(self.bus.current_load, 6)
+
+    def test_buffer_sheds_the_oldest_counts(self):
+        buffer = QuietOccupancyBuffer(max_pending=2)
+        now = time.time()
+        buffer.add([(self.bus.id, 1, 1, 0, now - 3), (self.bus.id, 1, 2, 0, now - 2), (self.bus.id, 1, 4, 0, now)])
+        self.assertEqual(([count[2] for count in buffer._pending], buffer.stats['dropped']), ([2, 4], 1))
+
+    def test_stop_of_the_latest_count_is_kept(self):
+        stop = BusStop.objects.create(name='Gate', location=Point(90.4, 23.7), address='')
+        buffer = QuietOccupancyBuffer()
+        now = time.time()
+        buffer.add([(self.bus.id, stop.id, 3, 0, now), (self.bus.id, 999999, 1, 0, now - 5)])
+        buffer.flush()
+        self.bus.refresh_from_db()
+        self.assertEqual((self.bus.current_load, self.bus.load_stop_id), (4, stop.id))
+        buffer.add([(self.bus.id, 999999, 1, 0, now + 1)])
+        buffer.flush()
+        self.bus.refresh_from_db()
+        self.assertIsNone(self.bus.load_stop_id)
+
+    def test_late_days_stay_out_of_the_profile(self):
+        profile = RouteLoadProfile(route=self.route, hour=8)
+        profile.observe(date(2026, 3, 2), 0.5)
+        profile.observe(date(2026, 3, 3), 0.9)
+        profile.observe(date(2026, 3, 2), 0.1)
+        self.assertEqual((profile.filled, profile.ring_total), (1, 50))
+        self.assertEqual((profile.open_day, profile.open_count), (date(2026, 3, 3), 1))
+        self.assertAlmostEqual(profile.mean_load_factor, 0.7)
+
+
+class HistoryTests(TransportTestCase):
+    day = date(2026, 3, 2)
+
+    def log(self, minutes, lat=23.7, lon=90.4):
+        recorded_at = datetime(2026, 3, 2, 8, tzinfo=dt_timezone.utc) + timedelta(minutes=minutes)
+        return BusPositionLog.objects.create(bus=self.bus, latitude=lat, longitude=lon, recorded_at=recorded_at)
+
+    def test_segments_round_trip(self):
+        ts_ms = np.array([0, 5000, 10000], dtype=np.int64) + 1_700_000_000_000
+        lat_e7 = np.array([237000000, 237000100, 236999900])
+        lon_e7 = np.array([904000000, 904000050, 904000100])
+        for compress in (True, False):
+            decoded = history.decode_segment(history.encode_segment(ts_ms, lat_e7, lon_e7, compress=compress))
+            for column, expected in zip(decoded, (ts_ms, lat_e7, lon_e7)):
+                np.testing.assert_array_equal(column, expected)
+
+    def test_deltas_outside_int32_are_kept_exact(self):
+        ts_ms = np.array([0, 1000], dtype=np.int64)
+        lon_e7 = np.array([-1799999999, 1799999999])
+        segment = history.encode_segment(ts_ms, [0, 0], lon_e7)
+        self.assertTrue(history.HEADER.unpack_from(segment)[1] & history.FLAG_WIDE)
+        np.testing.assert_array_equal(history.decode_segment(segment)[2], lon_e7)
+
+    def test_compaction_only_deletes_the_rows_it_packed(self):
+        self.log(0)
+        self.log(1, lat=23.8)
+        late = BusPositionLog(bus=self.bus, latitude=23.9, longitude=90.4,
+                              recorded_at=datetime(2026, 3, 2, 8, 2, tzinfo=dt_timezone.utc))
+        original = BusPositionHistory.objects.select_for_update
+
+        def insert_meanwhile():
+            # A ping for the same day arriving while the day is being compacted
+            if late.pk is None:
+                late.save()
+            return original()
+
+        with mock.patch.object(BusPositionHistory.objects, 'select_for_update', side_effect=insert_meanwhile):
+            self.assertEqual(history.compact_day(self.day), 2)
+        self.assertEqual(list(BusPositionLog.objects.values_list('id', flat=True)), [late.pk])
+
+        self.assertEqual(history.compact_day(self.day), 1)
+        start = datetime(2026, 3, 2, tzinfo=dt_timezone.utc)
+        _, lat, _ = history.positions(self.bus.id, start, start + timedelta(days=1))
+        np.testing.assert_allclose(lat, [23.7, 23.8, 23.9])
+
+    def test_failed_compaction_keeps_the_previous_file(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        with override_settings(BUS_HISTORY_ROOT=root):
+            self.log(0)
+            with self.captureOnCommitCallbacks(execute=True):
+                history.compact_day(self.day)
+            first = BusPositionHistory.objects.get().file_path
+
+            self.log(5)
+            write_segment = history._write_segment
+
+            def write_then_fail(*args):
+                write_segment(*args)
+                raise RuntimeError
+
+            with mock.patch.object(history, '_write_segment', side_effect=write_then_fail):
+                with self.assertRaises(RuntimeError):
+                    history.compact_day(self.day)
+            segment = BusPositionHistory.objects.get()
+            self.assertEqual(segment.file_path, first)
+            self.assertEqual(os.listdir(os.path.dirname(first)), [os.path.basename(first)])
+
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(history.compact_day(self.day), 1)
+            segment.refresh_from_db()
+            self.assertEqual(segment.point_count, 2)
+            self.assertEqual(os.listdir(os.path.dirname(first)), [os.path.basename(segment.file_path)])
+
+    def test_prune_removes_files_only_after_the_rows(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        with override_settings(BUS_HISTORY_ROOT=root):
+            self.log(0)
+            with self.captureOnCommitCallbacks(execute=True):
+                history.compact_day(self.day)
+            path = BusPositionHistory.objects.get().file_path
+
+            with mock.patch.object(BusPositionLog.objects, 'filter', side_effect=RuntimeError):
+                with self.assertRaises(RuntimeError):
+                    history.prune(retention_days=1, today=self.day + timedelta(days=5))
+            self.assertTrue(os.path.exists(path))
+            self.assertTrue(BusPositionHistory.objects.exists())
+
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(history.prune(retention_days=1, today=self.day + timedelta(days=5)), 1)
+            self.assertFalse(os.path.exists(path))
+
+    def test_missing_files_read_as_empty(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        with override_settings(BUS_HISTORY_ROOT=root):
+            self.log(0)
+            with self.captureOnCommitCallbacks(execute=True):
+                history.compact_day(self.day)
+            os.remove(BusPositionHistory.objects.get().file_path)
+            start = datetime(2026, 3, 2, tzinfo=dt_timezone.utc)
+            self.assertEqual(len(history.positions(self.bus.id, start, start + timedelta(days=1))[0]), 0)
+
+
+class SegmentTimeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.route = BusRoute.objects.create(name='Line', color_code='#00ff00')
+        stops = [BusStop.objects.create(name=f'S{i}', location=Point(90.4 + 0.005 * i, 23.7), address='')
+                 for i in range(3)]
+        for order, stop in enumerate(stops):
+            RouteStop.objects.create(route=self.route, stop=stop, order=order)
+        self.bus = Bus.objects.create(route=self.route, bus_number='7', capacity=40)
+
+    def test_fitted_times_are_stored_on_the_route(self):
+        start = timezone.now() - timedelta(hours=2)
+        # 0.0005 degrees of longitude every 10 s: each 0.005 degree segment takes 100 s
+        BusPositionLog.objects.bulk_create([
+            BusPositionLog(bus=self.bus, latitude=23.7, longitude=90.4 + i * 0.0005,
+                           recorded_at=start + timedelta(seconds=10 * i))
+            for i in range(21)
+        ])
+        eta.fit_segment_times(days=1)
+
+        # Buses start at the first stop rather than crossing it, so only the second segment is learned
+        self.route.refresh_from_db()
+        self.assertIsNone(self.route.segment_seconds[0])
+        self.assertAlmostEqual(self.route.segment_seconds[1], 100, delta=1)
+        # Another process starts with nothing cached and still sees them
+        cache.clear()
+        self.assertAlmostEqual(eta.route_tables()[self.route.id].segment_seconds[1], 100, delta=1)
+
+    def test_routes_without_new_samples_keep_their_times(self):
+        BusRoute.objects.filter(pk=self.route.pk).update(segment_seconds=[80.0, 90.0])
+        self.assertEqual(eta.fit_segment_times(days=1), {})
+        self.route.refresh_from_db()
+        self.assertEqual(self.route.segment_seconds, [80.0, 90.0])
+
+    def test_silent_buses_get_no_predictions(self):
+        spatial.materialize_routes()
+        Bus.objects.filter(pk=self.bus.pk).update(current_location=Point(90.4, 23.7))
+        now = timezone.now()
+        self.assertTrue(eta.predict_arrivals(now))
+        with override_settings(TRANSPORT_ETA_MAX_FIX_AGE=60):
+            self.assertEqual(eta.predict_arrivals(now + timedelta(minutes=2)), {})
+
+    def test_unknown_segments_fall_back_to_the_default_speed(self):
+        BusRoute.objects.filter(pk=self.route.pk).update(segment_seconds=[None, 90.0])
+        table = eta.build_route_tables()[self.route.id]
+        self.assertEqual(table.segment_seconds[1], 90.0)
+        self.assertAlmostEqual(table.segment_seconds[0],
+                               np.diff(table.stop_offsets)[0] / eta.DEFAULT_SPEED_MPS + eta.DWELL_SECONDS)
+
+
+class LiveStateTests(TransportTestCase):
+    def setUp(self):
+        self.state = live.LiveState()
+
+    def frame(self, since=0):
+        frame, _ = self.state.frame_since(self.route.id, since)
+        return json.loads(frame) if frame else None
+
+    def test_event_ids_from_another_process_get_a_full_frame(self):
+        self.state.apply([(self.bus.id, 23.7, 90.4, 100)])
+        self.state.apply([(self.bus.id, 23.8, 90.4, 101)])
+        first = self.frame()
+        self.assertEqual(first['id'], f"{self.state.epoch}-2")
+        self.assertEqual(self.state.parse_event_id(first['id']), 2)
+        self.assertEqual(live.LiveState().parse_event_id(first['id']), 0)
+        self.assertEqual(self.state.parse_event_id('garbage'), 0)
+
+    def test_buses_leaving_the_route_are_reported_gone(self):
+        other = BusRoute.objects.create(name='Express', color_code='#0000ff')
+        second = Bus.objects.create(route=self.route, bus_number='2', capacity=40)
+        self.state.apply([(self.bus.id, 23.7, 90.4, 100), (second.id, 23.8, 90.5, 100)])
+        since = self.state.parse_event_id(self.frame()['id'])
+
+        Bus.objects.filter(pk=self.bus.pk).update(route=other)
+        Bus.objects.filter(pk=second.pk).update(is_active=False)
+        self.state.refresh()
+        delta = self.frame(since)
+        self.assertEqual((delta['full'], delta['b'], sorted(delta['gone'])), (False, [], [self.bus.id, second.id]))
+        self.assertEqual(self.frame()['b'], [])
+
+    def test_wsgi_requests_get_one_frame_to_poll(self):
+        self.bus.current_location = Point(90.4, 23.7)
+        self.bus.save()
+        with mock.patch.object(live, 'state', self.state):
+            response = self.client.get(reverse('transportation:live_stream', args=[self.route.id]))
+            self.assertEqual(response['Content-Type'], 'application/json')
+            frame = json.loads(response.content)
+            self.assertEqual([bus[0] for bus in frame['b']], [self.bus.id])
+
+            response = self.client.get(reverse('transportation:live_stream', args=[self.route.id]), {'since': frame['id']})
+            self.assertEqual(json.loads(response.content), {'id': frame['id'], 'full': False, 'b': [], 'gone': []})
+
+
+class AlertTests(TransportTestCase):
+    def setUp(self):
+        cache.clear()
+        alerts.index.invalidate()
+        rider = User.objects.create(username='rider')
+        RouteSubscription.objects.create(user=rider, route=self.route)
+        now = timezone.now()
+        with mock.patch.object(tasks.notify_bus_alerts, 'delay'):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.alert = BusAlert.objects.create(route=self.route, title='Detour', description='Via Gate 2',
+                                                     start_date=now - timedelta(minutes=1),
+                                                     end_date=now + timedelta(hours=1))
+
+    def test_reading_alerts_never_notifies(self):
+        self.assertEqual(alerts.active_alerts(self.route.id), [self.alert])
+        self.assertFalse(Notification.objects.exists())
+
+        tasks.notify_bus_alerts()
+        tasks.notify_bus_alerts()
+        self.assertEqual(Notification.objects.count(), 1)
+
+    def test_failed_fan_out_releases_the_claim(self):
+        with mock.patch.object(fanout, 'fan_out', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                alerts.fan_out(self.alert)
+        self.alert.refresh_from_db()
+        self.assertIsNone(self.alert.notified_at)
+
+        self.assertEqual(alerts.notify_started_alerts(), 1)
+
+
+class RouteGeometryTests(TestCase):
+    def test_polyline_projection(self):
+        line = Polyline([(23.7, 90.4), (23.7, 90.41), (23.71, 90.41)])
+        self.assertAlmostEqual(line.length, haversine_m(23.7, 90.4, 23.7, 90.41) +
+                               haversine_m(23.7, 90.41, 23.71, 90.41), delta=1)
+        along, offset = line.project(23.7001, 90.405)
+        self.assertAlmostEqual(along, haversine_m(23.7, 90.4, 23.7, 90.405), delta=1)
+        self.assertAlmostEqual(offset, haversine_m(23.7, 90.405, 23.7001, 90.405), delta=0.5)
+        with self.assertRaises(ValueError):
+            Polyline([(23.7, 90.4)])
+
+    def test_routes_store_their_path_and_stop_distances(self):
+        route = BusRoute.objects.create(name='Line', color_code='#00ff00')
+        stops = [BusStop.objects.create(name=f'S{i}', location=Point(90.4 + 0.01 * i, 23.7), address='')
+                 for i in range(3)]
+        for order, stop in enumerate(stops):
+            RouteStop.objects.create(route=route, stop=stop, order=order)
+
+        self.assertEqual(spatial.materialize_routes([route.id]), 1)
+        route.refresh_from_db()
+        self.assertEqual(len(route.path.coords), 3)
+        distances = list(RouteStop.objects.filter(route=route).order_by('order').values_list('distance_m', flat=True))
+        self.assertEqual(distances[0], 0)
+        self.assertAlmostEqual(distances[2], route.length_m)
+        self.assertAlmostEqual(distances[1], route.length_m / 2, delta=1)
+
+
+def day_timetable(weekday=0):
+    """Route 1 runs stops 1 -> 2 in 300 s, route 2 runs stops 3 -> 4 in 600 s"""
+    return timetable.DayTimetable(weekday, {
+        1: ([1, 2], np.array([0, 300], dtype=np.int32), np.array([3600, 7200], dtype=np.int32)),
+        2: ([3, 4], np.array([0, 600], dtype=np.int32), np.array([4200, 8000], dtype=np.int32)),
+    })
+
+
+class TimetableTests(TestCase):
+    def test_weekday_names(self):
+        self.assertEqual([timetable.weekday_index(name) for name in ('Monday', 'sun', ' TUE ', '', None, 'x')],
+                         [0, 6, 1, None, None, None])
+
+    def test_departures_after_a_time(self):
+        day = day_timetable()
+        self.assertEqual(day.departures(2, 3900, 5), [(3900, 1, 0), (7500, 1, 1)])
+        self.assertEqual(day.departures(9, 0, 5), [])
+        self.assertEqual(day.departures(4, 5000, 5), [(8600, 2, 1)])
+        self.assertEqual(day.departures(3, 0, 1, route_id=2), [(4200, 2, 0)])
+
+    def test_next_departures_run_into_the_next_day(self):
+        after = timezone.make_aware(datetime(2026, 10, 19, 23, 0))
+        with mock.patch.object(timetable, 'get_day', side_effect=day_timetable):
+            departures = timetable.next_departures(1, after, limit=2)
+        self.assertEqual([departure['departure'] for departure in departures],
+                         [timezone.make_aware(datetime(2026, 10, 20, 1)),
+                          timezone.make_aware(datetime(2026, 10, 20, 2))])
+
+    def test_changes_elsewhere_drop_local_copies(self):
+        cache.clear()
+        timetable._local.clear()
+        timetable._state.update(generation=None, checked_at=0)
+        with mock.patch.object(timetable, 'build_day', side_effect=day_timetable) as build_day:
+            first = timetable.get_day(0)
+            self.assertIs(timetable.get_day(0), first)
+            cache.set(timetable.GENERATION_KEY, 5)  # Another process changed a schedule
+            timetable._state['checked_at'] = 0
+            self.assertIsNot(timetable.get_day(0), first)
+        self.assertEqual(build_day.call_count, 2)
+
+
+class PlannerTests(TestCase):
+    def setUp(self):
+        # Stops 2 and 3 are a short walk apart; the rest are over a kilometre from each other
+        coords = {1: (23.70, 90.40), 2: (23.71, 90.40), 3: (23.7105, 90.40), 4: (23.72, 90.40)}
+        self.network = planner.Network(day_timetable(), coords)
+
+    def test_earliest_arrival_changes_buses_on_foot(self):
+        legs = self.network.earliest_arrival(1, 4, 3000)
+        self.assertEqual([(leg['mode'], leg['from_stop'], leg['to_stop']) for leg in legs],
+                         [('bus', 1, 2), ('walk', 2, 3), ('bus', 3, 4)])
+        self.assertEqual((legs[0]['depart'], legs[-1]['arrive']), (3600, 4800))
+        self.assertLessEqual(legs[1]['arrive'], legs[2]['depart'])
+
+    def test_latest_departure_mirrors_it(self):
+        legs = self.network.latest_departure(1, 4, 5000)
+        self.assertEqual((legs[0]['depart'], legs[-1]['arrive']), (3600, 4800))
+        with self.assertRaises(planner.NoJourney):
+            self.network.latest_departure(1, 4, 4700)
+
+    def test_missed_connections_wait_for_the_next_trip(self):
+        self.assertEqual(self.network.earliest_arrival(1, 4, 3700)[-1]['arrive'], 8600)
+        with self.assertRaises(planner.NoJourney):
+            self.network.earliest_arrival(1, 4, 7300)
@@ -0,0 +1,195 @@
+# transportation/timetable.py
+"""
+Concrete departure times expanded from BusSchedule.
+
+A schedule row says "route R runs every F minutes from S to E on day D".
+For each weekday, every row becomes a list of trip start times. Each trip
+reaches its stops at the offsets from the route's ETA table (see eta), so
+stop departure times are exact integer seconds since local midnight.
+Per stop, these are kept as one sorted int32 array with parallel route
+and trip arrays. "Next N departures after T" is then a single binary
+search plus a slice.
+
+Day timetables are cached per weekday, in process memory and in the
+shared cache. A schedule or route geometry change bumps a generation
+counter in the shared cache. The generation is part of the cache key, and
+every process drops its own copies when it sees a new one.
+"""
+import time as time_module
+from datetime import datetime, timedelta
+
+import numpy as np
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import BusSchedule
+
+CACHE_KEY = 'transport:timetable:{}:{}'
+GENERATION_KEY = 'transport:timetable:generation'
+CACHE_TIMEOUT = 60 * 60 * 24
+RECHECK_SECONDS = 5
+WEEKDAYS = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+def weekday_index(day_of_week):
+    """0-6 for a BusSchedule.day_of_week value ('Monday', 'mon', ...), or None"""
+    prefix = (day_of_week or '').strip()[:3].lower()
+    for index, name in enumerate(WEEKDAYS):
+        if name[:3].lower() == prefix:
+            return index
+    return None
+
+
+def _seconds(value):
+    return value.hour * 3600 + value.minute * 60 + value.second
+
+
+class DayTimetable:
+    """Every scheduled departure on one weekday, indexed by stop"""
+
+    def __init__(self, weekday, routes):
+        # routes: {route_id: (stop_ids, int32 offsets, sorted int32 trip starts)}
+        self.weekday = weekday
+        self.routes = routes
+        self.built_at = time_module.time()
+
+        by_stop = {}
+        for route_id, (stop_ids, offsets, trip_starts) in routes.items():
+            if not len(trip_starts):
+                continue
+            trips = np.arange(len(trip_starts), dtype=np.int32)
+            # A loop's final stop is its first stop again; arriving there is not a departure
+            last = len(stop_ids) - 1 if stop_ids[0] == stop_ids[-1] else len(stop_ids)
+            for index in range(last):
+                by_stop.setdefault(stop_ids[index], []).append(
+                    (trip_starts + offsets[index], np.full(len(trips), route_id, dtype=np.int64), trips)
+                )
+
+        self.stops = {}
+        for stop_id, parts in by_stop.items():
+            times = np.concatenate([part[0] for part in parts])
+            order = np.argsort(times, kind='stable')
+            self.stops[stop_id] = (
+                times[order],
+                np.concatenate([part[1] for part in parts])[order],
+                np.concatenate([part[2] for part in parts])[order],
+            )
+
+    def departures(self, stop_id, after_seconds, limit, route_id=None):
+        """(seconds, route_id, trip) tuples at or after a time of day"""
+        if stop_id not in self.stops:
+            return []
+        times, route_ids, trips = self.stops[stop_id]
+        start = int(np.searchsorted(times, after_seconds, side='left'))
+        if route_id is not None:
+            matches = start + np.flatnonzero(route_ids[start:] == route_id)[:limit]
+            return list(zip(times[matches].tolist(), route_ids[matches].tolist(), trips[matches].tolist()))
+        end = start + limit
+        return list(zip(times[start:end].tolist(), route_ids[start:end].tolist(), trips[start:end].tolist()))
+
+
+def build_day(weekday):
+    """Expand every schedule for a weekday (0 = Monday) into a DayTimetable"""
+    from .eta import route_tables
+
+    tables = route_tables()
+    starts = {}
+    for schedule in BusSchedule.objects.filter(route_id__in=tables.keys()):
+        if weekday_index(schedule.day_of_week) != weekday or not schedule.frequency_minutes:
+            continue
+        first, last = _seconds(schedule.start_time), _seconds(schedule.end_time)
+        if last < first:
+            last += SECONDS_PER_DAY  # Service running past midnight
+        starts.setdefault(schedule.route_id, []).append(
+            np.arange(first, last + 1, schedule.frequency_minutes * 60, dtype=np.int32)
+        )
+
+    routes = {}
+    for route_id, parts in starts.items():
+        table = tables[route_id]
+        trip_starts = np.unique(np.concatenate(parts))
+        routes[route_id] = (
+            list(table.stop_ids),
+            np.rint(table.cumulative_seconds).astype(np.int32),
+            trip_starts,
+        )
+    return DayTimetable(weekday, routes)
+
+
+_local = {}
+_state = {'generation': None, 'checked_at': 0}
+
+
+def get_day(weekday):
+    """DayTimetable from process memory, then the shared cache, building as a last resort"""
+    if time_module.monotonic() - _state['checked_at'] > RECHECK_SECONDS:
+        generation = cache.get(GENERATION_KEY) or 0
+        _state['checked_at'] = time_module.monotonic()
+        if generation != _state['generation']:
+            _local.clear()
+            _state['generation'] = generation
+    day = _local.get(weekday)
+    if day is not None:
+        return day
+
+    key = CACHE_KEY.format(_state['generation'], weekday)
+    day = cache.get(key)
+    if day is None:
+        day = build_day(weekday)
+        cache.set(key, day, CACHE_TIMEOUT)
+    _local[weekday] = day
+    return day
+
+
+def invalidate_timetables(*args, **kwargs):
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 1, None)
+    _local.clear()
+    _state['checked_at'] = 0
+
+
+def next_departures(stop_id, after=None, limit=5, horizon_days=2, route_id=None):
+    """
+    The next ``limit`` scheduled departures from a stop after a moment.
+
+    Includes the previous day's service running past midnight, and runs on
+    into following days (up to ``horizon_days``) when today's service is
+    exhausted. Returns dicts with route_id, trip and an aware departure,
+    optionally for one route only.
+    """
+    after = timezone.localtime(after or timezone.now())
+    midnight = after.replace(hour=0, minute=0, second=0, microsecond=0)
+    after_seconds = _seconds(after) + (1 if after.microsecond else 0)
+
+    results = []
+    for day_offset in range(-1, horizon_days + 1):
+        day_start = midnight + timedelta(days=day_offset)
+        day = get_day(day_start.weekday())
+        # Seconds since this day's midnight that correspond to ``after``
+        threshold = max(after_seconds - day_offset * SECONDS_PER_DAY, 0)
+        results.extend(
+            {'route_id': route_id, 'trip': trip, 'departure': local_datetime(day_start, seconds)}
+            for seconds, route_id, trip in day.departures(stop_id, threshold, limit, route_id)
+        )
+        results.sort(key=lambda departure: departure['departure'])
+        # Later days can only add departures after the next midnight
+        if day_offset >= 0 and len(results) >= limit and \
+                results[limit - 1]['departure'] < local_datetime(day_start, SECONDS_PER_DAY):
+            break
+    return results[:limit]
+
+
+def local_datetime(day_start, seconds):
+    """Aware datetime ``seconds`` after a local midnight, correct across DST changes"""
+    naive = datetime.combine(day_start.date(), datetime.min.time()) + timedelta(seconds=seconds)
+    return timezone.make_aware(naive, day_start.tzinfo)
+
+
+def connect_signals():
+    from django.db.models.signals import post_delete, post_save
+
+    post_save.connect(invalidate_timetables, sender=BusSchedule, dispatch_uid='timetable.save')
+    post_delete.connect(invalidate_timetables, sender=BusSchedule, dispatch_uid='timetable.delete')
@@ -0,0 +1,44 @@
+# transportation/urls.py
+from django.urls import path
+from .views import (
+    BusRouteListView,
+    BusRouteDetailView,
+    RouteSubscriptionView,
+    BusStopDetailView,
+    StopArrivalsView,
+    StopDeparturesView,
+    NearbyStopsView,
+    TripPlanView,
+    BusTrackerView,
+    LivePositionStreamView,
+    BusAlertListView,
+    TelemetryIngestView,
+    OccupancyIngestView,
+)
+
+app_name = 'transportation'  # Namespace for the app
+
+urlpatterns = [
+    # Route URLs
+    path('routes/', BusRouteListView.as_view(), name='route_list'),
+    path('routes/<int:pk>/', BusRouteDetailView.as_view(), name='route_detail'),
+    path('routes/<int:pk>/subscription/', RouteSubscriptionView.as_view(), name='route_subscription'),
+
+    # Stop URLs
+    path('stops/nearby/', NearbyStopsView.as_view(), name='nearby_stops'),
+    path('stops/<int:pk>/', BusStopDetailView.as_view(), name='stop_detail'),
+    path('stops/<int:pk>/arrivals/', StopArrivalsView.as_view(), name='stop_arrivals'),
+    path('stops/<int:pk>/departures/', StopDeparturesView.as_view(), name='stop_departures'),
+
+    # Journey planning
+    path('plan/', TripPlanView.as_view(), name='trip_plan'),
+
+    # Tracker and alerts
+    path('tracker/', BusTrackerView.as_view(), name='bus_tracker'),
+    path('tracker/<int:pk>/stream/', LivePositionStreamView.as_view(), name='live_stream'),
+    path('alerts/', BusAlertListView.as_view(), name='alert_list'),
+
+    # Telemetry ingestion
+    path('telemetry/', TelemetryIngestView.as_view(), name='telemetry_ingest'),
+    path('telemetry/occupancy/', OccupancyIngestView.as_view(), name='occupancy_ingest'),
+]
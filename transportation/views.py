@@ -1,11 +1,19 @@
 from django.shortcuts import render
 
 # Create your views here.
+import hmac
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt
 from django.views.generic import ListView, DetailView, View
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.http import JsonResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.db.models import Q
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -13,7 +21,8 @@ from rest_framework import viewsets
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import status
 
-from .models import BusRoute, BusStop, Bus, BusAlert, BusSchedule
+from .models import BusRoute, BusStop, Bus, BusAlert, BusSchedule, RouteSubscription
+from . import alerts, eta, live, occupancy, planner, spatial, telemetry, timetable
 
 class BusRouteListView(ListView):
     model = BusRoute
@@ -36,17 +45,23 @@ class BusRouteDetailView(DetailView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         route = self.object
-        context['stops'] = BusStop.objects.filter(routes=route).order_by('routestop__order')
+        route_stops = route.routestop_set.select_related('stop').order_by('order')
+        context['stops'] = [route_stop.stop for route_stop in route_stops]
+        context['stop_distances'] = [route_stop.distance_m for route_stop in route_stops]
 
-        today = timezone.now().strftime('%A')
+        today = timezone.localtime().strftime('%A')
         context['schedules'] = BusSchedule.objects.filter(route=route, day_of_week=today)
+        context['next_departures'] = [
+            (stop, [departure['departure'] for departure in
+                    timetable.next_departures(stop.id, limit=3, route_id=route.id)])
+            for stop in context['stops']
+        ]
 
         context['active_buses'] = Bus.objects.filter(route=route, is_active=True)
-        context['alerts'] = BusAlert.objects.filter(
-            route=route,
-            active=True,
-            start_date__lte=timezone.now(),
-            end_date__gte=timezone.now()
+        context['alerts'] = alerts.active_alerts(route.id)
+        context['is_subscribed'] = (
+            self.request.user.is_authenticated and
+            route.subscriptions.filter(user=self.request.user).exists()
         )
 
         return context
@@ -62,27 +77,183 @@ class BusStopDetailView(DetailView):
         stop = self.object
         context['routes'] = BusRoute.objects.filter(stops=stop, active=True)
 
-        # Find the next arriving buses
-        context['arriving_buses'] = []
-        for route in context['routes']:
-            active_buses = Bus.objects.filter(route=route, is_active=True)
-            for bus in active_buses:
-                # In a real app, you would calculate arrival time based on GPS position
-                # This is just a placeholder
-                arrival_time = timezone.now() + timezone.timedelta(minutes=5)
-                context['arriving_buses'].append({
-                    'route': route,
-                    'bus': bus,
-                    'arrival_time': arrival_time
-                })
+        # Predicted arrivals come from one cached snapshot of all active buses
+        routes_by_id = {route.id: route for route in context['routes']}
+        context['arriving_buses'] = [
+            {
+                'route': routes_by_id[arrival['route_id']],
+                'bus': {'id': arrival['bus_id'], 'bus_number': arrival['bus_number']},
+                'arrival_time': arrival['arrival_time'],
+                'eta_minutes': arrival['eta_seconds'] // 60,
+                'crowding': arrival['crowding'],
+            }
+            for arrival in eta.arrivals_for_stop(stop.id)
+            if arrival['route_id'] in routes_by_id
+        ]
+        context['scheduled_departures'] = [
+            {'route': routes_by_id[departure['route_id']], 'departure': departure['departure']}
+            for departure in timetable.next_departures(stop.id, limit=10)
+            if departure['route_id'] in routes_by_id
+        ]
 
         return context
 
 
+class StopArrivalsView(View):
+    """Predicted arrivals at a stop as JSON"""
+
+    def get(self, request, pk):
+        stop = get_object_or_404(BusStop, pk=pk)
+        try:
+            limit = max(int(request.GET.get('limit', 10)), 1)
+        except ValueError:
+            limit = 10
+        snapshot = eta.arrivals_snapshot()
+        arrivals = snapshot['arrivals'].get(stop.id, [])[:limit]
+        return JsonResponse({
+            'stop': stop.id,
+            'generated_at': snapshot['generated_at'].isoformat(),
+            'arrivals': [
+                {
+                    'route': arrival['route_id'],
+                    'bus': arrival['bus_id'],
+                    'bus_number': arrival['bus_number'],
+                    'eta_seconds': arrival['eta_seconds'],
+                    'arrival_time': arrival['arrival_time'].isoformat(),
+                    'load_factor': arrival['load_factor'],
+                    'crowding': arrival['crowding'],
+                }
+                for arrival in arrivals
+            ],
+        })
+
+
+def parse_moment(value):
+    """Aware datetime from an ISO 8601 query parameter, or None when absent"""
+    if not value:
+        return None
+    moment = parse_datetime(value)
+    if moment is None:
+        raise ValueError(value)
+    return timezone.make_aware(moment) if timezone.is_naive(moment) else moment
+
+
+class StopDeparturesView(View):
+    """Next scheduled departures from a stop as JSON"""
+
+    def get(self, request, pk):
+        stop = get_object_or_404(BusStop, pk=pk)
+        try:
+            after = parse_moment(request.GET.get('after'))
+        except ValueError:
+            return JsonResponse({'error': 'after must be an ISO 8601 datetime'}, status=400)
+        try:
+            limit = min(max(int(request.GET.get('limit', 5)), 1), 50)
+        except ValueError:
+            limit = 5
+
+        departures = timetable.next_departures(stop.id, after=after, limit=limit)
+        return JsonResponse({
+            'stop': stop.id,
+            'departures': [
+                {'route': departure['route_id'], 'departure': departure['departure'].isoformat()}
+                for departure in departures
+            ],
+        })
+
+
+class TripPlanView(View):
+    """Plan a journey between two stops, leaving at or arriving by a time"""
+
+    def get(self, request):
+        try:
+            source = int(request.GET['from'])
+            target = int(request.GET['to'])
+            depart_at = parse_moment(request.GET.get('depart_at'))
+            arrive_by = parse_moment(request.GET.get('arrive_by'))
+        except (KeyError, ValueError):
+            return JsonResponse({'error': 'from and to must be stop ids; times must be ISO 8601'}, status=400)
+
+        try:
+            legs = planner.plan(source, target, depart_at=depart_at, arrive_by=arrive_by)
+        except planner.NoJourney:
+            return JsonResponse({'error': 'No journey found between these stops'}, status=404)
+
+        return JsonResponse({
+            'from': source,
+            'to': target,
+            'depart': legs[0]['depart'].isoformat() if legs else None,
+            'arrive': legs[-1]['arrive'].isoformat() if legs else None,
+            'legs': [
+                dict(leg, depart=leg['depart'].isoformat(), arrive=leg['arrive'].isoformat())
+                for leg in legs
+            ],
+        })
+
+
+class NearbyStopsView(View):
+    """Stops within a radius of a point as JSON"""
+    MAX_RADIUS_M = 5000
+
+    def get(self, request):
+        try:
+            lat = float(request.GET['lat'])
+            lon = float(request.GET['lon'])
+            radius = min(float(request.GET.get('radius', 500)), self.MAX_RADIUS_M)
+            limit = int(request.GET.get('limit', 20))
+        except (KeyError, ValueError):
+            return JsonResponse({'error': 'lat and lon are required numbers'}, status=400)
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180) or radius <= 0:
+            return JsonResponse({'error': 'Invalid location or radius'}, status=400)
+
+        nearby = spatial.stops_within(lat, lon, radius, limit=max(limit, 1))
+        return JsonResponse({'stops': [
+            {
+                'id': stop.id,
+                'name': stop.name,
+                'address': stop.address,
+                'latitude': stop.location.y,
+                'longitude': stop.location.x,
+                'distance_m': round(distance, 1),
+            }
+            for stop, distance in nearby
+        ]})
+
+
 class BusTrackerView(View):
     def get(self, request):
         routes = BusRoute.objects.filter(active=True)
-        return render(request, 'transportation/bus_tracker.html', {'routes': routes})
+        return render(request, 'transportation/bus_tracker.html', {
+            'routes': routes,
+            'live_interval': getattr(settings, 'TRANSPORT_LIVE_INTERVAL', 1.0),
+        })
+
+
+class LivePositionStreamView(View):
+    """
+    Server-Sent Events stream of bus positions for one route.
+
+    Served from the ASGI app; reconnecting clients resume from the
+    Last-Event-ID header and only receive what changed since. Under WSGI,
+    which would buffer the endless stream, each request gets one frame
+    and clients poll with ``?since=<id of the last frame>``.
+    """
+
+    async def get(self, request, pk):
+        if not await BusRoute.objects.filter(pk=pk, active=True).aexists():
+            return JsonResponse({'error': 'Route not found'}, status=404)
+        since = request.headers.get('Last-Event-ID') or request.GET.get('since')
+
+        if not isinstance(request, ASGIRequest):
+            frame = await sync_to_async(live.poll)(pk, since)
+            response = HttpResponse(frame, content_type='application/json')
+            response['Cache-Control'] = 'no-cache'
+            return response
+
+        response = StreamingHttpResponse(live.stream(pk, since_id=since), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # Let nginx pass events through unbuffered
+        return response
 
 
 class BusAlertListView(ListView):
@@ -91,9 +262,69 @@ class BusAlertListView(ListView):
     context_object_name = 'alerts'
 
     def get_queryset(self):
-        return BusAlert.objects.filter(
-            active=True,
-            start_date__lte=timezone.now(),
-            end_date__gte=timezone.now()
-        )
+        return alerts.all_active_alerts()
+
+
+class RouteSubscriptionView(LoginRequiredMixin, View):
+    """Subscribe to (POST) or unsubscribe from (DELETE) a route's alerts"""
+
+    def post(self, request, pk):
+        route = get_object_or_404(BusRoute, pk=pk, active=True)
+        RouteSubscription.objects.get_or_create(user=request.user, route=route)
+        return JsonResponse({'route': route.id, 'subscribed': True})
+
+    def delete(self, request, pk):
+        route = get_object_or_404(BusRoute, pk=pk)
+        RouteSubscription.objects.filter(user=request.user, route=route).delete()
+        return JsonResponse({'route': route.id, 'subscribed': False})
+
+
+def _valid_telemetry_token(request):
+    token = getattr(settings, 'TRANSPORT_TELEMETRY_TOKEN', '')
+    return bool(token) and hmac.compare_digest(request.headers.get('X-Telemetry-Token', ''), token)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class TelemetryIngestView(View):
+    """
+    Accept a batch of GPS pings from bus trackers.
+
+    Trackers authenticate with the X-Telemetry-Token header and post either
+    JSON or the compact binary format (Content-Type application/octet-stream).
+    Pings are buffered and written in bulk by the background flusher.
+    """
+
+    def post(self, request):
+        if not _valid_telemetry_token(request):
+            return JsonResponse({'error': 'Invalid telemetry token'}, status=403)
+
+        try:
+            if request.content_type == 'application/octet-stream':
+                pings = telemetry.parse_binary(request.body)
+            else:
+                pings = telemetry.parse_json(request.body)
+        except telemetry.TelemetryError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        accepted = telemetry.buffer.add(pings)
+        return JsonResponse({'received': len(pings), 'accepted': accepted}, status=202)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class OccupancyIngestView(View):
+    """Accept a batch of boarding/alighting counts from door counters"""
+
+    def post(self, request):
+        if not _valid_telemetry_token(request):
+            return JsonResponse({'error': 'Invalid telemetry token'}, status=403)
+
+        try:
+            if request.content_type == 'application/octet-stream':
+                counts = occupancy.parse_binary(request.body)
+            else:
+                counts = occupancy.parse_json(request.body)
+        except telemetry.TelemetryError as e:
+            return JsonResponse({'error': str(e)}, status=400)
 
+        accepted = occupancy.buffer.add(counts)
+        return JsonResponse({'received': len(counts), 'accepted': accepted}, status=202)